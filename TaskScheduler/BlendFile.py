@@ -1,8 +1,28 @@
 from __future__ import annotations  # to reference SDNA before declaration in circular references
 
+import array
+import hashlib
 import io
+import json
+import math
+import mmap
+import operator
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from enum import Enum
-from typing import List, BinaryIO, Optional, Literal
+from typing import Callable, Dict, Iterator, List, BinaryIO, Optional, Literal, Tuple
+
+try:
+    import zstandard
+except ImportError:  # only needed for zstd compressed files
+    zstandard = None
 
 class Endianness(Enum):
     LittleEndian = "little"
@@ -11,6 +31,84 @@ class Endianness(Enum):
     def as_literal(self) -> Literal["little", "big"]:
         return self.value
 
+    def struct_prefix(self) -> Literal["<", ">"]:
+        return "<" if (self == Endianness.LittleEndian) else ">"
+
+
+class Compression(Enum):
+    NONE = 0
+    GZIP = 1  # before Blender 3.0
+    ZSTD = 2  # Blender 3.0+
+
+    @staticmethod
+    def detect(magic: bytes) -> Compression:  # magic: at least the first 4 bytes of the file
+        if (magic[:2] == b"\x1f\x8b"):
+            return Compression.GZIP
+        if (magic[:4] == b"\x28\xb5\x2f\xfd"):
+            return Compression.ZSTD
+        return Compression.NONE
+
+
+class StreamDecompressor:
+    """Decompresses a gzip or zstd compressed blend file chunk by chunk, nothing is written to disk"""
+    MaxOutputSize = 4 * 1024 * 1024  # per returned piece, bounds memory for highly compressed input (gzip only)
+
+    Compression: Compression
+
+    def decompress(self, chunk) -> Iterator[bytes]:
+        if (self.Compression == Compression.GZIP):
+            data = self.decompressor.decompress(chunk, StreamDecompressor.MaxOutputSize)
+            while data:
+                yield data
+                data = self.decompressor.decompress(self.decompressor.unconsumed_tail, StreamDecompressor.MaxOutputSize)
+        else:
+            data = self.decompressor.decompress(chunk)
+            if data:
+                yield data
+
+    def __init__(self, compression: Compression):
+        self.Compression = compression
+        if (compression == Compression.GZIP):
+            self.decompressor = zlib.decompressobj(wbits=31)  # gzip header and trailer
+        elif (compression == Compression.ZSTD):
+            if (zstandard is None):
+                raise Exception("The zstandard package is required for zstd compressed blend files")
+            self.decompressor = zstandard.ZstdDecompressor().decompressobj(read_across_frames=True)  # Blender writes multiple frames
+        else:
+            raise ValueError(f"{compression} has no decompressor")
+
+
+class BufferReader:
+    """Minimal BinaryIO replacement on top of a memoryview
+
+    Used to run the stream based readers on memory mapped data without wrapping copies in io.BytesIO.
+    Only the requested bytes are copied by read(), skipping via seek() is free.
+    """
+    Buffer: memoryview
+    Position: int
+
+    def read(self, size: int = -1) -> bytes:
+        position = self.Position
+        data = self.Buffer[position:(position + size) if (size >= 0) else None].tobytes()
+        self.Position = position + len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if (whence == io.SEEK_CUR):
+            offset += self.Position
+        elif (whence == io.SEEK_END):
+            offset += len(self.Buffer)
+
+        self.Position = max(0, offset)
+        return self.Position
+
+    def tell(self) -> int:
+        return self.Position
+
+    def __init__(self, buffer):
+        self.Buffer = memoryview(buffer)
+        self.Position = 0
+
 
 # TODO (maybe): support decrecated output types for older blender versions
 # TODO: which of these formats aren't selectable from render settings / aren't valid output format
@@ -80,6 +178,12 @@ class Scene:
     # optional
     JP2Codec: int
     FFmpegContainer: int
+    ResolutionX: int
+    ResolutionY: int
+    ResolutionPercentage: int
+    FPS: float
+    Engine: str
+    Samples: int  # EEVEE render samples, Cycles keeps its settings in ID properties
 
 
     def __init__(self, name: str, startFrame: int, endFrame: int, frameStep: int, imtype: int):
@@ -95,6 +199,93 @@ class Scene:
 
         self.JP2Codec = -1
         self.FFmpegContainer = -1
+        self.ResolutionX = -1
+        self.ResolutionY = -1
+        self.ResolutionPercentage = -1
+        self.FPS = -1
+        self.Engine = ""
+        self.Samples = -1
+
+    @staticmethod
+    def read_path(sdna: SDNA, buffer, offset: int, path: str):  # None if the field doesn't exist in this SDNA
+        fieldPath = sdna.compile_path("Scene", path)
+        if (fieldPath is None):
+            return None
+        return fieldPath.read(buffer, offset)
+
+    @classmethod
+    def from_buffer(cls, sdna: SDNA, buffer, offset: int = 0, sceneName: Optional[str] = None):  # buffer: content of a SC block
+        name = Scene.read_path(sdna, buffer, offset, "id.name")
+        if (name is None):
+            print("Name attribute missing in ID of Scene")
+            return None
+
+        name = name[2:name.index(b'\0')].decode("utf-8")
+        if (sceneName is not None and name != sceneName):
+            return None
+
+        startFrame = Scene.read_path(sdna, buffer, offset, "r.sfra")
+        endFrame = Scene.read_path(sdna, buffer, offset, "r.efra")
+        frameStep = Scene.read_path(sdna, buffer, offset, "r.frame_step")
+        if (startFrame is None or endFrame is None or frameStep is None):
+            print("Required frame information in RenderData is missing")
+            return None
+
+        imtype = Scene.read_path(sdna, buffer, offset, "r.im_format.imtype")
+        if (imtype is None):
+            print("Required information 'imtype' missing in ImageFormat")
+            return None
+
+        try:
+            instance = cls(name, startFrame, endFrame, frameStep, imtype)
+        except ValueError as ex:
+            return None
+
+        if (instance.OutputType == ImageType.JP2):
+            jp2_codec = Scene.read_path(sdna, buffer, offset, "r.im_format.jp2_codec")
+            if (jp2_codec is None):
+                print("Required information 'jp2_codec' missing in ImageFormat")
+                return None
+            if (jp2_codec not in (0, 1)):
+                print(f"Unknown JP2_Codec: {jp2_codec}")
+                return None
+            instance.JP2Codec = jp2_codec
+
+        elif (instance.OutputType == ImageType.FFMPEG):
+            type = Scene.read_path(sdna, buffer, offset, "r.ffcodecdata.type")
+            if (type is None):
+                print("Required information 'type' missing in FFMpegCodecData")
+                return None
+            if (type not in (0, 1, 2, 3, 4, 5, 8, 9, 10, 12)):
+                print(f"Unknown FFMpeg container type {type}")
+                return None
+
+            instance.FFmpegContainer = type
+
+        instance.read_render_settings(sdna, buffer, offset)
+        return instance
+
+    def read_render_settings(self, sdna: SDNA, buffer, offset: int):  # informational only, missing fields keep their defaults
+        resolutionX = Scene.read_path(sdna, buffer, offset, "r.xsch")
+        resolutionY = Scene.read_path(sdna, buffer, offset, "r.ysch")
+        percentage = Scene.read_path(sdna, buffer, offset, "r.size")
+        fps = Scene.read_path(sdna, buffer, offset, "r.frs_sec")
+        fpsBase = Scene.read_path(sdna, buffer, offset, "r.frs_sec_base")
+        engine = Scene.read_path(sdna, buffer, offset, "r.engine")
+        samples = Scene.read_path(sdna, buffer, offset, "eevee.taa_render_samples")
+
+        if (resolutionX is not None and resolutionY is not None):
+            self.ResolutionX = resolutionX
+            self.ResolutionY = resolutionY
+        if (percentage is not None):
+            self.ResolutionPercentage = percentage
+        if (fps is not None and fpsBase):
+            self.FPS = fps / fpsBase
+        if (engine is not None):
+            self.Engine = engine.split(b'\0', 1)[0].decode("utf-8", "replace")
+        if (samples is not None):
+            self.Samples = samples
+
 
 class Header:
     Identifier: str  # Int8[7] as string
@@ -106,6 +297,8 @@ class Header:
     def read(cls, bytestream: BinaryIO):
         try:
             identifier = bytestream.read(7).decode("ascii")
+            if (identifier != "BLENDER"):
+                raise Exception(f"Invalid identifier: {identifier}")
 
             pSizeChar = bytestream.read(1).decode("ascii")
             if (pSizeChar == '_'):
@@ -131,6 +324,10 @@ class Header:
             print(ex)
             return None
 
+    @classmethod
+    def from_buffer(cls, buffer: memoryview):
+        return cls.read(BufferReader(buffer[:12]))
+
     def __init__(self, identifier: str, pointerSize: int, endianness: Endianness, version: int):
         self.Identifier = identifier
         self.PointerSize = pointerSize
@@ -141,9 +338,9 @@ class Header:
 class BHead:
     Code: str
     Length: int #Int32
-    #oldPtr: int #UInt32 or UInt64
+    OldPtr: int #UInt32 or UInt64, address of the block content when the file was written
     SDNAnr: int #Int32
-    #nr:     int #Int32
+    Nr: int #Int32, number of structures in the block
     ContentPos: int
 
     @classmethod
@@ -155,24 +352,45 @@ class BHead:
             if (length < 0):
                 raise Exception(f"Invalid BHead length: {length}")
 
-            bytestream.seek(pointersize, io.SEEK_CUR) # skip oldPtr
+            oldPtr = int.from_bytes(bytestream.read(pointersize), endian.as_literal())
 
             sdnanr = int.from_bytes(bytestream.read(4), endian.as_literal())
 
-            bytestream.seek(4, io.SEEK_CUR) # skip nr
+            nr = int.from_bytes(bytestream.read(4), endian.as_literal())
 
             pos = bytestream.tell()
-            return cls(code, length, sdnanr, pos)
+            return cls(code, length, sdnanr, pos, oldPtr, nr)
 
         except Exception as ex:
             print("An error occurred while reading a BHead from file")
             print(ex)
             return None
 
-    def __init__(self, code: str, length: int, sdnanr: int, contentPos: int):
+    @staticmethod
+    def get_struct(pointersize: int, endian: Endianness) -> struct.Struct:
+        # code, length, oldPtr, SDNAnr, nr
+        return struct.Struct(f"{endian.struct_prefix()}4si{'I' if (pointersize == 4) else 'Q'}ii")
+
+    @classmethod
+    def from_buffer(cls, buffer: memoryview, offset: int, bheadStruct: struct.Struct):
+        try:
+            code, length, oldPtr, sdnanr, nr = bheadStruct.unpack_from(buffer, offset)
+            if (length < 0):
+                raise Exception(f"Invalid BHead length: {length}")
+
+            return cls(code.decode("utf-8"), length, sdnanr, offset + bheadStruct.size, oldPtr, nr)
+
+        except Exception as ex:
+            print("An error occurred while reading a BHead from buffer")
+            print(ex)
+            return None
+
+    def __init__(self, code: str, length: int, sdnanr: int, contentPos: int, oldPtr: int = 0, nr: int = 1):
         self.Code = code
         self.Length = length
+        self.OldPtr = oldPtr
         self.SDNAnr = sdnanr
+        self.Nr = nr
         self.ContentPos = contentPos
 
 class REND:
@@ -198,20 +416,37 @@ class REND:
             print(ex)
             return None
 
+    @classmethod
+    def from_buffer(cls, buffer: memoryview, endian: Endianness):
+        return cls.read(BufferReader(buffer), len(buffer), endian)
+
     def __init__(self, startFrame: int, endFrame: int, sceneName: str):
         self.StartFrame = startFrame
         self.EndFrame = endFrame
         self.SceneName = sceneName
 
+# struct format characters of the primitive SDNA types, sizes are verified against the SDNA type sizes
+PRIMITIVE_FORMATS = {
+    "char": "b", "uchar": "B", "short": "h", "ushort": "H", "int": "i", "uint": "I",
+    "long": "i", "ulong": "I", "float": "f", "double": "d",
+    "int8_t": "b", "uint8_t": "B", "int16_t": "h", "uint16_t": "H",
+    "int32_t": "i", "uint32_t": "I", "int64_t": "q", "uint64_t": "Q",
+}
+
 class Field:
     FieldType: str
-    FieldName: str
+    FieldName: str  # as in SDNA, e.g. "*next", "name[66]", "(*func)()"
     FieldSize: int
 
-    def read_instance(self, bytestream: BinaryIO) -> dict:
+    Name: str  # plain identifier, e.g. "next", "name", "func"
+    IsPointer: bool
+    ArrayDims: Tuple[int, ...]
+    Count: int  # number of elements, 1 if not an array
+
+    def read_instance(self, buffer: memoryview, offset: int) -> dict:
         return {"FieldType": self.FieldType,
                 "FieldSize": self.FieldSize,
-                "Value": bytestream.read(self.FieldSize)}
+                "Value": buffer[offset:offset + self.FieldSize]}
 
     @classmethod
     def read(cls, bytestream: BinaryIO, endian: Endianness, sdna, pointersize: int):
@@ -222,44 +457,182 @@ class Field:
                 return None
 
             fieldName = int.from_bytes(bytestream.read(2), endian.as_literal())
-            if (fieldType >= sdna.Types.Count):
+            if (fieldName >= sdna.Names.Count):
                 print(f"Field name index out of bounds: {fieldName}")
                 return None
 
-            fieldNameStr: str = sdna.Names.Array[fieldName]
-
-
-            if ("*" in fieldNameStr):
-                fieldSize = pointersize
-            else:
-                fieldSize = sdna.TypeSizes.Array[fieldType]
-                if ("[" in fieldNameStr):
-                    size = int(fieldNameStr[fieldNameStr.index("[") + 1 : fieldNameStr.index("]")])
-                    fieldSize *= size
-
-            return cls(sdna.Types.Array[fieldType], fieldNameStr, fieldSize)
+            return cls(sdna.Types.Array[fieldType], sdna.Names.Array[fieldName], sdna.TypeSizes.Array[fieldType], pointersize)
 
         except Exception as ex:
             print("An error occurred while reading field in structure SDNA from file")
             print(ex)
             return None
 
-    def __init__(self, fieldType: str, fieldName: str, fieldSize: int):
+    def get_format(self, sdna: SDNA) -> Optional[str]:  # struct format without byte order, None for structures and unknown types
+        if self.IsPointer:
+            return f"{self.Count}{'I' if (sdna.PointerSize == 4) else 'Q'}"
+
+        if (self.FieldType == "char" and self.ArrayDims):  # strings are kept as bytes
+            return f"{self.Count}s"
+
+        fmt = PRIMITIVE_FORMATS.get(self.FieldType)
+        if (fmt is None or struct.calcsize(sdna.Endianness.struct_prefix() + fmt) * self.Count != self.FieldSize):
+            return None
+
+        return f"{self.Count}{fmt}"
+
+    def __init__(self, fieldType: str, fieldName: str, typeSize: int, pointersize: int):
         self.FieldType = fieldType
         self.FieldName = fieldName
-        self.FieldSize = fieldSize
+
+        bracket = fieldName.find("[")
+        self.Name = (fieldName if (bracket == -1) else fieldName[:bracket]).strip("*()")
+        self.IsPointer = "*" in fieldName
+        self.ArrayDims = tuple(int(dim) for dim in re.findall(r"\[(\d+)\]", fieldName))
+        self.Count = math.prod(self.ArrayDims)
+
+        self.FieldSize = (pointersize if self.IsPointer else typeSize) * self.Count
+
+
+class StructureDecoder:
+    """Decodes instances of one structure with a single unpack_from
+
+    Compiled once per SDNA, nested structures are flattened into the format of their parent.
+    The unpacked values are turned into (nested) dicts by composed itemgetters, names from the SDNA are only used as keys.
+    """
+    Type: str
+    Struct: struct.Struct
+    Offsets: Dict[str, Tuple[int, Field]]  # field name -> (offset relative to structure start, field)
+    Plan: List[Tuple[str, int, Optional[int], Optional[StructureDecoder]]]  # (name, first value, count or None, nested decoder)
+    ValueCount: int
+    Build: Optional[Callable[[tuple], dict]]  # composed on first decode
+
+    def decode(self, buffer, offset: int = 0) -> dict:
+        if (self.Build is None):
+            self.Build = self.builder(0)
+
+        return self.Build(self.Struct.unpack_from(buffer, offset))
+
+    def builder(self, base: int) -> Callable[[tuple], dict]:  # builds the dict from the unpacked values, starting at value base
+        getters = []
+        for name, first, count, decoder in self.Plan:
+            first += base
+            if (decoder is not None):
+                if (count is None):
+                    getter = decoder.builder(first)
+                else:
+                    elements = [decoder.builder(first + i * decoder.ValueCount) for i in range(count)]
+                    getter = lambda v, elements=elements: [element(v) for element in elements]
+            elif (count is None):
+                getter = operator.itemgetter(first)
+            else:
+                getter = operator.itemgetter(slice(first, first + count))
+
+            getters.append((name, getter))
+
+        return lambda v: {name: getter(v) for name, getter in getters}
+
+    @classmethod
+    def compile(cls, structure: Structure, sdna: SDNA):
+        formats = []
+        offsets = {}
+        plan = []
+        offset = 0
+        index = 0
+        for field in structure.Fields:
+            offsets[field.Name] = (offset, field)
+            offset += field.FieldSize
+            count = field.Count if field.ArrayDims else None
+
+            fmt = field.get_format(sdna)
+            if (fmt is not None):
+                isString = fmt.endswith("s")
+                formats.append(fmt)
+                plan.append((field.Name, index, None if isString else count, None))
+                index += 1 if isString else field.Count
+                continue
+
+            nested = sdna.get_decoder_from_name(field.FieldType)
+            if (nested is not None):
+                formats.append(nested.Struct.format[1:] * field.Count)
+                plan.append((field.Name, index, count, nested))
+                index += nested.ValueCount * field.Count
+                continue
+
+            formats.append(f"{field.FieldSize}x")  # unknown type, skipped
+
+        prefix = sdna.Endianness.struct_prefix()
+        return cls(structure.Type, struct.Struct(prefix + "".join(formats)), offsets, plan, index)
+
+    def __init__(self, type: str, structStruct: struct.Struct, offsets: Dict[str, Tuple[int, Field]], plan: list, valueCount: int):
+        self.Type = type
+        self.Struct = structStruct
+        self.Offsets = offsets
+        self.Plan = plan
+        self.ValueCount = valueCount
+        self.Build = None
+
+
+class FieldPath:
+    """Dotted path to a field within a structure, e.g. "r.im_format.imtype" in Scene
+
+    Resolved once per SDNA to an absolute offset and format, so reading the value is a single unpack_from.
+    """
+    StructName: str
+    Path: str
+    Offset: int  # relative to structure start
+    Field: Field
+    Struct: struct.Struct
+    IsSingle: bool  # scalar or string, otherwise a tuple is returned
+
+    def read(self, buffer, offset: int = 0):
+        values = self.Struct.unpack_from(buffer, offset + self.Offset)
+        return values[0] if self.IsSingle else values
+
+    @classmethod
+    def compile(cls, sdna: SDNA, structName: str, path: str):  # None if the path doesn't lead to a non-structure field
+        decoder = sdna.get_decoder_from_name(structName)
+        offset = 0
+        names = path.split(".")
+        for i, name in enumerate(names):
+            if (decoder is None or name not in decoder.Offsets):
+                return None
+
+            fieldOffset, field = decoder.Offsets[name]
+            offset += fieldOffset
+            if (i < len(names) - 1):
+                if (field.IsPointer or field.ArrayDims):  # only structures embedded by value can be followed
+                    return None
+                decoder = sdna.get_decoder_from_name(field.FieldType)
+
+        fmt = field.get_format(sdna)
+        if (fmt is None):
+            return None
+
+        isSingle = fmt.endswith("s") or not field.ArrayDims
+        return cls(structName, path, offset, field, struct.Struct(sdna.Endianness.struct_prefix() + fmt), isSingle)
+
+    def __init__(self, structName: str, path: str, offset: int, field: Field, structStruct: struct.Struct, isSingle: bool):
+        self.StructName = structName
+        self.Path = path
+        self.Offset = offset
+        self.Field = field
+        self.Struct = structStruct
+        self.IsSingle = isSingle
+
 
 class Structure:
     Type: str
     FieldCount: int
     Fields: list[Field]
 
-    def read_instance(self, bytestream: BinaryIO) -> dict:
-        struct = {}
+    def read_instance(self, buffer: memoryview, offset: int = 0) -> dict:
+        instance = {}
         for field in self.Fields:
-            struct[field.FieldName] = field.read_instance(bytestream)
+            instance[field.FieldName] = field.read_instance(buffer, offset)
+            offset += field.FieldSize
 
-        return struct
+        return instance
 
     @classmethod
     def read(cls, bytestream: BinaryIO, endian: Endianness, sdna, pointersize: int):
@@ -313,6 +686,9 @@ class StrSDNAList(SDNAList):
     def read(cls, bytestream: BinaryIO, endian: Endianness):
         base = super().read(bytestream)
         base.Count = int.from_bytes(bytestream.read(4), endian.as_literal())
+        if isinstance(bytestream, BufferReader):
+            return cls.read_bulk(base, bytestream)
+
         for i in range(base.Count):
             try:
                 bts: bytes = bytes()
@@ -328,6 +704,23 @@ class StrSDNAList(SDNAList):
 
         return base
 
+    @staticmethod
+    def read_bulk(base: StrSDNAList, bytestream: BufferReader):  # splits the whole table at once instead of reading byte by byte
+        try:
+            data = bytestream.Buffer[bytestream.Position:].tobytes()
+            strings = data.split(b"\x00", base.Count)  # last element is the rest of the SDNA
+            if (len(strings) <= base.Count):
+                raise Exception(f"Expected {base.Count} strings, found {len(strings) - 1}")
+
+            base.Array = [string.decode("utf-8") for string in strings[:base.Count]]
+            bytestream.seek(len(data) - len(strings[-1]), io.SEEK_CUR)
+            return base
+
+        except Exception as ex:
+            print(f"Failed to read array of SDNAList {base.Identifier}")
+            print(ex)
+            return None
+
 class UShortSDNAList(SDNAList):
     Array: List[int]
 
@@ -335,6 +728,19 @@ class UShortSDNAList(SDNAList):
     def read(cls, bytestream: BinaryIO, endian: Endianness, count: int):
         base = super().read(bytestream)
         base.Count = count
+        if isinstance(bytestream, BufferReader):
+            try:
+                values = array.array("H", bytestream.read(2 * count))
+                if (len(values) != count):
+                    raise Exception(f"Expected {count} values, found {len(values)}")
+                if (endian.as_literal() != sys.byteorder):
+                    values.byteswap()
+                base.Array = values.tolist()
+                return base
+            except Exception as ex:
+                print(f"Failed to read UShortSDNAList {base.Identifier}")
+                return None
+
         for i in range(base.Count):
             try:
                 ushort = int.from_bytes(bytestream.read(2), endian.as_literal())
@@ -346,20 +752,27 @@ class UShortSDNAList(SDNAList):
         return base
 
 class StructureSDNAList(SDNAList):
-    Array: List[Structure]
+    Array: List[Optional[Structure]]  # None until materialized by SDNA.get_struct
+    Offsets: List[int]  # position of each structure definition within the SDNA
+    TypeIndices: List[int]
 
     @classmethod
-    def read(cls, bytestream: BinaryIO, endian: Endianness, sdna: SDNA, pointersize: int):
+    def read(cls, bytestream: BinaryIO, endian: Endianness):  # only records where the structures are defined
         base = super().read(bytestream)
         base.Count = int.from_bytes(bytestream.read(4), endian.as_literal())
+        base.Offsets = []
+        base.TypeIndices = []
         for i in range(base.Count):
             try:
-                struct = Structure.read(bytestream, endian, sdna, pointersize)
-                base.Array.append(struct)
+                base.Offsets.append(bytestream.tell())
+                base.TypeIndices.append(int.from_bytes(bytestream.read(2), endian.as_literal()))
+                fieldCount = int.from_bytes(bytestream.read(2), endian.as_literal())
+                bytestream.seek(fieldCount * 4, io.SEEK_CUR)  # fields consist of type and name index
             except Exception as ex:
                 print(f"Failed to read StructureSDNAList {base.Identifier}")
                 return None
-            
+
+        base.Array = [None] * base.Count
         return base
 
 class SDNA:
@@ -368,21 +781,62 @@ class SDNA:
     Types: StrSDNAList
     TypeSizes: UShortSDNAList
     Structures: StructureSDNAList
-
-    def read_struct(self, bytestream: BinaryIO, sdnaNr: int, endian: Endianness) -> dict:
-        return self.Structures.Array[sdnaNr].read_instance(bytestream)
-
-    def read_struct_from_name(self, bytestream: BinaryIO, structName: str, endian: Endianness) -> Optional[dict]:
-        struct = next(filter(lambda x: x.Type == structName, self.Structures.Array), None)
-        if struct is None:
+    Endianness: Endianness
+    PointerSize: int
+    Decoders: Dict[int, StructureDecoder]  # compiled on first use, index as in Structures
+    Paths: Dict[Tuple[str, str], Optional[FieldPath]]  # compiled on first use
+    StructIndex: Dict[str, int]  # type name -> index in Structures
+    Data: bytes  # content of the DNA1 block, structures are read from it on first access
+
+    def get_struct(self, sdnaNr: int) -> Structure:
+        structure = self.Structures.Array[sdnaNr]
+        if (structure is None):
+            bytestream = BufferReader(self.Data)
+            bytestream.seek(self.Structures.Offsets[sdnaNr])
+            structure = Structure.read(bytestream, self.Endianness, self, self.PointerSize)
+            self.Structures.Array[sdnaNr] = structure
+
+        return structure
+
+    def get_struct_from_name(self, structName: str) -> Optional[Structure]:
+        sdnaNr = self.StructIndex.get(structName)
+        return None if (sdnaNr is None) else self.get_struct(sdnaNr)
+
+    def get_decoder(self, sdnaNr: int) -> StructureDecoder:
+        decoder = self.Decoders.get(sdnaNr)
+        if (decoder is None):
+            decoder = StructureDecoder.compile(self.get_struct(sdnaNr), self)
+            self.Decoders[sdnaNr] = decoder
+
+        return decoder
+
+    def get_decoder_from_name(self, structName: str) -> Optional[StructureDecoder]:
+        sdnaNr = self.StructIndex.get(structName)
+        return None if (sdnaNr is None) else self.get_decoder(sdnaNr)
+
+    def compile_path(self, structName: str, path: str) -> Optional[FieldPath]:
+        key = (structName, path)
+        if (key not in self.Paths):
+            self.Paths[key] = FieldPath.compile(self, structName, path)  # None is cached as well
+
+        return self.Paths[key]
+
+    def decode_struct_from_bhead(self, buffer: memoryview, bhead: BHead) -> dict:
+        return self.get_decoder(bhead.SDNAnr).decode(buffer, bhead.ContentPos)
+
+    def read_struct(self, buffer: memoryview, sdnaNr: int, endian: Endianness) -> dict:
+        return self.get_struct(sdnaNr).read_instance(buffer)
+
+    def read_struct_from_name(self, buffer: memoryview, structName: str, endian: Endianness) -> Optional[dict]:
+        structure = self.get_struct_from_name(structName)
+        if structure is None:
             print(f"Failed to find struct {structName}")
             return None
 
-        return struct.read_instance(bytestream)
+        return structure.read_instance(buffer)
 
-    def read_struct_from_bhead(self, bytestream: BinaryIO, bhead: BHead, endian: Endianness) -> dict:
-        bytestream.seek(bhead.ContentPos)
-        return self.read_struct(bytestream, bhead.SDNAnr, endian)
+    def read_struct_from_bhead(self, buffer: memoryview, bhead: BHead, endian: Endianness) -> dict:
+        return self.read_struct(buffer[bhead.ContentPos:bhead.ContentPos + bhead.Length], bhead.SDNAnr, endian)
 
     def __align_to_4__(bytestream: BinaryIO):
         offset = bytestream.tell() % 4
@@ -390,8 +844,10 @@ class SDNA:
             bytestream.seek(4 - offset, io.SEEK_CUR)
 
     @classmethod
-    def read(cls, bytestream: BinaryIO, endian: Endianness, pointersize: int):
+    def read(cls, buffer, endian: Endianness, pointersize: int):  # buffer: content of DNA1 block
         try:
+            data = bytes(buffer)  # small compared to the file, kept for lazy reading of structures
+            bytestream = BufferReader(data)
             identifier = bytestream.read(4).decode("utf-8")
             if (identifier != "SDNA"):
                 print(f"Invalid SDNA identifier: {identifier}")
@@ -414,178 +870,675 @@ class SDNA:
             if (typeSizes is None):
                 return None
 
-            sdna = cls(identifier, names, types, typeSizes)
-
             SDNA.__align_to_4__(bytestream)
-            structures = StructureSDNAList.read(bytestream, endian, sdna, pointersize)
+            structures = StructureSDNAList.read(bytestream, endian)
             if (structures is None):
                 return None
 
-            sdna.Structures = structures
-
-            return sdna
+            return cls(identifier, names, types, typeSizes, structures, endian, pointersize, data)
 
         except Exception as ex:
             print("Error while reading a SDNA from file")
             print(ex)
             return None
 
-    def __init__(self, identifier: str, names: StrSDNAList, types: StrSDNAList, typeSizes: UShortSDNAList):
+    def __init__(self, identifier: str, names: StrSDNAList, types: StrSDNAList, typeSizes: UShortSDNAList,
+                 structures: StructureSDNAList, endian: Endianness, pointersize: int, data: bytes):
         self.Identifier = identifier
         self.Names = names
         self.Types = types
         self.TypeSizes = typeSizes
+        self.Structures = structures
+        self.Endianness = endian
+        self.PointerSize = pointersize
+        self.Data = data
+        self.Decoders = {}
+        self.Paths = {}
+        self.StructIndex = {types.Array[typeIndex]: sdnaNr for sdnaNr, typeIndex in enumerate(structures.TypeIndices)}
+
+    def to_tables(self) -> dict:  # the parsed lists, plain JSON values
+        return {"Names": self.Names.Array, "Types": self.Types.Array, "TypeSizes": self.TypeSizes.Array,
+                "StructureOffsets": self.Structures.Offsets, "TypeIndices": self.Structures.TypeIndices}
+
+    @classmethod
+    def from_tables(cls, tables: dict, buffer, endian: Endianness, pointersize: int):  # counterpart of to_tables, buffer: content of DNA1 block
+        try:
+            names, types, typeSizes = tables["Names"], tables["Types"], tables["TypeSizes"]
+            offsets, typeIndices = tables["StructureOffsets"], tables["TypeIndices"]
+            data = bytes(buffer)
+            if not (all(isinstance(name, str) for name in names) and all(isinstance(type, str) for type in types)
+                    and len(typeSizes) == len(types) and all(isinstance(size, int) for size in typeSizes)
+                    and len(offsets) == len(typeIndices) and all(isinstance(offset, int) and 0 <= offset < len(data) for offset in offsets)
+                    and all(isinstance(index, int) and 0 <= index < len(types) for index in typeIndices)):
+                print("Inconsistent SDNA tables")
+                return None
+
+            lists = []
+            for listType, identifier, values in ((StrSDNAList, "NAME", names), (StrSDNAList, "TYPE", types), (UShortSDNAList, "TLEN", typeSizes)):
+                sdnaList = listType(identifier)
+                sdnaList.Array = values
+                sdnaList.Count = len(values)
+                lists.append(sdnaList)
+
+            structures = StructureSDNAList("STRC")
+            structures.Count = len(offsets)
+            structures.Offsets = offsets
+            structures.TypeIndices = typeIndices
+            structures.Array = [None] * structures.Count
+
+            return cls("SDNA", *lists, structures, endian, pointersize, data)
+
+        except Exception as ex:
+            print("Error while restoring SDNA tables")
+            print(ex)
+            return None
+
+
+class SDNACache:
+    """Parsed SDNAs by fingerprint of their DNA1 block
+
+    Files saved by the same Blender build carry identical DNA1 blocks, so the SDNA is only decoded once per build.
+    Entries are kept in an in-process LRU and, if Directory is set (setting SDNA_CACHE_DIR), written there as JSON to
+    survive restarts and to be shared between processes. Only the parsed tables are stored, never code or pickles.
+    """
+    MaxEntries: int = 16
+    Directory: Optional[str] = None  # None disables the on-disk store
+
+    entries: OrderedDict[str, Tuple[SDNA, float]] = OrderedDict()  # fingerprint -> (SDNA, seconds it took to decode)
+    lock: threading.Lock = threading.Lock()
+
+    Hits: int = 0
+    DiskHits: int = 0
+    Misses: int = 0
+    SecondsSaved: float = 0.0
+
+    @staticmethod
+    def fingerprint(buffer, endian: Endianness, pointersize: int) -> str:
+        return f"{hashlib.blake2b(buffer, digest_size=16).hexdigest()}-{endian.value}-{pointersize}"
+
+    @staticmethod
+    def read(buffer, endian: Endianness, pointersize: int) -> Optional[SDNA]:  # drop-in replacement for SDNA.read
+        key = SDNACache.fingerprint(buffer, endian, pointersize)
+        with SDNACache.lock:
+            entry = SDNACache.entries.get(key)
+            if (entry is not None):
+                SDNACache.entries.move_to_end(key)
+                SDNACache.Hits += 1
+                SDNACache.SecondsSaved += entry[1]
+                return entry[0]
+
+        entry = SDNACache.load(key, buffer, endian, pointersize)
+        if (entry is not None):
+            SDNACache.DiskHits += 1
+            SDNACache.SecondsSaved += entry[1]
+        else:
+            start = time.perf_counter()
+            sdna = SDNA.read(buffer, endian, pointersize)
+            if (sdna is None):
+                return None
+
+            entry = (sdna, time.perf_counter() - start)
+            SDNACache.Misses += 1
+            SDNACache.store(key, entry)
+
+        with SDNACache.lock:
+            SDNACache.entries[key] = entry
+            SDNACache.entries.move_to_end(key)
+            while (len(SDNACache.entries) > SDNACache.MaxEntries):
+                SDNACache.entries.popitem(last=False)
+
+        return entry[0]
+
+    @staticmethod
+    def load(key: str, buffer, endian: Endianness, pointersize: int) -> Optional[Tuple[SDNA, float]]:
+        if (SDNACache.Directory is None):
+            return None
+
+        path = os.path.join(SDNACache.Directory, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as file:
+                stored = json.load(file)
+            if (stored.get("Key") != key):  # file renamed or written for another DNA1 block
+                print(f"Cached SDNA {key} has key {stored.get('Key')}")
+                return None
+
+            sdna = SDNA.from_tables(stored, buffer, endian, pointersize)
+            return None if (sdna is None) else (sdna, float(stored["Seconds"]))
+        except Exception as ex:
+            print(f"Failed to load cached SDNA {key}")
+            print(ex)
+            return None
+
+    @staticmethod
+    def store(key: str, entry: Tuple[SDNA, float]):
+        if (SDNACache.Directory is None):
+            return
+
+        try:
+            os.makedirs(SDNACache.Directory, exist_ok=True)
+            # write to temporary file first, other processes might read the same entry at the same time
+            fd, tempPath = tempfile.mkstemp(dir=SDNACache.Directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as file:
+                json.dump({"Key": key, "Seconds": entry[1], **entry[0].to_tables()}, file)
+            os.replace(tempPath, os.path.join(SDNACache.Directory, f"{key}.json"))
+        except Exception as ex:
+            print(f"Failed to store SDNA {key} in cache")
+            print(ex)
+
+    @staticmethod
+    def statistics() -> Dict[str, float]:
+        lookups = SDNACache.Hits + SDNACache.DiskHits + SDNACache.Misses
+        return {
+            "Hits": SDNACache.Hits,
+            "DiskHits": SDNACache.DiskHits,
+            "Misses": SDNACache.Misses,
+            "HitRate": 0.0 if (lookups == 0) else (SDNACache.Hits + SDNACache.DiskHits) / lookups,
+            "SecondsSaved": SDNACache.SecondsSaved,
+        }
+
+    @staticmethod
+    def clear(onDisk: bool = False):
+        with SDNACache.lock:
+            SDNACache.entries.clear()
+
+        if (onDisk and SDNACache.Directory is not None and os.path.isdir(SDNACache.Directory)):
+            for filename in os.listdir(SDNACache.Directory):
+                if filename.endswith(".json"):
+                    os.remove(os.path.join(SDNACache.Directory, filename))
+
+
+class BlockTable:
+    """Metadata of the blocks of a blend file, stored column-wise in arrays instead of one BHead object per block"""
+    Endianness: Endianness
+    Struct: struct.Struct  # BHead layout of the file, code read as unsigned int
+    Codes: array.array  # 4 byte block codes as unsigned int in file byte order
+    Lengths: array.array
+    SDNAIndices: array.array
+    Offsets: array.array  # file offset of the block content
+    OldPtrs: array.array
+    Counts: array.array  # nr, number of structures in the block
+    SceneIndices: List[int]  # indices of SC blocks, recorded while scanning
+    Complete: bool  # False if scan stopped before ENDB
+    NextOffset: int  # file offset of the first BHead not scanned yet
+    PointerIndex: Optional[Dict[int, int]]  # oldPtr -> block index, built on first lookup
+
+    def code_value(self, code: str) -> int:
+        return int.from_bytes(code.encode("utf-8").ljust(4, b"\x00"), self.Endianness.as_literal())
+
+    def code(self, index: int) -> str:
+        return self.Codes[index].to_bytes(4, self.Endianness.as_literal()).decode("utf-8")
+
+    def bhead(self, index: int) -> BHead:
+        return BHead(self.code(index), self.Lengths[index], self.SDNAIndices[index], self.Offsets[index], self.OldPtrs[index], self.Counts[index])
+
+    def content(self, buffer: memoryview, index: int) -> memoryview:
+        return buffer[self.Offsets[index]:self.Offsets[index] + self.Lengths[index]]
+
+    def find(self, code: str) -> Optional[int]:  # index of first block with code
+        try:
+            return self.Codes.index(self.code_value(code))
+        except ValueError:
+            return None
+
+    def find_pointer(self, oldPtr: int) -> Optional[int]:  # index of the block whose content was stored at oldPtr
+        if (oldPtr == 0):
+            return None
+
+        if (self.PointerIndex is None):
+            self.PointerIndex = dict(zip(self.OldPtrs, range(len(self.OldPtrs))))
+            self.PointerIndex.pop(0, None)  # blocks without address, e.g. REND, DNA1 and ENDB
+
+        return self.PointerIndex.get(oldPtr)
+
+    def append(self, code: int, length: int, sdnanr: int, offset: int, oldPtr: int = 0, nr: int = 1):
+        self.Codes.append(code)
+        self.Lengths.append(length)
+        self.SDNAIndices.append(sdnanr)
+        self.Offsets.append(offset)
+        self.OldPtrs.append(oldPtr)
+        self.Counts.append(nr)
+        self.PointerIndex = None
+
+    def __len__(self) -> int:
+        return len(self.Codes)
+
+    @classmethod
+    def scan(cls, buffer: memoryview, header: Header, stopEarly: bool = True):
+        """Walks the BHead chain of a complete file
+
+        With stopEarly the scan ends as soon as REND, DNA1 and all SC blocks are known. Blender writes the scenes
+        as one contiguous group of ID blocks, so all of them are known once another ID block or DNA1 follows them.
+        """
+        table = cls(header.PointerSize, header.Endianness)
+        if not table.scan_blocks(buffer, stopEarly):
+            return None
+        return table
+
+    def complete(self, buffer: memoryview) -> bool:  # scans the blocks skipped by an early stop
+        return self.Complete or self.scan_blocks(buffer, False)
+
+    def scan_blocks(self, buffer: memoryview, stopEarly: bool) -> bool:
+        offset = self.NextOffset
+        try:
+            unpack = self.Struct.unpack_from
+            headSize = self.Struct.size
+            rendCode, dna1Code, endbCode, sceneCode = (self.code_value(code) for code in ("REND", "DNA1", "ENDB", "SC"))
+            idMask = int.from_bytes(b"\x00\x00\xff\xff", self.Endianness.as_literal())  # ID codes have 2 chars only
+
+            # bound once, the loop runs for every block of the file
+            appendCode, appendLength, appendSDNAIndex = self.Codes.append, self.Lengths.append, self.SDNAIndices.append
+            appendOffset, appendOldPtr, appendCount = self.Offsets.append, self.OldPtrs.append, self.Counts.append
+            self.PointerIndex = None
+
+            rendFound = dna1Found = scenesComplete = False
+            while True:
+                code, length, oldPtr, sdnanr, nr = unpack(buffer, offset)
+                if (length < 0):
+                    raise Exception(f"Invalid BHead length: {length}")
+                if (offset + headSize + length > len(buffer)):  # truncated file, the content would be cut off
+                    raise Exception(f"Block at offset {offset} exceeds the end of the file")
+
+                offset += headSize
+                appendCode(code)
+                appendLength(length)
+                appendSDNAIndex(sdnanr)
+                appendOffset(offset)
+                appendOldPtr(oldPtr)
+                appendCount(nr)
+                offset += length
+
+                if (code == endbCode):
+                    self.Complete = True
+                    break
+
+                if (code == rendCode):
+                    rendFound = True
+                elif (code == dna1Code):
+                    dna1Found = True
+                    scenesComplete = scenesComplete or bool(self.SceneIndices)
+                elif (code & idMask == 0):
+                    if (code == sceneCode):
+                        self.SceneIndices.append(len(self) - 1)
+                    elif self.SceneIndices:
+                        scenesComplete = True
+
+                if (stopEarly and rendFound and dna1Found and scenesComplete):
+                    break
+
+            return True
+
+        except Exception as ex:
+            print("An error occurred while scanning the blocks of a blend file")
+            print(ex)
+            return False
+
+        finally:
+            self.NextOffset = offset  # blocks before offset are in the table, even if the scan failed
+
+    def __init__(self, pointersize: int, endian: Endianness):
+        self.Endianness = endian
+        self.Struct = struct.Struct(f"{endian.struct_prefix()}Ii{'I' if (pointersize == 4) else 'Q'}ii")
+        self.Codes = array.array("I")
+        self.Lengths = array.array("i")
+        self.SDNAIndices = array.array("i")
+        self.Offsets = array.array("Q")
+        self.OldPtrs = array.array("Q")
+        self.Counts = array.array("i")
+        self.SceneIndices = []
+        self.Complete = False
+        self.NextOffset = 12  # behind the file header
+        self.PointerIndex = None
+
+
+class BlockStatistics:
+    """Number and bytes of blocks per code
+
+    DATA blocks are counted towards the block they follow, as Blender writes the data of an ID (e.g. the vertices of a
+    mesh) and the content of a packed file (PF) as DATA blocks right behind it.
+    """
+    Counts: Dict[str, int]
+    Sizes: Dict[str, int]
+
+    def add(self, code: str, length: int):  # blocks must be added in file order
+        if (code == "DATA" and self.current is not None):
+            self.Sizes[self.current] += length
+            return
+
+        code = code.rstrip("\0")
+        self.current = code
+        self.Counts[code] = self.Counts.get(code, 0) + 1
+        self.Sizes[code] = self.Sizes.get(code, 0) + length
+
+    def count(self, code: str) -> int:
+        return self.Counts.get(code, 0)
+
+    def size(self, code: str) -> int:
+        return self.Sizes.get(code, 0)
+
+    @classmethod
+    def from_table(cls, blocks: BlockTable):
+        instance = cls()
+        codes = {}  # code value -> code, only a few distinct codes per file
+        for value, length in zip(blocks.Codes, blocks.Lengths):
+            code = codes.get(value)
+            if (code is None):
+                code = codes[value] = value.to_bytes(4, blocks.Endianness.as_literal()).decode("utf-8", "replace")
+            instance.add(code, length)
+
+        return instance
+
+    def __init__(self):
+        self.Counts = {}
+        self.Sizes = {}
+        self.current = None
 
 
 class BlendFile:
     Header: Header
     REND: REND  # use until scenes are read properly
-    BHeads: List[BHead]
-    #Scenes: List[Scene]
+    Blocks: Optional[BlockTable]
+    Scenes: List[Scene]  # all scenes with supported output, in file order
     CurrentScene: Scene
     SDNA: SDNA
+    Statistics: Optional[BlockStatistics]  # see get_block_statistics
 
     @staticmethod
     def get_current_scene(filepath: str) -> Optional[Scene]:
         instance = BlendFile.read(filepath)
         return None if (instance is None) else instance.CurrentScene
 
+    def dereference(self, buffer: memoryview, oldPtr: int) -> Optional[BHead]:  # buffer: the file this instance was read from
+        if (self.Blocks is None or oldPtr == 0):
+            return None
+
+        index = self.Blocks.find_pointer(oldPtr)
+        if (index is None and not self.Blocks.Complete):  # the block may be behind the point the scan stopped at
+            if not self.Blocks.complete(buffer):
+                return None
+            index = self.Blocks.find_pointer(oldPtr)
+
+        return None if (index is None) else self.Blocks.bhead(index)
+
     @classmethod
     def read(cls, filepath: str):
         try:
             with open(filepath, "rb") as filehandle:
-                header = Header.read(filehandle)
-                if (header is None):
-                    return None
+                if (Compression.detect(filehandle.read(4)) != Compression.NONE):  # can't be mapped, decompressed while parsing
+                    filehandle.seek(0)
+                    return cls.read_stream(filehandle)
 
-                bheads = []
-                while True:
-                    bhead = BHead.read(filehandle, header.PointerSize, header.Endianness)
-                    if (bhead is None):
-                        return None
-
-                    bheads.append(bhead)
-                    if (bhead.Code == "ENDB"):  # substitution for do-while-loop which doesn't exist in python
-                        break
-
-                    if (bhead.Code == "REND"):
-                        rend = REND.read(filehandle, bhead.Length, header.Endianness)
-                        if (rend is None):
-                            return None
-
-                    elif (bhead.Code == "DNA1"):
-                        sdna = SDNA.read(filehandle, header.Endianness, header.PointerSize)
-                        if (sdna is None):
-                            return None
-
-                    else:
-                        filehandle.seek(bhead.Length, io.SEEK_CUR)
-
-                sceneBHeads = list(filter(lambda bhead: bhead.Code.startswith("SC"), bheads))
-                #scenes: list[Scene] = []
-                currentScene = None
-                for bhead in sceneBHeads:
-                    scene = sdna.read_struct_from_bhead(filehandle, bhead, header.Endianness)
-                    if (scene is None):
-                        print("Failed to read Scene")
-                        continue
-                    if not ("id" in scene):
-                        print("ID attribute missing in Scene")
-                        continue
-
-                    id = sdna.read_struct_from_name(io.BytesIO(scene["id"]["Value"]), scene["id"]["FieldType"], header.Endianness)
-                    if (id is None):
-                        print("Failed to read ID")
-                        continue
-                    if ("name[66]" not in id):
-                        print("Name attribute missing in ID")
-                        continue
-
-                    name: str = id["name[66]"]["Value"].decode("utf-8")
-                    name = name[2:name.index('\0')]
-                    if (name != rend.SceneName):
-                        continue
-
-                    if not ("r" in scene):
-                        print("RenderData attribute \"r\" missing in Scene")
-                        continue
-
-                    renderData = sdna.read_struct_from_name(io.BytesIO(scene["r"]["Value"]), scene["r"]["FieldType"], header.Endianness)
-                    # FieldType should be "RenderData"
-                    if (renderData is None):
-                        print("Failed to read RenderData")
-                    if not {"sfra", "efra", "frame_step"}.issubset(renderData.keys()):
-                        print("Required frame information in RenderData is missing")
-                        continue
-                    if ("im_format" not in renderData):
-                        print("ImageFormatData attribute \"im_fomrat\" missing in RenderData")
-                        continue
-
-                    sfra = int.from_bytes(renderData["sfra"]["Value"], header.Endianness.as_literal())
-                    efra = int.from_bytes(renderData["efra"]["Value"], header.Endianness.as_literal())
-                    frame_step = int.from_bytes(renderData["frame_step"]["Value"], header.Endianness.as_literal())
-
-                    im_format = sdna.read_struct_from_name(io.BytesIO(renderData["im_format"]["Value"]), renderData["im_format"]["FieldType"], header.Endianness)
-                    if (im_format is None):
-                        print("Failed to read ImageFormat")
-                        continue
-
-                    if ("imtype" not in im_format):
-                        print("Required information 'imtype' missing in ImageFormat")
-                        continue
-
-                    imtype = int.from_bytes(im_format["imtype"]["Value"], header.Endianness.as_literal())
+                with mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    buffer = memoryview(mapped)
                     try:
-                        currentScene = Scene(name, sfra, efra, frame_step, imtype)
-                    except ValueError as ex:
-                        continue
-
-                    if (currentScene.OutputType == ImageType.JP2):
-                        if ("jp2_codec" not in im_format):
-                            print("Required information 'jp2_codec' missing in ImageFormat")
-                            continue
-                        jp2_codec = int.from_bytes(im_format["jp2_codec"]["Value"], header.Endianness.as_literal())
-                        if (jp2_codec not in (0, 1)):
-                            print(f"Unknown JP2_Codec: {jp2_codec}")
-                            continue
-                        currentScene.JP2Codec = jp2_codec
-
-                    elif (currentScene.OutputType == ImageType.FFMPEG):
-                        if ("ffcodecdata" not in renderData):
-                            print("Required information 'ffcodecdata' missing in RenderData")
-                            continue
-                        ffmpegCD = sdna.read_struct_from_name(io.BytesIO(renderData["ffcodecdata"]["Value"]), renderData["ffcodecdata"]["FieldType"], header.Endianness)
-                        if (ffmpegCD is None):
-                            print("Failed to read FFMpegCodecData")
-                            continue
-
-                        if ("type" not in ffmpegCD):
-                            print("Required information 'type' missing in FFMpegCodecData")
-                            continue
-
-                        type = int.from_bytes(ffmpegCD["type"]["Value"], header.Endianness.as_literal())
-                        if (type not in (0, 1, 2, 3, 4, 5, 8, 9, 10, 12)):
-                            print(f"Unknown FFMpeg container type {type}")
-                            continue
-
-                        currentScene.FFmpegContainer = type
-
-
-                    #scenes.append(currentScene)
-                if (currentScene is None):
-                    print("No scene with the name specified in REND was found")
-                    return None
-
-            return cls(header, rend, currentScene, sdna)
+                        return cls.read_buffer(buffer)
+                    finally:
+                        buffer.release()  # all slices must be gone as well, otherwise the mmap can't be closed
 
         except Exception as ex:
             print(f"An error occured while reading {filepath}")
             print(ex)
             return None
 
-    def __init__(self, header: Header, rend: REND, current_scene: Scene, sdna: SDNA):
+    @staticmethod
+    def read_stream(bytestream: BinaryIO, chunkSize: int = 1024 * 1024) -> Optional[BlendFile]:  # the result has no block table
+        parser = BlendFileParser()
+        while not parser.Done:
+            chunk = bytestream.read(chunkSize)
+            if not chunk:
+                break
+            if not parser.feed(chunk):
+                break
+
+        return parser.close()
+
+    @classmethod
+    def read_buffer(cls, buffer: memoryview):  # blocks are only addressed by offset, their content is never copied
+        try:
+            header = Header.from_buffer(buffer)
+            if (header is None):
+                return None
+
+            blocks = BlockTable.scan(buffer, header)
+            if (blocks is None):
+                return None
+
+            rendIndex = blocks.find("REND")
+            dna1Index = blocks.find("DNA1")
+            if (rendIndex is None or dna1Index is None):
+                print("REND or DNA1 block missing")
+                return None
+
+            with blocks.content(buffer, rendIndex) as content:
+                rend = REND.from_buffer(content, header.Endianness)
+            if (rend is None):
+                return None
+
+            with blocks.content(buffer, dna1Index) as content:
+                sdna = SDNACache.read(content, header.Endianness, header.PointerSize)
+            if (sdna is None):
+                return None
+
+            scenes: List[Scene] = []
+            for index in blocks.SceneIndices:
+                scene = Scene.from_buffer(sdna, buffer, blocks.Offsets[index])  # fields are read in place
+                if (scene is not None):
+                    scenes.append(scene)
+
+            currentScene = BlendFile.find_scene(scenes, rend.SceneName)
+            if (currentScene is None):
+                print("No scene with the name specified in REND was found")
+                return None
+
+            return cls(header, rend, scenes, currentScene, sdna, blocks)
+
+        except Exception as ex:
+            print("An error occured while reading blend file from buffer")
+            print(ex)
+            return None
+
+    @staticmethod
+    def find_scene(scenes: List[Scene], name: str) -> Optional[Scene]:
+        for scene in scenes:
+            if (scene.Name == name):
+                return scene
+        return None
+
+    def get_scene(self, name: str) -> Optional[Scene]:
+        return BlendFile.find_scene(self.Scenes, name)
+
+    def get_block_statistics(self) -> Optional[BlockStatistics]:  # derived from the block table on first use
+        if (self.Statistics is None and self.Blocks is not None):
+            self.Statistics = BlockStatistics.from_table(self.Blocks)
+        return self.Statistics
+
+    def __init__(self, header: Header, rend: REND, scenes: List[Scene], current_scene: Scene, sdna: SDNA,
+                 blocks: Optional[BlockTable] = None, statistics: Optional[BlockStatistics] = None):
         self.Header = header
         self.REND = rend
-        #self.Scenes = scenes
+        self.Scenes = scenes
         self.CurrentScene = current_scene
-        self.SDNA = sdna
\ No newline at end of file
+        self.SDNA = sdna
+        self.Blocks = blocks
+        self.Statistics = statistics
+
+
+class BlendFileParser:
+    """Push based counterpart of BlendFile.read
+
+    Fed with chunks of a blend file as they arrive (e.g. during upload). Only REND, DNA1 and SC blocks are buffered,
+    everything else is skipped while streaming past. The scene is decoded as soon as DNA1 and the SC blocks are complete.
+    gzip and zstd compressed files are detected from their first bytes and decompressed on the fly.
+    """
+    Header: Optional[Header]
+    REND: Optional[REND]
+    SDNA: Optional[SDNA]
+    Scenes: List[Scene]
+    CurrentScene: Optional[Scene]
+    Statistics: BlockStatistics  # of the blocks streamed past so far
+    Compression: Optional[Compression]  # None until the first 4 bytes arrived
+    Failed: bool  # data was rejected, further chunks are ignored
+    Done: bool  # ENDB reached
+    Offset: int  # bytes consumed, after decompression
+
+    def feed(self, chunk) -> bool:  # returns False as soon as the data is rejected
+        if (self.Failed or self.Done):
+            return not self.Failed
+
+        if (self.Compression is None):
+            self.magic += chunk
+            if (len(self.magic) < 4):
+                return True
+
+            chunk = bytes(self.magic)
+            self.magic = bytearray()
+            self.Compression = Compression.detect(chunk)
+            if (self.Compression != Compression.NONE):
+                try:
+                    self.decompressor = StreamDecompressor(self.Compression)
+                except Exception as ex:
+                    self.fail(str(ex))
+                    return False
+
+        if (self.decompressor is None):
+            return self.consume(chunk)
+
+        try:
+            for data in self.decompressor.decompress(chunk):
+                if not self.consume(data) or self.Done:  # data behind ENDB is not decompressed
+                    break
+        except Exception as ex:
+            self.fail(f"Decompression failed: {ex}")
+
+        return not self.Failed
+
+    def consume(self, chunk) -> bool:  # chunk: uncompressed blend file data
+        data = memoryview(chunk)
+        position = 0
+        while (position < len(data) and not self.Failed and not self.Done):
+            if (self.skip > 0):
+                step = min(self.skip, len(data) - position)
+                self.skip -= step
+                position += step
+                self.Offset += step
+                continue
+
+            step = min(self.expected - len(self.pending), len(data) - position)
+            self.pending += data[position:position + step]
+            position += step
+            self.Offset += step
+            if (len(self.pending) == self.expected):
+                self.process(memoryview(self.pending))
+
+        return not self.Failed
+
+    def process(self, buffer: memoryview):
+        bhead = self.bhead
+        self.pending = bytearray()
+
+        if (self.Header is None):
+            self.Header = Header.from_buffer(buffer)
+            if (self.Header is None):
+                self.fail("Data doesn't start with a blend file header")
+                return
+
+            self.bheadStruct = BHead.get_struct(self.Header.PointerSize, self.Header.Endianness)
+            self.expect_bhead()
+
+        elif (bhead is None):
+            bhead = BHead.from_buffer(buffer, 0, self.bheadStruct)
+            if (bhead is None):
+                self.fail(f"Invalid BHead at offset {self.Offset - len(buffer)}")
+                return
+
+            if (bhead.Code == "ENDB"):
+                self.Done = True
+                return
+
+            self.Statistics.add(bhead.Code, bhead.Length)
+
+            if (bhead.Code in ("REND", "DNA1") or bhead.Code.startswith("SC")):
+                self.bhead = bhead
+                self.expected = bhead.Length
+                if (bhead.Length == 0):
+                    self.process(memoryview(self.pending))
+            else:
+                self.skip = bhead.Length
+                self.expect_bhead()
+
+        else:
+            if (bhead.Code == "REND"):
+                self.REND = REND.from_buffer(buffer, self.Header.Endianness)
+                if (self.REND is None):
+                    self.fail("Invalid REND block")
+                    return
+
+            elif (bhead.Code == "DNA1"):
+                self.SDNA = SDNACache.read(buffer, self.Header.Endianness, self.Header.PointerSize)
+                if (self.SDNA is None):
+                    self.fail("Invalid DNA1 block")
+                    return
+
+            else:
+                self.sceneBlocks.append((bhead, bytes(buffer)))
+
+            self.decode_scenes()
+            self.expect_bhead()
+
+    def decode_scenes(self):
+        if (self.SDNA is None or self.REND is None):
+            return
+
+        for bhead, content in self.sceneBlocks:
+            scene = Scene.from_buffer(self.SDNA, content, 0)
+            if (scene is not None):
+                self.Scenes.append(scene)
+                if (scene.Name == self.REND.SceneName):
+                    self.CurrentScene = scene
+
+        self.sceneBlocks = []
+
+    def expect_bhead(self):
+        self.bhead = None
+        self.expected = self.bheadStruct.size
+
+    def fail(self, message: str):
+        print(f"Rejected blend file data: {message}")
+        self.Failed = True
+
+    def close(self) -> Optional[BlendFile]:
+        if (self.Failed):
+            return None
+
+        if (not self.Done):
+            print("Blend file data ended before ENDB block")
+            return None
+
+        if (self.CurrentScene is None):
+            print("No scene with the name specified in REND was found")
+            return None
+
+        return BlendFile(self.Header, self.REND, self.Scenes, self.CurrentScene, self.SDNA, statistics=self.Statistics)
+
+    def __init__(self):
+        self.Header = None
+        self.REND = None
+        self.SDNA = None
+        self.Scenes = []
+        self.CurrentScene = None
+        self.Statistics = BlockStatistics()
+        self.Compression = None
+        self.Failed = False
+        self.Done = False
+        self.Offset = 0
+
+        self.magic = bytearray()
+        self.decompressor = None
+        self.pending = bytearray()
+        self.expected = 12  # header
+        self.skip = 0
+        self.bhead = None
+        self.bheadStruct = None
+        self.sceneBlocks = []  # SC blocks that arrived before DNA1 and REND
@@ -0,0 +1,81 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+from .FrameSet import FrameSet
+
+
+TARGET_SECONDS = 300  # wall-clock duration a subtask is sized for once the frame times are known
+PROBE_SECONDS = 60  # duration of the first subtasks of a task, while the frame times are estimated only
+CONFIDENT_SAMPLES = 8  # measured frames after which subtasks are sized for TARGET_SECONDS
+INITIAL_FRAMES = 4  # subtask size if there is neither a measurement nor an estimate
+SMOOTHING = 0.3  # weight of a new measurement in the moving average
+TAIL_FRACTION = 0.25  # a rest of a frame range smaller than this fraction of a subtask is added to the subtask
+
+
+class Chunker:
+    """Sizes subtasks to take about TARGET_SECONDS on the worker they are assigned to
+
+    Frame times are exponentially weighted moving averages of the times between results, per worker and task.
+    Workers without measurements of their own use the measurements of the other workers on the task scaled by
+    performance score, then the estimated frame cost of the task. Subtasks start at PROBE_SECONDS and grow towards
+    TARGET_SECONDS as measurements come in, a slower frame time than expected shrinks the next subtasks right away.
+    """
+    WorkerFrameTimes: Dict[Tuple[int, int], Tuple[float, int]] = {}  # (WorkerID_Int, TaskID_Int) -> (seconds per frame, measurements)
+    TaskFrameCosts: Dict[int, Tuple[float, int]] = {}  # TaskID_Int -> (seconds per frame on performance score 1, measurements)
+
+    lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def observe(workerID: int, taskID: int, performanceScore: int, secondsPerFrame: float):
+        if (secondsPerFrame <= 0):
+            return
+
+        with Chunker.lock:
+            Chunker.WorkerFrameTimes[(workerID, taskID)] = Chunker.smooth(Chunker.WorkerFrameTimes.get((workerID, taskID)), secondsPerFrame)
+            Chunker.TaskFrameCosts[taskID] = Chunker.smooth(Chunker.TaskFrameCosts.get(taskID), secondsPerFrame * performanceScore)
+
+    @staticmethod
+    def smooth(average: Optional[Tuple[float, int]], value: float) -> Tuple[float, int]:
+        if (average is None):
+            return (value, 1)
+        return (average[0] + SMOOTHING * (value - average[0]), average[1] + 1)
+
+    @staticmethod
+    def forget(taskID: int):  # task finished rendering
+        with Chunker.lock:
+            Chunker.TaskFrameCosts.pop(taskID, None)
+            for key in [key for key in Chunker.WorkerFrameTimes if (key[1] == taskID)]:
+                del Chunker.WorkerFrameTimes[key]
+
+    @staticmethod
+    def seconds_per_frame(workerID: int, taskID: int, performanceScore: int, estimatedFrameCost: Optional[float]) -> Tuple[Optional[float], int]:
+        # (seconds per frame on the worker, measurements it is based on)
+        with Chunker.lock:
+            own = Chunker.WorkerFrameTimes.get((workerID, taskID))
+            task = Chunker.TaskFrameCosts.get(taskID)
+
+        if (own is not None):
+            return own[0], own[1]
+        if (task is not None):
+            return task[0] / performanceScore, task[1]
+        if (estimatedFrameCost is not None):
+            return estimatedFrameCost / performanceScore, 0
+        return None, 0
+
+    @staticmethod
+    def chunk_frames(workerID: int, taskID: int, performanceScore: int, estimatedFrameCost: Optional[float] = None) -> int:
+        secondsPerFrame, samples = Chunker.seconds_per_frame(workerID, taskID, performanceScore, estimatedFrameCost)
+        if (secondsPerFrame is None):
+            return INITIAL_FRAMES
+
+        confidence = min(samples / CONFIDENT_SAMPLES, 1.0)
+        targetSeconds = PROBE_SECONDS + (TARGET_SECONDS - PROBE_SECONDS) * confidence
+        return max(int(targetSeconds / secondsPerFrame), 1)
+
+    @staticmethod
+    def next_chunk(frames: FrameSet, chunkFrames: int) -> Tuple[int, int, int]:  # (StartFrame, EndFrame, frame count) from the first run of frames
+        runStart, runEnd, step = frames.Starts[0], frames.Ends[0], frames.Step
+        runFrames = (runEnd - runStart) // step + 1
+        if (runFrames - chunkFrames < chunkFrames * TAIL_FRACTION):
+            chunkFrames = runFrames  # no separate subtask for a few frames
+        return runStart, runStart + (chunkFrames - 1) * step, chunkFrames
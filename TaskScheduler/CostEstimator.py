@@ -0,0 +1,124 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .BlendFile import BlockStatistics, Scene
+
+
+# Order of the feature vector, estimate = weights . features
+FEATURES = ("Constant", "MegapixelSamples", "MeshMB", "ImageMB", "Objects")
+
+# Engines without samples in SDNA (Cycles keeps them in ID properties) are assumed to use this many
+DEFAULT_SAMPLES = 128
+
+MIN_FRAME_COST = 0.01  # seconds, keeps badly fitted weights from predicting free frames
+
+
+class CostEstimator:
+    """Estimates the render time of a frame from the render settings and the content of the blend file
+
+    Costs are seconds per frame on a worker with performance score 1, a worker with score s is assumed to be s times faster.
+    The initial weights are rough guesses per engine, calibrate() replaces them by a least squares fit of observed frame times.
+    """
+    Weights: Dict[str, List[float]] = {  # engine group -> weights in order of FEATURES
+        "EEVEE":     [1.0, 0.02,  0.05, 0.02, 0.001],
+        "CYCLES":    [2.0, 0.1,   0.1,  0.05, 0.002],
+        "WORKBENCH": [0.5, 0.002, 0.02, 0.01, 0.0005],
+    }
+    MinObservations: int = 2 * len(FEATURES)  # per engine group, fewer keep the current weights
+    MinFeatureVectors: int = len(FEATURES)  # distinct ones, all frames of a task share one, fewer can't determine all weights
+    MaxObservations: int = 1000  # per engine group, oldest are dropped
+
+    observations: Dict[str, List[Tuple[List[float], float]]] = {}
+    lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def engine_group(engine: str) -> str:
+        if (engine.startswith("BLENDER_EEVEE")):  # also BLENDER_EEVEE_NEXT
+            return "EEVEE"
+        if (engine == "BLENDER_WORKBENCH"):
+            return "WORKBENCH"
+        return "CYCLES"  # unknown engines (add-ons) are usually path tracers as well
+
+    @staticmethod
+    def features(scene: Scene, statistics: Optional[BlockStatistics] = None) -> Dict:
+        percentage = (scene.ResolutionPercentage if (scene.ResolutionPercentage > 0) else 100) / 100
+        megapixels = max(scene.ResolutionX, 0) * max(scene.ResolutionY, 0) * percentage * percentage / 1e6
+        samples = scene.Samples if (scene.Samples > 0) else DEFAULT_SAMPLES
+
+        features = {
+            "Engine": CostEstimator.engine_group(scene.Engine),
+            "Constant": 1.0,
+            "MegapixelSamples": megapixels * samples,
+            "MeshMB": 0.0,
+            "ImageMB": 0.0,
+            "Objects": 0.0,
+        }
+        if (statistics is not None):
+            features["MeshMB"] = statistics.size("ME") / 2**20
+            features["ImageMB"] = (statistics.size("IM") + statistics.size("PF")) / 2**20  # packed files are mostly images
+            features["Objects"] = float(statistics.count("OB"))
+
+        return features
+
+    @staticmethod
+    def estimate(features: Dict) -> float:  # seconds per frame on a worker with performance score 1
+        weights = CostEstimator.Weights[features["Engine"]]
+        cost = sum(weight * features[name] for weight, name in zip(weights, FEATURES))
+        return max(cost, MIN_FRAME_COST)
+
+    ### Calibration
+    @staticmethod
+    def observe(features: Dict, secondsPerFrame: float, performanceScore: int = 1):  # hook for measured frame times
+        if (secondsPerFrame <= 0):
+            return
+
+        with CostEstimator.lock:
+            observations = CostEstimator.observations.setdefault(features["Engine"], [])
+            observations.append(([features[name] for name in FEATURES], secondsPerFrame * performanceScore))
+            del observations[:-CostEstimator.MaxObservations]
+
+    @staticmethod
+    def calibrate() -> List[str]:  # returns the engine groups whose weights were refitted
+        refitted = []
+        with CostEstimator.lock:
+            for engine, observations in CostEstimator.observations.items():
+                if (len(observations) < CostEstimator.MinObservations):
+                    continue
+                if (len({tuple(row) for row, _ in observations}) < CostEstimator.MinFeatureVectors):
+                    continue
+
+                weights = CostEstimator.fit(observations, CostEstimator.Weights[engine])
+                if (weights is not None):
+                    CostEstimator.Weights[engine] = weights
+                    refitted.append(engine)
+
+        return refitted
+
+    @staticmethod
+    def fit(observations: List[Tuple[List[float], float]], prior: List[float], ridge: float = 1e-6) -> Optional[List[float]]:
+        # least squares via the normal equations (X^T X + ridge I) w = X^T y + ridge prior, small enough to solve without numpy
+        # Regularized toward the current weights, features the observations don't vary (e.g. no statistics) keep theirs
+        size = len(FEATURES)
+        matrix = [[ridge if (i == j) else 0.0 for j in range(size)] + [ridge * prior[i]] for i in range(size)]  # augmented with X^T y
+        for row, seconds in observations:
+            for i in range(size):
+                for j in range(size):
+                    matrix[i][j] += row[i] * row[j]
+                matrix[i][size] += row[i] * seconds
+
+        # Gaussian elimination with partial pivoting
+        for column in range(size):
+            pivot = max(range(column, size), key=lambda r: abs(matrix[r][column]))
+            if (abs(matrix[pivot][column]) < 1e-12):
+                return None
+            matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+            for r in range(column + 1, size):
+                factor = matrix[r][column] / matrix[column][column]
+                for c in range(column, size + 1):
+                    matrix[r][c] -= factor * matrix[column][c]
+
+        weights = [0.0] * size
+        for r in reversed(range(size)):
+            weights[r] = (matrix[r][size] - sum(matrix[r][c] * weights[c] for c in range(r + 1, size))) / matrix[r][r]
+
+        return weights
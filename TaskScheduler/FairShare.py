@@ -0,0 +1,177 @@
+import heapq
+import threading
+import time
+from collections import deque
+from typing import Callable, Collection, Deque, Dict, List, Optional, Set, Tuple
+
+from .Enums import TaskStage
+from .models import RenderTask
+
+
+HALF_LIFE = 3600  # seconds after which consumed worker time counts half
+MAX_HALF_LIVES = 64  # usage is rescaled before the growth factor 2^(age / HALF_LIFE) gets too large
+NO_USER = 0  # key for tasks without CreatedBy, user ids start at 1
+AFFINITY_SLACK = 900  # worker-seconds a user may be ahead of the least served one and still get a worker holding its blend data
+SYNC_SECONDS = 300  # interval of the full re-read of the queued tasks
+
+
+class FairShare:
+    """Queue of the tasks with unassigned frames that serves the user with the least recent worker time first
+
+    Usage is the worker-seconds (on performance score 1) assigned to a user, decaying with HALF_LIFE, divided by the
+    weight of the user.
+    Decay scales all usages by the same factor, so usages are stored relative to Epoch (multiplied by
+    2^(age / HALF_LIFE)) and never need updating for it. Users with queued tasks are kept in a heap ordered by
+    usage, which makes picking and charging O(log users). Stale heap entries are skipped when they come up.
+    Tasks of one user are served in order of submission. A worker that holds the blend data of a queued task gets
+    that task instead, as long as its user is at most AFFINITY_SLACK ahead of the least served user.
+
+    Each web process has its own queue and usages. Tasks are queued by task_ready() when they get unassigned frames
+    and dropped by task_done(). sync() re-reads the tasks that still have unassigned frames (RenderTask.FramesAssigned)
+    every SYNC_SECONDS, or on the next pass after mark_stale(), so tasks created or handed out by other processes are
+    seen and drift is repaired.
+    """
+    Weights: Dict[int, float] = {}  # user id -> share, 1 if missing, set before the first use
+    clock: Callable[[], float] = time.monotonic
+
+    Epoch: Optional[float] = None
+    Usage: Dict[int, float] = {}  # user id -> worker-seconds scaled to Epoch
+    Queues: Dict[int, Deque[int]] = {}  # user id -> TaskID_Int in order of submission
+    Queued: Dict[int, int] = {}  # TaskID_Int -> user id of all queued tasks
+    DataTasks: Dict[int, Set[int]] = {}  # TaskID_Int of the blend data -> queued TaskID_Int using it
+    queuedData: Dict[int, int] = {}  # TaskID_Int -> TaskID_Int of the blend data
+    heap: List[Tuple[float, int]] = []  # (usage / weight, user id)
+    lastSync: Optional[float] = None  # clock() of the last full sync, None forces one
+    lock: threading.RLock = threading.RLock()
+
+    @staticmethod
+    def priority(user: int) -> float:
+        return FairShare.Usage.get(user, 0.0) / FairShare.Weights.get(user, 1.0)
+
+    @staticmethod
+    def scale() -> float:  # factor from worker-seconds now to usage relative to Epoch
+        now = FairShare.clock()
+        if (FairShare.Epoch is None):
+            FairShare.Epoch = now
+
+        halfLives = (now - FairShare.Epoch) / HALF_LIFE
+        if (halfLives > MAX_HALF_LIVES):  # move Epoch to now, the heap order doesn't change
+            factor = 2.0 ** -halfLives
+            for user in FairShare.Usage:
+                FairShare.Usage[user] *= factor
+            FairShare.heap = [(FairShare.priority(user), user) for user, queue in FairShare.Queues.items() if queue]
+            heapq.heapify(FairShare.heap)
+            FairShare.Epoch = now
+            halfLives = 0.0
+
+        return 2.0 ** halfLives
+
+    @staticmethod
+    def usage(user: int) -> float:  # decayed worker-seconds
+        with FairShare.lock:
+            scale = FairShare.scale()  # may rescale Usage
+            return FairShare.Usage.get(user, 0.0) / scale
+
+    @staticmethod
+    def sync():  # called at the start of a scheduling pass, reads the tasks only if due
+        with FairShare.lock:
+            if (FairShare.lastSync is not None and FairShare.clock() - FairShare.lastSync < SYNC_SECONDS):
+                return
+            FairShare.lastSync = FairShare.clock()
+
+        tasks = RenderTask.objects.filter(Stage__in=(TaskStage.Pending, TaskStage.Rendering), FramesAssigned=False)
+        current = {taskID: (user, dataTaskID) for taskID, user, dataTaskID in
+                   tasks.order_by("TaskID_Int").values_list("TaskID_Int", "CreatedBy_id", "BlenderDataTask_id")}
+
+        with FairShare.lock:
+            for taskID in [taskID for taskID in FairShare.Queued if (taskID not in current)]:
+                FairShare.task_done(taskID)
+            for taskID, (user, dataTaskID) in current.items():
+                FairShare.enqueue(NO_USER if (user is None) else user, taskID, dataTaskID)
+
+    @staticmethod
+    def mark_stale():  # the queue disagrees with the database, the next sync() reads the tasks
+        with FairShare.lock:
+            FairShare.lastSync = None
+
+    @staticmethod
+    def task_ready(task: RenderTask):  # task got unassigned frames
+        with FairShare.lock:
+            FairShare.enqueue(NO_USER if (task.CreatedBy_id is None) else task.CreatedBy_id, task.TaskID_Int, task.BlenderDataTask_id)
+
+    @staticmethod
+    def enqueue(user: int, taskID: int, dataTaskID: Optional[int] = None):  # dataTaskID: task whose upload holds the blend data, if another
+        # call with lock held
+        if (taskID in FairShare.Queued):
+            return
+
+        queue = FairShare.Queues.setdefault(user, deque())
+        if not queue:  # user wasn't in the heap
+            heapq.heappush(FairShare.heap, (FairShare.priority(user), user))
+        queue.append(taskID)
+        FairShare.Queued[taskID] = user
+
+        dataTaskID = taskID if (dataTaskID is None) else dataTaskID
+        FairShare.DataTasks.setdefault(dataTaskID, set()).add(taskID)
+        FairShare.queuedData[taskID] = dataTaskID
+
+    @staticmethod
+    def next_task(cachedTasks: Collection[int] = ()) -> Optional[Tuple[int, int]]:  # (user id, TaskID_Int), stays queued
+        # cachedTasks: TaskID_Int of the blend data the worker holds (Worker.CachedTasks)
+        with FairShare.lock:
+            while FairShare.heap:
+                priority, user = FairShare.heap[0]
+                queue = FairShare.Queues.get(user)
+                if (not queue or priority != FairShare.priority(user)):  # stale, charge() pushed the current entry
+                    heapq.heappop(FairShare.heap)
+                    continue
+                break
+            else:
+                return None
+
+            # Queued tasks the worker needn't download, O(cached tasks), the least served of their users within the slack
+            slack = AFFINITY_SLACK * FairShare.scale()
+            warm = None
+            for dataTaskID in cachedTasks:
+                for taskID in FairShare.DataTasks.get(dataTaskID, ()):
+                    taskUser = FairShare.Queued[taskID]
+                    taskPriority = FairShare.priority(taskUser)
+                    if (taskPriority - priority <= slack and (warm is None or (taskPriority, taskID) < warm[0])):
+                        warm = ((taskPriority, taskID), taskUser)
+            if (warm is not None):
+                return warm[1], warm[0][1]
+
+            return user, queue[0]
+
+    @staticmethod
+    def task_done(taskID: int):  # no unassigned frames left
+        with FairShare.lock:
+            user = FairShare.Queued.pop(taskID, None)
+            if (user is not None):
+                FairShare.Queues[user].remove(taskID)  # usually the first
+                dataTaskID = FairShare.queuedData.pop(taskID)
+                FairShare.DataTasks[dataTaskID].discard(taskID)
+                if not FairShare.DataTasks[dataTaskID]:
+                    del FairShare.DataTasks[dataTaskID]
+
+    @staticmethod
+    def charge(user: int, seconds: float):  # worker-seconds assigned to the user
+        if (seconds <= 0):
+            return
+
+        with FairShare.lock:
+            FairShare.Usage[user] = FairShare.Usage.get(user, 0.0) + seconds * FairShare.scale()
+            if FairShare.Queues.get(user):
+                heapq.heappush(FairShare.heap, (FairShare.priority(user), user))
+
+    @staticmethod
+    def reset():
+        with FairShare.lock:
+            FairShare.Epoch = None
+            FairShare.Usage = {}
+            FairShare.Queues = {}
+            FairShare.Queued = {}
+            FairShare.DataTasks = {}
+            FairShare.queuedData = {}
+            FairShare.heap = []
+            FairShare.lastSync = None
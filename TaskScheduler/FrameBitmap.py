@@ -0,0 +1,67 @@
+import re
+from typing import List, Optional, Tuple
+
+
+FULL_BYTES = re.compile(rb"[^\xff]+")  # spans of bytes with at least one clear bit, full bytes are skipped in C
+CHUNK_BYTES = 64  # bytes converted to one int at a time when runs are searched, keeps the int operations cheap
+
+
+class FrameBitmap:
+    """One bit per frame index of a task (frame = StartFrame + index * FrameStep), set when the frame was received
+
+    Bit i is bit i % 8 of byte i // 8, so int.from_bytes(..., "little") has bit i at position i. Setting and testing
+    a bit is O(1), counting uses int.bit_count() on the bytes, searching the clear runs skips full bytes by a regular
+    expression and costs O(frame count / 8) in C plus O(clear runs) in Python.
+    """
+    FrameCount: int
+    Data: bytearray
+
+    def set(self, index: int):
+        self.Data[index >> 3] |= 1 << (index & 7)
+
+    def get(self, index: int) -> bool:
+        return bool(self.Data[index >> 3] & (1 << (index & 7)))
+
+    def count(self, start: int = 0, end: Optional[int] = None) -> int:  # set bits in [start, end], end inclusive
+        end = self.FrameCount - 1 if (end is None) else min(end, self.FrameCount - 1)
+        if (start > end):
+            return 0
+        value = int.from_bytes(self.Data[start >> 3:(end >> 3) + 1], "little") >> (start & 7)
+        return (value & ((1 << (end - start + 1)) - 1)).bit_count()
+
+    def is_full(self) -> bool:
+        return self.count() == self.FrameCount
+
+    def missing_runs(self) -> List[Tuple[int, int]]:  # (first index, last index) of the runs of clear bits
+        runs = []
+        for match in FULL_BYTES.finditer(self.Data):
+            for chunkStart in range(match.start(), match.end(), CHUNK_BYTES):
+                chunkEnd = min(chunkStart + CHUNK_BYTES, match.end())
+                bits = (chunkEnd - chunkStart) * 8
+                missing = ~int.from_bytes(self.Data[chunkStart:chunkEnd], "little") & ((1 << bits) - 1)
+                offset = chunkStart * 8
+                while missing:
+                    low = (missing & -missing).bit_length() - 1  # lowest clear bit
+                    length = (~(missing >> low) & ((missing >> low) + 1)).bit_length() - 1  # clear bits from there
+                    start, end = offset + low, min(offset + low + length - 1, self.FrameCount - 1)
+                    missing &= ~(((1 << length) - 1) << low)
+                    if (start > end):
+                        break  # padding of the last byte
+                    if (runs and runs[-1][1] == start - 1):  # continues across a chunk boundary
+                        runs[-1] = (runs[-1][0], end)
+                    else:
+                        runs.append((start, end))
+        return runs
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.Data)
+
+    def __len__(self) -> int:
+        return self.FrameCount
+
+    def __init__(self, frameCount: int, data: Optional[bytes] = None):  # data as stored, e.g. a memoryview from the database
+        self.FrameCount = frameCount
+        size = (frameCount + 7) // 8
+        self.Data = bytearray(size) if (data is None) else bytearray(data)
+        if (len(self.Data) != size):
+            raise ValueError(f"Frame bitmap of {len(self.Data)} bytes doesn't match {frameCount} frames")
@@ -0,0 +1,104 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Tuple
+
+
+class FrameSet:
+    """Set of frames on the grid Origin + k * Step, stored as sorted, merged runs instead of one entry per frame
+
+    Runs are inclusive (start, end) pairs kept in two parallel lists, so runs are found by binary search.
+    Adding or removing a range touches only the runs it overlaps. Frames off the grid are ignored.
+    """
+    Origin: int
+    Step: int
+    Starts: List[int]
+    Ends: List[int]  # inclusive, Ends[i] < Starts[i + 1] - Step (runs never touch)
+
+    def align_up(self, frame: int) -> int:  # first frame on the grid >= frame
+        return frame + (self.Origin - frame) % self.Step
+
+    def align_down(self, frame: int) -> int:  # last frame on the grid <= frame
+        return frame - (frame - self.Origin) % self.Step
+
+    def add(self, start: int, end: int):  # inclusive
+        start, end = self.align_up(start), self.align_down(end)
+        if (start > end):
+            return
+
+        # runs that overlap or touch [start, end] are merged into one
+        first = bisect_left(self.Ends, start - self.Step)
+        last = bisect_right(self.Starts, end + self.Step)
+        if (first < last):
+            start = min(start, self.Starts[first])
+            end = max(end, self.Ends[last - 1])
+        self.Starts[first:last] = [start]
+        self.Ends[first:last] = [end]
+
+    def remove(self, start: int, end: int):  # inclusive
+        start, end = self.align_up(start), self.align_down(end)
+        if (start > end):
+            return
+
+        first = bisect_left(self.Ends, start)
+        last = bisect_right(self.Starts, end)
+        if (first >= last):
+            return
+
+        # only the first and last overlapped run can keep a part
+        starts, ends = [], []
+        if (self.Starts[first] < start):
+            starts.append(self.Starts[first])
+            ends.append(start - self.Step)
+        if (self.Ends[last - 1] > end):
+            starts.append(end + self.Step)
+            ends.append(self.Ends[last - 1])
+        self.Starts[first:last] = starts
+        self.Ends[first:last] = ends
+
+    def contains(self, frame: int) -> bool:
+        if ((frame - self.Origin) % self.Step != 0):
+            return False
+        index = bisect_right(self.Starts, frame) - 1
+        return index >= 0 and frame <= self.Ends[index]
+
+    def covers(self, start: int, end: int) -> bool:  # all frames of the grid in [start, end] are in the set
+        start, end = self.align_up(start), self.align_down(end)
+        if (start > end):
+            return True
+        index = bisect_right(self.Starts, start) - 1
+        return index >= 0 and end <= self.Ends[index]
+
+    def runs(self) -> List[Tuple[int, int, int]]:  # (start, end, step), end inclusive
+        return [(start, end, self.Step) for start, end in zip(self.Starts, self.Ends)]
+
+    def first(self) -> int:
+        return self.Starts[0]
+
+    def copy(self):
+        instance = FrameSet(self.Origin, self.Step)
+        instance.Starts = self.Starts.copy()
+        instance.Ends = self.Ends.copy()
+        return instance
+
+    def __len__(self) -> int:
+        return sum((end - start) // self.Step + 1 for start, end in zip(self.Starts, self.Ends))
+
+    def __bool__(self) -> bool:
+        return bool(self.Starts)
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in zip(self.Starts, self.Ends):
+            yield from range(start, end + 1, self.Step)
+
+    @classmethod
+    def from_range(cls, start: int, end: int, step: int = 1):  # inclusive
+        instance = cls(start, step)
+        instance.add(start, end)
+        return instance
+
+    def __init__(self, origin: int = 0, step: int = 1):
+        if (step <= 0):
+            raise ValueError(f"Invalid frame step {step}")
+        self.Origin = origin
+        self.Step = step
+        self.Starts = []
+        self.Ends = []
@@ -1,32 +1,57 @@
-from typing import Optional, Tuple
-from django.db.models import Max
+import math
+import shutil
+import time
+from threading import Event, Thread, current_thread
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
 
 from .models import RenderTask, Subtask, BlenderDataType, SubtaskStage
 from .Enums import TaskStage
+from .Chunker import Chunker, PROBE_SECONDS
 from .ConcatManager import ConcatManager
+from .CostEstimator import CostEstimator
+from .FairShare import FairShare
+from .BlendFile import BlockStatistics
+from .BlendFile import Scene as BlendFileScene
 from WorkerManager.WorkerManager import WorkerManager
 from WorkerManager.models import Worker
 from WorkerManager.Enums import WorkerStatus
 
 
-# Duplicate in WorkerManager/WorkerManager.py
-def _int_to_id(value: int, prefix: str) -> str:
-    hex_string = format(value, 'x')
-    hex_string = hex_string.zfill(16)
-    formatted_hex = '_'.join(hex_string[i:i + 4] for i in range(0, len(hex_string), 4))
-    return f"{prefix}{formatted_hex}"
+MIN_STEAL_FRAMES = 2  # smaller tails aren't worth another download of the blend data
 
+# Defaults, overridden by the settings of the same name
+SPECULATION_THRESHOLD = 0.95  # fraction of the frames of a task rendered before its last subtasks are duplicated
+SPECULATION_BUDGET = 2  # duplicates running at once per task
+
+DEBOUNCE_SECONDS = 0.2  # wake-ups arriving this long after the first one are handled by the same pass
+IDLE_PASS_SECONDS = 30  # pass without wake-up, picks up what other processes or lost events left
 
-class TaskScheduler:
-    idCounter: int = 0  # provisional solution
 
+class TaskScheduler:
+    wakeEvent: Event = Event()
+    loopThread: Optional[Thread] = None
 
     ### Methods for API
     @staticmethod
     def init_new_task(user) -> Optional[Tuple[str, str]]:  # call before upload to get path to save blend file to
-        if (RenderTask.objects.filter(TaskID_Int=TaskScheduler.idCounter).exists()):
-            TaskScheduler.idCounter = RenderTask.objects.aggregate(Max('TaskID_Int'))['TaskID_Int__max'] + 1
+        task = TaskScheduler.create_task(user)
+        return None if (task is None) else (task.TaskID, task.get_blender_data_path())
+
+    @staticmethod
+    def discard_task(task_id: str):  # call if the upload was rejected, removes the task and its folder
+        task = RenderTask.objects.filter(TaskID=task_id).first()
+        if (task is None):
+            print(f"ERROR: Discard task was called on unknown task_id: {task_id}")
+            return
+
+        shutil.rmtree(task.get_folder(), ignore_errors=True)
+        task.delete()
 
+    @staticmethod
+    def create_task(user, blenderDataTask: Optional[RenderTask] = None) -> Optional[RenderTask]:
         # take from global configuration ? :
         fileServerAddress = "localhost"
         fileServerPort = 8000
@@ -34,77 +59,346 @@ class TaskScheduler:
         # currently hard coded, more options (zip file) later:
         blenderDataType = BlenderDataType.SingleFile
 
-        MAX_TRIES = 10
-        tries = 0
-        task = None
-        while (tries < MAX_TRIES and task is None):
-            taskID = _int_to_id(TaskScheduler.idCounter, "T-")  # provisional solution
-            task = RenderTask.create(TaskScheduler.idCounter, taskID, fileServerAddress, fileServerPort, blenderDataType, user)
-            TaskScheduler.idCounter += 1
-
-        return None if (task is None) else (task.TaskID, task.get_blender_data_path())
+        return RenderTask.create(fileServerAddress, fileServerPort, blenderDataType, user, blenderDataTask)  # ID from the database
 
     @staticmethod
-    def run_task(task_id: str) -> bool:  # call after upload
+    def run_task(task_id: str, scene: Optional[BlendFileScene] = None, statistics: Optional[BlockStatistics] = None) -> bool:  # call after upload, scene if already parsed during upload
         try:
             task = RenderTask.objects.get(TaskID=task_id)
         except:
             print(f"ERROR: Run task was called on unknown task_id: {task_id}")
             return False
 
-        created = task.complete()
-        TaskScheduler.distribute_tasks()
+        created = task.complete(scene, statistics)
+        if created:
+            FairShare.task_ready(task)
+        TaskScheduler.wake()
         return created
 
+    @staticmethod
+    def run_scene_tasks(task_id: str, scenes: List[BlendFileScene], statistics: Optional[BlockStatistics] = None) -> List[str]:  # call after upload, one task per scene sharing the uploaded file
+        try:
+            task = RenderTask.objects.get(TaskID=task_id)
+        except:
+            print(f"ERROR: Run scene tasks was called on unknown task_id: {task_id}")
+            return []
+
+        if not scenes or not task.complete(scenes[0], statistics):  # the uploaded task renders the first scene
+            return []
+
+        FairShare.task_ready(task)
+        taskIDs = [task.TaskID]
+        for scene in scenes[1:]:
+            sceneTask = TaskScheduler.create_task(task.CreatedBy, task)
+            if (sceneTask is None or not sceneTask.complete(scene, statistics)):
+                print(f"ERROR: Failed to create task for scene {scene.Name} of task {task.TaskID}")
+                continue
+            FairShare.task_ready(sceneTask)
+            taskIDs.append(sceneTask.TaskID)
+
+        TaskScheduler.wake()
+        return taskIDs
+
+    ### Scheduler loop
+    @staticmethod
+    def start_loop():
+        TaskScheduler.loopThread = Thread(target=TaskScheduler.run_loop, daemon=True)
+        TaskScheduler.loopThread.start()
+
+    @staticmethod
+    def stop_loop():  # returns after the current pass
+        thread = TaskScheduler.loopThread
+        TaskScheduler.loopThread = None
+        TaskScheduler.wakeEvent.set()
+        if (thread is not None):
+            thread.join()
+
+    @staticmethod
+    def wake():  # events: task ready, worker free, subtask finished or failed
+        if (TaskScheduler.loopThread is None):  # no loop (management commands, shell, tests), schedule right away
+            TaskScheduler.distribute_tasks()
+            return
+        TaskScheduler.wakeEvent.set()
+
+    @staticmethod
+    def run_loop():  # runs on loop thread
+        while True:
+            TaskScheduler.wakeEvent.wait(IDLE_PASS_SECONDS)
+            if (TaskScheduler.loopThread is not current_thread()):  # stopped
+                return
+            time.sleep(DEBOUNCE_SECONDS)  # let the rest of a burst (e.g. many workers registering) arrive
+            TaskScheduler.wakeEvent.clear()  # wake-ups during the pass lead to another pass
+
+            try:
+                TaskScheduler.distribute_tasks()
+            except Exception as ex:
+                print("ERROR: Scheduling pass failed")
+                print(ex)
+            finally:
+                close_old_connections()
+
     @staticmethod
     def distribute_tasks():
         print("Called distribute")
-        workers = Worker.objects.filter(Status=WorkerStatus.Available)
-        if not workers.exists():
+        with transaction.atomic():  # one pass, rows locked by a concurrent pass of another process are skipped
+            subtasks, shrunkSubtasks = TaskScheduler.schedule()
+            transaction.on_commit(lambda: WorkerManager.update_subtasks(shrunkSubtasks))
+            transaction.on_commit(lambda: WorkerManager.distribute_subtasks(subtasks))
+
+    @staticmethod
+    def schedule() -> Tuple[List[Subtask], List[Subtask]]:  # (subtasks to start, running subtasks whose frame range shrunk)
+        workers = list(Worker.objects.select_for_update(skip_locked=True).filter(Status=WorkerStatus.Available).order_by("-PerformanceScore"))
+        if not workers:
             print("No workers available")
-            return
+            return [], []
+        busyWorkers = []
+
+        # First reassign Subtasks that failed, fastest workers first, workers holding the blend data before those
+        # Shrunk to the first run of frames not received yet, further runs are handed out again like other frames
+        reassigned = []
+        aborted = []
+        releasedTasks = {}  # TaskID_Int -> task that got unassigned frames
+        for subtask in Subtask.objects.select_for_update(skip_locked=True, of=("self",)).filter(Stage=SubtaskStage.Pending).select_related("Task"):
+            if not workers:
+                break
+            task = subtask.Task
+            runs = subtask.get_missing_runs()
+            if not runs:  # the previous worker delivered every frame
+                subtask.Stage = SubtaskStage.Aborted
+                aborted.append(subtask)
+                continue
+            if (len(runs) > 1):
+                releasedTasks[task.TaskID_Int] = task
+
+            subtask.StartFrame, subtask.EndFrame = runs[0]
+            subtask.Portion = subtask.frame_count() / task.frame_count()
+            subtask.LastestFrame = None  # progress and frame rate count from the new StartFrame
+            subtask.LastFrameAt = None
+            subtask.Worker = TaskScheduler.take_worker(workers, task.get_blender_data_task_id())
+            subtask.Stage = SubtaskStage.Running
+            subtask.StartedAt = timezone.now()
+            reassigned.append(subtask)
+        Subtask.objects.bulk_update(reassigned + aborted, ["Worker", "Stage", "StartedAt", "StartFrame", "EndFrame", "Portion", "LastestFrame", "LastFrameAt"])
+        busyWorkers += [subtask.Worker for subtask in reassigned]
+
+        for task in releasedTasks.values():
+            if task.FramesAssigned:
+                task.FramesAssigned = False
+                task.save(update_fields=["FramesAssigned"])
+            FairShare.task_ready(task)
+
+        # Hand out chunks sized to the worker (see Chunker), fastest workers first, each from the task of the
+        # user that got the least worker time recently (see FairShare). A worker holding the blend data of a queued
+        # task gets a follow-up chunk of it, unless its user is far ahead, so it neither downloads nor loads it again
+        created = []
+        unassigned = {}  # TaskID_Int -> (task, unassigned frames, frame count), read once per pass
+        FairShare.sync()
+        while workers:
+            queued = FairShare.next_task(workers[0].CachedTasks)
+            if (queued is None):
+                break
+            user, taskID = queued
+
+            if (taskID not in unassigned):
+                task = RenderTask.objects.select_for_update(skip_locked=True).filter(TaskID_Int=taskID).first()
+                if (task is None):
+                    FairShare.mark_stale()
+                    break  # locked, a concurrent pass hands out its frames, or deleted, sync() drops it next pass
+                unassigned[taskID] = (task, task.get_unassigned_frame_set(), task.frame_count())
+
+            task, frames, frameCount = unassigned[taskID]
+            if not frames:
+                FairShare.task_done(taskID)
+                task.FramesAssigned = True
+                task.save(update_fields=["FramesAssigned"])
+                continue
 
-        subtasks = []
-        resourcesLeft = True
-        # First check if there are Subtasks that failed and must be reassigned
-        pendingSubtasks = Subtask.objects.filter(Stage=SubtaskStage.Pending)
-        if (pendingSubtasks.exists()):
-            # TODO: better distribution
-            subtasksList = list(pendingSubtasks)
-            subtask = Subtask(SubtaskIndex=0, Task=subtasksList[0].Task, Worker=workers[0],
-                              StartFrame=subtasksList[0].StartFrame, EndFrame=subtasksList[0].EndFrame,
-                              Portion=1)
-            subtask.save()
-            subtasks.append(subtask)
-
-            resourcesLeft = False
-
-        if (resourcesLeft):
-            tasks = RenderTask.objects.filter(Stage=TaskStage.Pending)
-            if (tasks.exists()):
-                subtask = Subtask(SubtaskIndex=0, Task=tasks[0], Worker=workers[0],
-                                  StartFrame=tasks[0].StartFrame, EndFrame=tasks[0].EndFrame,
-                                  Portion=1)
-                subtask.save()
-                subtasks.append(subtask)
-                tasks[0].Stage = TaskStage.Distributing
-                # task[0].save()
-
-        WorkerManager.distribute_subtasks(subtasks)
+            worker = workers.pop(0)
+            chunkFrames = Chunker.chunk_frames(worker.WorkerID_Int, taskID, worker.PerformanceScore, task.EstimatedFrameCost)
+            startFrame, endFrame, count = Chunker.next_chunk(frames, chunkFrames)
+            frames.remove(startFrame, endFrame)
+
+            created.append(Subtask(Task=task, Worker=worker, StartFrame=startFrame, EndFrame=endFrame,
+                                   Portion=count / frameCount, Stage=SubtaskStage.Running, StartedAt=timezone.now()))
+            busyWorkers.append(worker)
+
+            # charged in seconds on performance score 1, so time on fast workers counts more
+            secondsPerFrame, _ = Chunker.seconds_per_frame(worker.WorkerID_Int, taskID, worker.PerformanceScore, task.EstimatedFrameCost)
+            seconds = count * secondsPerFrame if (secondsPerFrame is not None) else PROBE_SECONDS
+            FairShare.charge(user, seconds * worker.PerformanceScore)
+
+            if (TaskStage(task.Stage) == TaskStage.Pending or not frames):
+                task.Stage = TaskStage.Rendering  # subtasks are queued for sending
+                task.FramesAssigned = not frames
+                task.save(update_fields=["Stage", "FramesAssigned"])
+                if not frames:
+                    FairShare.task_done(taskID)
+
+        # Workers still idle take over the tail of the running subtasks that need longest
+        shrunkSubtasks = []
+        while workers:
+            stolen = TaskScheduler.steal_subtask(workers[0])
+            if (stolen is None):
+                break  # nothing left worth stealing, slower workers won't find anything either
+            busyWorkers.append(workers.pop(0))
+            shrunkSubtask, subtask = stolen
+            shrunkSubtasks.append(shrunkSubtask)
+            created.append(subtask)
+
+        # The rest render the last frames of nearly finished tasks a second time
+        if workers:
+            duplicates = TaskScheduler.speculate_subtasks(workers)
+            busyWorkers += [duplicate.Worker for duplicate in duplicates]
+            created += duplicates
+
+        created = Subtask.objects.bulk_create(created)  # the database assigns SubtaskIndex
+
+        for worker in busyWorkers:
+            worker.Status = WorkerStatus.Working
+        Worker.objects.bulk_update(busyWorkers, ["Status"])
+
+        return reassigned + created, shrunkSubtasks
+
+    @staticmethod
+    def take_worker(workers: List[Worker], dataTaskID: int) -> Worker:  # removes the fastest worker holding the blend data, else the fastest
+        worker = next((worker for worker in workers if (dataTaskID in worker.CachedTasks)), workers[0])
+        workers.remove(worker)
+        return worker
+
+    @staticmethod
+    def steal_subtask(worker: Worker) -> Optional[Tuple[Subtask, Subtask]]:  # (shrunk subtask, new unsaved subtask)
+        """Splits the untouched tail off the running subtask with the longest remaining time for worker
+
+        The split point is chosen so both workers finish at the same time, using the observed frame rate of the
+        running subtask and assuming frame rates proportional to the performance scores.
+        """
+        victim = None
+        victimRate = 0.0
+        longestRemaining = 0.0
+        running = Subtask.objects.filter(Stage=SubtaskStage.Running, DuplicateOf=None).exclude(Duplicate_set__Stage=SubtaskStage.Running)
+        for subtask in running.select_for_update(skip_locked=True, of=("self",)).select_related("Task", "Worker"):
+            rate = subtask.frame_rate()
+            remainingFrames = subtask.frames_remaining()
+            if (rate is None or remainingFrames <= MIN_STEAL_FRAMES):
+                continue
+            if (remainingFrames / rate > longestRemaining):
+                victim, victimRate, longestRemaining = subtask, rate, remainingFrames / rate
+
+        if (victim is None):
+            return None
+
+        thiefRate = victimRate * worker.PerformanceScore / victim.Worker.PerformanceScore
+        remainingFrames = victim.frames_remaining()
+        keptFrames = max(math.ceil(remainingFrames * victimRate / (victimRate + thiefRate)), 1)  # at least the current frame
+        tailFrames = remainingFrames - keptFrames
+        if (tailFrames < MIN_STEAL_FRAMES):
+            return None
+
+        step = victim.Task.FrameStep
+        taskFrameCount = victim.Task.frame_count()
+        newEndFrame = victim.next_frame() + (keptFrames - 1) * step
+        subtask = Subtask(Task=victim.Task, Worker=worker, StartFrame=newEndFrame + step, EndFrame=victim.EndFrame,
+                          Portion=tailFrames / taskFrameCount, Stage=SubtaskStage.Running, StartedAt=timezone.now())
+        victim.EndFrame = newEndFrame
+        victim.Portion = victim.frame_count() / taskFrameCount
+        victim.save(update_fields=["EndFrame", "Portion"])
+
+        print(f"Worker {worker.WorkerID} took frames {subtask.StartFrame}-{subtask.EndFrame} of task {victim.Task.TaskID} from worker {victim.Worker.WorkerID}")
+        return victim, subtask
+
+    @staticmethod
+    def speculate_subtasks(workers: List[Worker]) -> List[Subtask]:  # unsaved duplicates
+        """Duplicates the remaining frames of running subtasks of tasks that are nearly finished onto idle workers
+
+        A task qualifies once SPECULATION_THRESHOLD of its frames are rendered, at most SPECULATION_BUDGET duplicates
+        of its subtasks run at once. Subtasks that need longest get the fastest workers. The copy finishing first
+        wins, receive_result aborts and cancels the others.
+        """
+        threshold = getattr(settings, "SPECULATION_THRESHOLD", SPECULATION_THRESHOLD)
+        budget = getattr(settings, "SPECULATION_BUDGET", SPECULATION_BUDGET)
+
+        candidates = []  # (remaining seconds, subtask)
+        taskBudgets = {}  # TaskID_Int -> duplicates that may still be started
+        byTask = {}  # TaskID_Int -> running subtasks
+        running = Subtask.objects.filter(Stage=SubtaskStage.Running, Task__Stage=TaskStage.Rendering)
+        for subtask in running.select_for_update(skip_locked=True, of=("self",)).select_related("Task", "Worker"):
+            byTask.setdefault(subtask.Task_id, []).append(subtask)
+
+        for taskID, subtasks in byTask.items():
+            task = subtasks[0].Task
+            originals = [subtask for subtask in subtasks if (subtask.DuplicateOf_id is None)]
+            duplicated = {subtask.DuplicateOf_id for subtask in subtasks if (subtask.DuplicateOf_id is not None)}
+
+            if (task.get_rendered_frames().count() < task.frame_count() * threshold):
+                continue
+
+            taskBudgets[taskID] = budget - len(duplicated)
+            for subtask in originals:
+                if (subtask.SubtaskIndex in duplicated or subtask.frames_remaining() == 0):
+                    continue
+                rate = subtask.frame_rate()
+                candidates.append((subtask.frames_remaining() / rate if (rate is not None) else float("inf"), subtask))
+
+        duplicates = []
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        for _, original in candidates:
+            if (len(duplicates) == len(workers)):
+                break
+            if (taskBudgets[original.Task_id] <= 0):
+                continue
+            taskBudgets[original.Task_id] -= 1
+
+            worker = workers[len(duplicates)]
+            duplicate = Subtask(Task=original.Task, Worker=worker, StartFrame=original.next_frame(), EndFrame=original.EndFrame,
+                                Portion=0.0, Stage=SubtaskStage.Running, StartedAt=timezone.now(), DuplicateOf=original)  # progress is counted on the original
+            duplicates.append(duplicate)
+            print(f"Worker {worker.WorkerID} duplicates frames {duplicate.StartFrame}-{duplicate.EndFrame} of task {original.Task.TaskID} rendered by worker {original.Worker.WorkerID}")
+
+        return duplicates
 
 
     ### Methods for WorkerManager (Callbacks)
+    @staticmethod
+    def frame_rendered(subtask: Subtask, secondsPerFrame: float):
+        task = subtask.Task
+        worker = subtask.Worker
+        Chunker.observe(worker.WorkerID_Int, task.TaskID_Int, worker.PerformanceScore, secondsPerFrame)
+        if (task.CostFeatures is not None):
+            CostEstimator.observe(task.CostFeatures, secondsPerFrame, worker.PerformanceScore)
+
     @staticmethod
     def subtask_finished(task: RenderTask):
+        if (TaskStage(task.Stage) != TaskStage.Rendering):  # finished already, e.g. a late result of another subtask
+            return
+
         if not task.is_finished():
+            if (task.FramesAssigned and task.get_unassigned_frame_set()):  # frames the subtask didn't deliver, handed out again
+                task.FramesAssigned = False
+                task.save(update_fields=["FramesAssigned"])
+                FairShare.task_ready(task)
             return
 
         print(f"Task {task.TaskID} rendering finished")
         task.Stage = TaskStage.Concatenating
         task.save()
 
+        Chunker.forget(task.TaskID_Int)
+        CostEstimator.calibrate()
+
         ConcatManager.add_task(task)
 
     @staticmethod
-    def subtask_failed(subtask: Subtask):
-        pass
+    def subtask_failed(subtask: Optional[Subtask]):  # Worker didn't accept the subtask, even after retries
+        if (subtask is None):
+            return
+
+        # reassigned by the next pass, unless it finished, was aborted or moved to another worker in the meantime
+        running = Subtask.objects.filter(SubtaskIndex=subtask.SubtaskIndex, Stage=SubtaskStage.Running, Worker=subtask.Worker_id)
+        if not running.update(Stage=SubtaskStage.Pending):
+            return
+
+        worker = subtask.Worker
+        worker.Status = WorkerStatus.Disconnected  # unreachable, available again when it registers
+        worker.save(update_fields=["Status"])
+
+        TaskScheduler.wake()
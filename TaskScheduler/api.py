@@ -9,9 +9,13 @@ from django.conf import settings
 from .models import RenderTask
 from .serializers import RenderTaskSerializer
 from .TaskScheduler import TaskScheduler
+from .BlendFile import BlendFileParser
 import os
 
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
 class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return obj.CreatedBy == request.user
@@ -70,10 +74,41 @@ class RenderTaskViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Failed to initialize new task'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         taskID, filePath = taskInfo
+        parser = BlendFileParser()  # parses while uploading, no second pass over the file afterwards
+        accepted = True
         with open(filePath, "wb") as file:
-            file.write(request.body)
+            while accepted:
+                chunk = request.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                file.write(chunk)
+                accepted = parser.feed(chunk)
+
+        # Rejected uploads leave neither a task nor its folder behind
+        if not accepted:
+            TaskScheduler.discard_task(taskID)
+            return Response({'Error': 'Uploaded file is not a blend file'}, status=status.HTTP_400_BAD_REQUEST)
+
+        blendFile = parser.close()
+        if blendFile is None:
+            TaskScheduler.discard_task(taskID)
+            return Response({'Error': 'Failed to read uploaded blend file'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ?scene=<name> (repeatable) or ?scene=* renders several scenes from this upload, default is the current scene
+        sceneNames = request.query_params.getlist("scene")
+        if sceneNames:
+            scenes = blendFile.Scenes if ("*" in sceneNames) else [blendFile.get_scene(name) for name in sceneNames]
+            if (not scenes or None in scenes):
+                TaskScheduler.discard_task(taskID)
+                return Response({'Error': 'Unknown or unsupported scene selected'}, status=status.HTTP_400_BAD_REQUEST)
+
+            taskIDs = TaskScheduler.run_scene_tasks(taskID, scenes, blendFile.Statistics)
+            if taskIDs:
+                return Response({'Task-ID': taskIDs[0], 'Task-IDs': taskIDs}, status=status.HTTP_200_OK)
+            return Response({'Error': 'Failed to start task'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        success = TaskScheduler.run_task(taskID)
+        success = TaskScheduler.run_task(taskID, blendFile.CurrentScene, blendFile.Statistics)
         if success:
             return Response({'Task-ID': taskID}, status=status.HTTP_200_OK)
 
@@ -1,5 +1,6 @@
 from django.apps import AppConfig
 
+import atexit
 from threading import Thread
 
 class TaskschedulerConfig(AppConfig):
@@ -7,9 +8,19 @@ class TaskschedulerConfig(AppConfig):
     name = "TaskScheduler"
 
     def ready(self):
+        from django.conf import settings
+        from .BlendFile import SDNACache
+        SDNACache.Directory = getattr(settings, "SDNA_CACHE_DIR", None)
+
         from .TaskScheduler import TaskScheduler
         from WorkerManager.WorkerManager import WorkerManager
-        WorkerManager.set_callbacks(TaskScheduler.distribute_tasks, TaskScheduler.subtask_finished, TaskScheduler.subtask_failed)
+        WorkerManager.set_callbacks(TaskScheduler.wake, TaskScheduler.subtask_finished, TaskScheduler.subtask_failed,
+                                    TaskScheduler.frame_rendered)
+
+    def start_services(self):  # server process only, see boom.services
+        from .TaskScheduler import TaskScheduler
+        TaskScheduler.start_loop()
+        atexit.register(TaskScheduler.stop_loop)  # the pass running at exit finishes, its transaction isn't cut off
 
         from .ConcatManager import ConcatManager
-        Thread(target=ConcatManager.assign_tasks).start()
+        Thread(target=ConcatManager.assign_tasks, daemon=True).start()  # waits for tasks only
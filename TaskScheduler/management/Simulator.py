@@ -0,0 +1,512 @@
+import heapq
+import math
+import queue
+import random
+import statistics
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from threading import Thread
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from django.utils import timezone
+
+from ..BlendFile import ImageType
+from ..BlendFile import Scene as BlendFileScene
+from ..Chunker import Chunker
+from ..CostEstimator import CostEstimator, FEATURES, MIN_FRAME_COST
+from ..ConcatManager import ConcatManager
+from ..FairShare import FairShare
+from ..TaskScheduler import TaskScheduler, DEBOUNCE_SECONDS, IDLE_PASS_SECONDS
+from ..models import RenderTask, Subtask
+from WorkerManager.Enums import WorkerCommand
+from WorkerManager.Sender import MANAGER_THREAD_SLEEP_TIME, MAX_SENDER_THREADS, Sender, ThreadJob
+from WorkerManager.WorkerManager import WorkerManager, _int_to_id
+
+
+DAY = 86400
+
+
+class SimulatedClock:
+    """Time of the simulation, replaces django.utils.timezone.now and FairShare.clock while Simulator.run() runs"""
+    Start: datetime
+    Seconds: float  # since Start
+
+    def now(self) -> datetime:
+        return self.Start + timedelta(seconds=self.Seconds)
+
+    def monotonic(self) -> float:
+        return self.Seconds
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.Start = start or datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        self.Seconds = 0.0
+
+
+class FarmConfig:
+    """Parameters of a simulated farm and its load, all durations in seconds"""
+    Days: float = 7  # submissions stop after this, the simulation runs until all tasks are rendered or DrainDays passed
+    DrainDays: float = 7
+    Seed: int = 0
+
+    # Workers
+    Scores: List[int] = [4, 4, 2, 2, 2, 1, 1, 1]  # performance scores reported at registration
+    StragglerFraction: float = 0.1  # workers that are slower than their score claims
+    StragglerSlowdown: float = 3.0
+    FrameSigma: float = 0.2  # log-normal spread of single frame times
+    ColdStartSeconds: float = 120  # download and scene loading for a subtask of a task whose blend data the worker doesn't hold
+    WarmStartSeconds: float = 10  # blend data held already
+    CacheSize: int = 4  # blend data of this many tasks is kept per worker, least recently used is evicted
+    LatencySeconds: float = 0.05  # network latency of each request
+    FailureRate: float = 0.01  # probability a worker rejects a subtask
+    SenderThreads: bool = True  # requests go through the queue, slots and failure callback of the real Sender, else straight to the workers
+    DisconnectsPerDay: float = 0.5  # per worker
+    DowntimeSeconds: float = 1800  # mean time until a disconnected worker registers again
+
+    # Load
+    Users: int = 4
+    HeavyUserShare: float = 0.5  # fraction of submissions from the first user
+    TasksPerHour: float = 1.0
+    Diurnal: float = 0.5  # amplitude of the daily variation of the submission rate, 0 for constant
+    BurstProbability: float = 0.02  # a submission is a burst of BurstSize tasks at once
+    BurstSize: int = 10
+    FramesMean: float = 120  # log-normal frame count per task
+    FramesSigma: float = 0.8
+    ResolutionX: int = 3840
+    ResolutionY: int = 2160
+    SamplesMean: float = 256
+    EstimateSigma: float = 0.5  # log-normal error of the estimated frame cost, the true cost is what workers render
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            if not hasattr(FarmConfig, name):
+                raise ValueError(f"Unknown farm parameter {name}")
+            setattr(self, name, value)
+
+
+class FakeWorker:
+    Index: int
+    WorkerID: str
+    Score: int
+    Speed: float  # actual speed relative to the score, < 1 for stragglers
+    Online: bool
+    Subtask: Optional[Subtask]
+    EndFrame: int
+    NextFrame: int
+    Generation: int  # increased when the current work is given up, pending frame events of older generations are void
+    BusySince: Optional[float]
+    BusySeconds: float
+    OnlineSince: float
+    OnlineSeconds: float
+    Cached: OrderedDict  # TaskID_Int of the blend data held -> None, least recently used first, kept while offline
+
+    def __init__(self, index: int, score: int, speed: float):
+        self.Index = index
+        self.WorkerID = _int_to_id(index, "W-")
+        self.Score = score
+        self.Speed = speed
+        self.Online = False
+        self.Subtask = None
+        self.EndFrame = 0
+        self.NextFrame = 0
+        self.Generation = 0
+        self.BusySince = None
+        self.BusySeconds = 0.0
+        self.OnlineSince = 0.0
+        self.OnlineSeconds = 0.0
+        self.Cached = OrderedDict()
+
+    def cached_tasks_header(self) -> str:
+        return ", ".join(_int_to_id(taskID, "T-") for taskID in self.Cached)
+
+
+class Simulator:
+    """Discrete-event simulation of a render farm running the real TaskScheduler and WorkerManager code
+
+    Tasks are submitted through init_new_task/run_task, workers register and post every frame through the
+    WorkerManager views, scheduling passes are the real distribute_tasks. Only the edges are replaced: requests to
+    workers reach in-process fake workers, concatenation only records the finish time, wake-ups are debounced in
+    simulated time as the scheduler loop does, and the clock is simulated.
+    With Config.SenderThreads the requests pass the real Sender: rounds of Sender.check_threads run in simulated time
+    and only Sender.send, the HTTP request, is replaced, so rejected subtasks take the failure callback of the server.
+    Run it on a throwaway database, it creates users, workers and tasks and writes empty frame files.
+    """
+    Config: FarmConfig
+    Clock: SimulatedClock
+    Workers: List[FakeWorker]
+    events: List
+    sequence: int
+    passPending: bool
+    senderPending: bool
+    sent: List  # (subtask, slot, command) of the requests Sender started in the current round
+    requests: RequestFactory
+
+    # Metrics
+    Submitted: Dict[int, float]  # TaskID_Int -> seconds
+    FirstStarted: Dict[int, float]
+    Finished: Dict[int, float]
+    TaskUsers: Dict[int, int]
+    TaskWork: Dict[int, float]  # seconds on performance score 1 to render all frames once
+    UserWork: Dict[int, float]  # worker-seconds (on performance score 1) spent per user
+    FramesPosted: int
+    FramesNeeded: int
+    Passes: int
+
+    def __init__(self, config: FarmConfig):
+        self.Config = config
+        self.Clock = SimulatedClock()
+        self.arrivalRandom = random.Random(config.Seed)
+        self.workerRandom = random.Random(config.Seed + 1)
+        self.Workers = []
+        for index, score in enumerate(config.Scores):
+            straggler = self.workerRandom.random() < config.StragglerFraction
+            self.Workers.append(FakeWorker(index, score, 1 / config.StragglerSlowdown if straggler else 1.0))
+        self.events = []
+        self.sequence = 0
+        self.passPending = False
+        self.senderPending = False
+        self.sent = []
+        self.requests = RequestFactory()
+        self.baseWeights = {engine: weights.copy() for engine, weights in CostEstimator.Weights.items()}
+
+        self.Submitted = {}
+        self.FirstStarted = {}
+        self.Finished = {}
+        self.TaskUsers = {}
+        self.TaskWork = {}
+        self.TaskCosts: Dict[int, float] = {}  # true seconds per frame on performance score 1
+        self.TaskFrames: Dict[int, int] = {}
+        self.TaskPosted: Dict[int, int] = {}  # results posted, including duplicates and rejected ones
+        self.UserWork = {}
+        self.FramesPosted = 0
+        self.FramesNeeded = 0
+        self.ColdStarts = 0
+        self.WarmStarts = 0
+        self.Passes = 0
+
+    ### Event queue
+    def at(self, seconds: float, action: Callable, *args):
+        heapq.heappush(self.events, (seconds, self.sequence, action, args))
+        self.sequence += 1
+
+    def after(self, seconds: float, action: Callable, *args):
+        self.at(self.Clock.Seconds + seconds, action, *args)
+
+    def run(self) -> Dict:
+        config = self.Config
+        patches = [
+            mock.patch.object(timezone, "now", self.Clock.now),
+            mock.patch.object(FairShare, "clock", self.Clock.monotonic),
+            mock.patch.object(TaskScheduler, "wake", self.request_pass),
+            mock.patch.object(ConcatManager, "add_task", self.task_rendered),
+            mock.patch.object(WorkerManager, "freeWorkerCallback", self.request_pass),
+            mock.patch.object(WorkerManager, "subtaskFinishedCallback", TaskScheduler.subtask_finished),
+            mock.patch.object(WorkerManager, "subtaskFailedCallback", TaskScheduler.subtask_failed),
+            mock.patch.object(WorkerManager, "frameRenderedCallback", TaskScheduler.frame_rendered),
+        ]
+        if config.SenderThreads:
+            addTask, cancelTask = Sender.add_task, Sender.cancel_task
+            patches += [
+                mock.patch.object(Sender, "threads", [ThreadJob(Thread(), None) for i in range(MAX_SENDER_THREADS)]),
+                mock.patch.object(Sender, "taskQueue", queue.Queue()),
+                mock.patch.object(Sender, "canceledTasks", set()),
+                mock.patch.object(Sender, "sendingFailedCallback", WorkerManager.sending_failed),
+                mock.patch.object(Sender, "add_task", lambda *args: (addTask(*args), self.request_sender_round())),
+                mock.patch.object(Sender, "cancel_task", lambda subtask: (cancelTask(subtask), self.request_sender_round())),
+                mock.patch.object(Sender, "send", self.send),
+            ]
+        else:
+            patches += [
+                mock.patch.object(Sender, "add_task", self.deliver),
+                mock.patch.object(Sender, "cancel_task", lambda subtask: self.deliver(subtask, WorkerCommand.CancelTask)),
+            ]
+        for patch in patches:
+            patch.start()
+        FairShare.reset()
+        Chunker.WorkerFrameTimes.clear()
+        Chunker.TaskFrameCosts.clear()
+        CostEstimator.observations.clear()
+
+        try:
+            self.Users = [User.objects.create(username=f"simulated-{i}").id for i in range(config.Users)]
+            for worker in self.Workers:
+                self.at(self.workerRandom.uniform(0, 60), self.connect, worker)
+            self.at(self.next_arrival(0.0), self.arrive)
+            self.at(IDLE_PASS_SECONDS, self.idle_pass)
+
+            end = (config.Days + config.DrainDays) * DAY
+            while self.events:
+                seconds, _, action, args = heapq.heappop(self.events)
+                if (seconds > end):
+                    break
+                if (seconds > config.Days * DAY and len(self.Finished) == len(self.Submitted) and action != self.arrive):
+                    break  # everything submitted is rendered
+                self.Clock.Seconds = seconds
+                action(*args)
+        finally:
+            for patch in reversed(patches):
+                patch.stop()
+            CostEstimator.Weights = self.baseWeights  # calibrated on simulated frame times
+
+        return self.report()
+
+    ### Scheduler edges
+    def request_pass(self):  # debounced like the scheduler loop
+        if not self.passPending:
+            self.passPending = True
+            self.after(DEBOUNCE_SECONDS, self.scheduling_pass)
+
+    def scheduling_pass(self):
+        self.passPending = False
+        self.Passes += 1
+        TaskScheduler.distribute_tasks()
+
+    def idle_pass(self):
+        self.request_pass()
+        self.after(IDLE_PASS_SECONDS, self.idle_pass)
+
+    def deliver(self, subtask: Subtask, command: WorkerCommand = WorkerCommand.StartTask):  # replaces Sender.add_task
+        worker = self.Workers[subtask.Worker_id]
+        if (command == WorkerCommand.StartTask and not self.accepts(worker)):
+            WorkerManager.sending_failed(subtask)  # as the Sender after its retries
+            self.disconnect(worker)  # unreachable, registers again after its downtime
+            return
+        self.after(self.Config.LatencySeconds, self.receive_command, worker, subtask, command)
+
+    def accepts(self, worker: FakeWorker) -> bool:  # the worker is reachable and takes the subtask
+        return worker.Online and self.workerRandom.random() >= self.Config.FailureRate
+
+    ### Real Sender (Config.SenderThreads)
+    def request_sender_round(self):  # the manager thread polls every MANAGER_THREAD_SLEEP_TIME
+        if not self.senderPending:
+            self.senderPending = True
+            self.after(MANAGER_THREAD_SLEEP_TIME, self.sender_round)
+
+    def sender_round(self):
+        self.senderPending = False
+        Sender.check_threads()  # reports the failures of the last round, starts queued requests
+        for job in Sender.threads:
+            if job.Thread.is_alive():
+                job.Thread.join()  # only records the request, the simulation decides below in slot order
+
+        sent, self.sent = sorted(self.sent, key=lambda request: request[1]), []
+        for subtask, slot, command in sent:
+            worker = self.Workers[subtask.Worker_id]
+            success = self.accepts(worker) if (command == WorkerCommand.StartTask) else worker.Online
+            Sender.threads[slot].Done = success
+            if success:
+                self.after(self.Config.LatencySeconds, self.receive_command, worker, subtask, command)
+            elif (command == WorkerCommand.StartTask):
+                self.disconnect(worker)  # unreachable, registers again after its downtime
+
+        if (sent or not Sender.taskQueue.empty()):  # failures are reported and the queue is drained by the next round
+            self.request_sender_round()
+
+    def send(self, subtask: Subtask, threadIndex: int, command: WorkerCommand = WorkerCommand.StartTask):  # replaces Sender.send, runs on its thread
+        self.sent.append((subtask, threadIndex, command))
+
+    def task_rendered(self, task: RenderTask):  # replaces ConcatManager.add_task
+        self.Finished[task.TaskID_Int] = self.Clock.Seconds
+
+    ### Load
+    def next_arrival(self, seconds: float) -> float:  # non-homogeneous Poisson process by thinning
+        config = self.Config
+        peakRate = config.TasksPerHour * (1 + config.Diurnal) / 3600
+        while True:
+            seconds += self.arrivalRandom.expovariate(peakRate)
+            rate = config.TasksPerHour * (1 + config.Diurnal * math.sin(2 * math.pi * seconds / DAY)) / 3600
+            if (self.arrivalRandom.random() * peakRate <= rate):
+                return seconds
+
+    def arrive(self):
+        config = self.Config
+        if (self.Clock.Seconds > config.Days * DAY):
+            return
+
+        heavy = self.arrivalRandom.random() < config.HeavyUserShare or config.Users == 1
+        user = self.Users[0] if heavy else self.arrivalRandom.choice(self.Users[1:])
+        count = config.BurstSize if (self.arrivalRandom.random() < config.BurstProbability) else 1
+        for _ in range(count):
+            self.submit(user)
+
+        self.at(self.next_arrival(self.Clock.Seconds), self.arrive)
+
+    def submit(self, user: int):
+        config = self.Config
+        frames = max(int(self.arrivalRandom.lognormvariate(math.log(config.FramesMean), config.FramesSigma)), 1)
+        scene = BlendFileScene("Scene", 1, frames, 1, ImageType.PNG.value)
+        scene.ResolutionX, scene.ResolutionY, scene.ResolutionPercentage = config.ResolutionX, config.ResolutionY, 100
+        scene.Engine = "BLENDER_EEVEE"
+        scene.Samples = max(int(self.arrivalRandom.lognormvariate(math.log(config.SamplesMean), 0.5)), 1)
+
+        taskID, _ = TaskScheduler.init_new_task(User.objects.get(id=user))
+        TaskScheduler.run_task(taskID, scene)
+        task = RenderTask.objects.get(TaskID=taskID)
+
+        # the estimator learns from the results, the true cost keeps the weights it started with plus an error per task
+        features = task.CostFeatures
+        trueCost = sum(weight * features[name] for weight, name in zip(self.baseWeights[features["Engine"]], FEATURES))
+        trueCost = max(trueCost, MIN_FRAME_COST) * self.arrivalRandom.lognormvariate(0, config.EstimateSigma)
+        self.TaskCosts[task.TaskID_Int] = trueCost
+        self.TaskWork[task.TaskID_Int] = trueCost * frames
+        self.TaskUsers[task.TaskID_Int] = user
+        self.Submitted[task.TaskID_Int] = self.Clock.Seconds
+        self.TaskFrames[task.TaskID_Int] = frames
+        self.FramesNeeded += frames
+
+    ### Fake workers
+    def connect(self, worker: FakeWorker):
+        worker.Online = True
+        worker.OnlineSince = self.Clock.Seconds
+        request = self.requests.get("/register/", headers={"Worker-Id": worker.WorkerID, "Host": "localhost", "Port": str(9000 + worker.Index),
+                                                            "Performance-Score": str(worker.Score), "Cached-Tasks": worker.cached_tasks_header()})
+        WorkerManager.register(request)
+
+        if (self.Config.DisconnectsPerDay > 0):
+            self.after(self.workerRandom.expovariate(self.Config.DisconnectsPerDay / DAY), self.disconnect, worker)
+
+    def disconnect(self, worker: FakeWorker):
+        if not worker.Online:
+            return
+        self.stop(worker)
+        worker.Online = False
+        worker.OnlineSeconds += self.Clock.Seconds - worker.OnlineSince
+        self.after(self.workerRandom.expovariate(1 / self.Config.DowntimeSeconds), self.connect, worker)
+
+    def stop(self, worker: FakeWorker):
+        if (worker.BusySince is not None):
+            busy = self.Clock.Seconds - worker.BusySince
+            worker.BusySeconds += busy
+            user = self.TaskUsers.get(worker.Subtask.Task_id)
+            self.UserWork[user] = self.UserWork.get(user, 0.0) + busy * worker.Score
+        worker.BusySince = None
+        worker.Subtask = None
+        worker.Generation += 1
+
+    def receive_command(self, worker: FakeWorker, subtask: Subtask, command: WorkerCommand):
+        current = worker.Subtask is not None and worker.Subtask.SubtaskIndex == subtask.SubtaskIndex
+        if (command == WorkerCommand.CancelTask):
+            if current:
+                self.stop(worker)
+            return
+
+        if (command == WorkerCommand.UpdateTask):
+            if current:
+                worker.EndFrame = subtask.EndFrame
+            return
+
+        if not worker.Online:
+            return  # disconnected while the request was under way
+
+        self.stop(worker)  # a worker renders one subtask at a time
+        worker.Subtask = subtask
+        worker.EndFrame = subtask.EndFrame
+        worker.NextFrame = subtask.StartFrame
+        worker.BusySince = self.Clock.Seconds
+        self.FirstStarted.setdefault(subtask.Task_id, self.Clock.Seconds)
+
+        dataTaskID = subtask.Task.get_blender_data_task_id()
+        warm = dataTaskID in worker.Cached
+        if warm:
+            self.WarmStarts += 1
+            worker.Cached.move_to_end(dataTaskID)
+            setup = self.Config.WarmStartSeconds
+        else:
+            self.ColdStarts += 1
+            worker.Cached[dataTaskID] = None
+            while (len(worker.Cached) > self.Config.CacheSize):
+                worker.Cached.popitem(last=False)
+            setup = self.Config.ColdStartSeconds
+            request = self.requests.get("/heartbeat/", headers={"Worker-Id": worker.WorkerID, "Cached-Tasks": worker.cached_tasks_header()})
+            WorkerManager.heartbeat(request)  # after the download, reports the eviction too
+        self.after(setup + self.frame_seconds(worker), self.frame_rendered, worker, worker.Generation)
+
+    def frame_seconds(self, worker: FakeWorker) -> float:
+        cost = self.TaskCosts.get(worker.Subtask.Task_id, 1.0) / (worker.Score * worker.Speed)
+        return cost * self.workerRandom.lognormvariate(0, self.Config.FrameSigma)
+
+    def frame_rendered(self, worker: FakeWorker, generation: int):
+        if (generation != worker.Generation):
+            return  # canceled, replaced or disconnected meanwhile
+
+        subtask = worker.Subtask
+        request = self.requests.post("/post-render-result/", data=b"", content_type="application/octet-stream",
+                                     headers={"Worker-Id": worker.WorkerID, "Task-Id": subtask.Task.TaskID,
+                                              "Subtask-Index": str(subtask.SubtaskIndex), "Frame": str(worker.NextFrame)})
+        response = WorkerManager.receive_result(request)
+        self.FramesPosted += 1
+        self.TaskPosted[subtask.Task_id] = self.TaskPosted.get(subtask.Task_id, 0) + 1
+
+        worker.NextFrame += subtask.Task.FrameStep
+        if (response.status_code != 200 or worker.NextFrame > worker.EndFrame):
+            self.stop(worker)
+            return
+        self.after(self.frame_seconds(worker), self.frame_rendered, worker, worker.Generation)
+
+    ### Report
+    def report(self) -> Dict:
+        now = self.Clock.Seconds
+        for worker in self.Workers:
+            if worker.Online:
+                self.stop(worker)
+                worker.OnlineSeconds += now - worker.OnlineSince
+                worker.Online = False
+
+        finished = [taskID for taskID in self.Submitted if (taskID in self.Finished)]
+        waits = [self.FirstStarted[taskID] - self.Submitted[taskID] for taskID in self.Submitted if (taskID in self.FirstStarted)]
+        turnarounds = {taskID: self.Finished[taskID] - self.Submitted[taskID] for taskID in finished}
+
+        # stretch: turnaround relative to rendering the task alone on the whole farm
+        capacity = sum(worker.Score * worker.Speed for worker in self.Workers)
+        stretches: Dict[int, List[float]] = {}
+        for taskID, turnaround in turnarounds.items():
+            stretches.setdefault(self.TaskUsers[taskID], []).append(turnaround / (self.TaskWork[taskID] / capacity))
+        userStretches = [statistics.mean(values) for values in stretches.values()]
+
+        users = {}
+        for user in self.Users:
+            tasks = [taskID for taskID in self.Submitted if (self.TaskUsers[taskID] == user)]
+            userWaits = [self.FirstStarted[taskID] - self.Submitted[taskID] for taskID in tasks if (taskID in self.FirstStarted)]
+            users[user] = {
+                "Tasks": len(tasks),
+                "Finished": sum(1 for taskID in tasks if (taskID in self.Finished)),
+                "MeanWait": statistics.mean(userWaits) if userWaits else None,
+                "MeanStretch": statistics.mean(stretches[user]) if (user in stretches) else None,
+                "WorkerHours": self.UserWork.get(user, 0.0) / 3600,
+            }
+
+        onlineSeconds = sum(worker.OnlineSeconds for worker in self.Workers)
+        return {
+            "SimulatedDays": now / DAY,
+            "Tasks": len(self.Submitted),
+            "Finished": len(finished),
+            "Makespan": (max(self.Finished.values()) - min(self.Submitted.values())) if finished else None,
+            "Utilization": sum(worker.BusySeconds for worker in self.Workers) / onlineSeconds if onlineSeconds else 0.0,
+            "MeanWait": statistics.mean(waits) if waits else None,
+            "P95Wait": Simulator.percentile(waits, 0.95),
+            "MeanTurnaround": statistics.mean(turnarounds.values()) if turnarounds else None,
+            "P95Turnaround": Simulator.percentile(list(turnarounds.values()), 0.95),
+            "Fairness": Simulator.jain_index(userStretches),  # 1 if all users wait equally long relative to their work
+            "FramesPosted": self.FramesPosted,
+            "FramesNeeded": self.FramesNeeded,
+            "WastedFrames": sum(self.TaskPosted.get(taskID, 0) - self.TaskFrames[taskID] for taskID in finished),  # duplicates and rejected frames
+            "Passes": self.Passes,
+            "ColdStarts": self.ColdStarts,  # subtasks that downloaded the blend data
+            "WarmStarts": self.WarmStarts,
+            "Users": users,
+        }
+
+    @staticmethod
+    def percentile(values: List[float], fraction: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    @staticmethod
+    def jain_index(values: List[float]) -> Optional[float]:
+        if not values:
+            return None
+        return sum(values) ** 2 / (len(values) * sum(value * value for value in values))
@@ -0,0 +1,176 @@
+import json
+import multiprocessing
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from django.core.management.base import BaseCommand
+
+from TaskScheduler.BlendFile import BlendFile, Compression, Scene
+from TaskScheduler.CostEstimator import CostEstimator
+
+# Models are imported in handle() only: the spawned worker processes import this module without a configured Django
+
+
+TASK_ID_PATTERN = re.compile(r"T-[0-9a-fA-F]{4}_[0-9a-fA-F]{4}_[0-9a-fA-F]{4}_[0-9a-fA-F]{4}")
+BACKFILL_BATCH_SIZE = 500
+
+
+def _init_worker():
+    sys.stdout = sys.stderr  # BlendFile reports errors with print, stdout carries the JSON lines
+
+
+def inspect_file(path: str) -> Dict:  # runs in a worker process, the result must be picklable
+    result = {"Path": path, "Error": None}
+    try:
+        with open(path, "rb") as file:
+            result["Compression"] = Compression.detect(file.read(4)).name
+    except OSError as ex:
+        result["Error"] = str(ex)
+        return result
+
+    blendFile = BlendFile.read(path)
+    if (blendFile is None):
+        result["Error"] = "Failed to read blend file"
+        return result
+
+    statistics = blendFile.get_block_statistics()
+    result.update({
+        "Version": blendFile.Header.Version,
+        "PointerSize": blendFile.Header.PointerSize,
+        "Endianness": blendFile.Header.Endianness.value,
+        "CurrentScene": blendFile.CurrentScene.Name,
+        "Scenes": blendFile.Scenes,
+        "CostFeatures": [CostEstimator.features(scene, statistics) for scene in blendFile.Scenes],
+    })
+    return result
+
+
+class Command(BaseCommand):
+    help = "Reads blend files in parallel and prints one JSON line per file, optionally back-filling RenderTask metadata"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="blend files or folders searched recursively (default: all task folders)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+        parser.add_argument("--chunksize", type=int, default=4, help="files handed to a worker process at once")
+        parser.add_argument("--backfill", action="store_true", help="fill empty RenderTask fields from the blend files in task folders")
+
+    @staticmethod
+    def find_files(paths: List[str]) -> Iterator[str]:
+        for path in paths:
+            if os.path.isfile(path):
+                yield os.path.abspath(path)
+                continue
+
+            for directory, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.endswith(".blend"):
+                        yield os.path.abspath(os.path.join(directory, filename))
+
+    @staticmethod
+    def task_id_from_path(path: str) -> Optional[str]:  # tasks/<TaskID>/blenderdata.blend
+        folder = os.path.basename(os.path.dirname(path))
+        if (os.path.basename(path).startswith("blenderdata") and TASK_ID_PATTERN.fullmatch(folder)):
+            return folder
+        return None
+
+    @staticmethod
+    def scene_to_json(scene: Scene, features: Dict) -> Dict:
+        from TaskScheduler.Enums import RenderOutputType
+
+        return {
+            "Name": scene.Name,
+            "StartFrame": scene.StartFrame,
+            "EndFrame": scene.EndFrame,
+            "FrameStep": scene.FrameStep,
+            "OutputType": RenderOutputType.from_scene(scene).label,
+            "ResolutionX": scene.ResolutionX,
+            "ResolutionY": scene.ResolutionY,
+            "ResolutionPercentage": scene.ResolutionPercentage,
+            "FPS": scene.FPS,
+            "Engine": scene.Engine,
+            "Samples": scene.Samples,
+            "EstimatedFrameCost": CostEstimator.estimate(features),
+        }
+
+    def handle(self, *args, **options):
+        from TaskScheduler.models import RenderTask
+
+        paths = options["paths"] or [os.path.abspath("tasks/")]
+        files = list(self.find_files(paths))
+        self.stderr.write(f"Inspecting {len(files)} blend files with {options['workers']} processes")
+
+        tasks: Dict[str, RenderTask] = {}
+        if options["backfill"]:
+            taskIDs = [taskID for taskID in map(self.task_id_from_path, files) if (taskID is not None)]
+            tasks = {task.TaskID: task for task in RenderTask.objects.filter(TaskID__in=taskIDs)}
+
+        pending: List[RenderTask] = []
+        updatedFields = set()
+        failed = 0
+        context = multiprocessing.get_context("spawn")  # no forking of the server threads and database connections
+        with ProcessPoolExecutor(max_workers=options["workers"], mp_context=context, initializer=_init_worker) as executor:
+            for result in executor.map(inspect_file, files, chunksize=options["chunksize"]):  # in order, as soon as available
+                taskID = self.task_id_from_path(result["Path"])
+                line = {"Path": result["Path"], "TaskID": taskID, "Compression": result.get("Compression"), "Error": result["Error"]}
+                if (result["Error"] is None):
+                    scenes = result["Scenes"]
+                    line.update({
+                        "Version": result["Version"],
+                        "PointerSize": result["PointerSize"],
+                        "Endianness": result["Endianness"],
+                        "CurrentScene": result["CurrentScene"],
+                        "Scenes": [self.scene_to_json(scene, features) for scene, features in zip(scenes, result["CostFeatures"])],
+                    })
+                else:
+                    failed += 1
+
+                self.stdout.write(json.dumps(line))
+
+                if (options["backfill"] and taskID is not None and result["Error"] is None):
+                    task = self.backfill(tasks.get(taskID), result, updatedFields)
+                    if (task is not None):
+                        pending.append(task)
+                    if (len(pending) >= BACKFILL_BATCH_SIZE):
+                        RenderTask.objects.bulk_update(pending, list(updatedFields))
+                        pending = []
+
+        if pending:
+            RenderTask.objects.bulk_update(pending, list(updatedFields))
+
+        self.stderr.write(f"Done, {failed} of {len(files)} files could not be read")
+
+    @staticmethod
+    def backfill(task, result: Dict, updatedFields: set):  # fills fields that are still empty, returns the task if any changed
+        from TaskScheduler.Enums import RenderOutputType
+
+        if (task is None):
+            return None
+
+        sceneName = task.SceneName or result["CurrentScene"]
+        index = next((i for i, scene in enumerate(result["Scenes"]) if (scene.Name == sceneName)), None)
+        if (index is None):
+            return None
+
+        scene = result["Scenes"][index]
+        features = result["CostFeatures"][index]
+        values = {
+            "StartFrame": scene.StartFrame,
+            "EndFrame": scene.EndFrame,
+            "FrameStep": scene.FrameStep,
+            "OutputType": RenderOutputType.from_scene(scene),
+            "SceneName": scene.Name,
+            "CostFeatures": features,
+            "EstimatedFrameCost": CostEstimator.estimate(features),
+        }
+
+        changed = False
+        for field, value in values.items():
+            if (getattr(task, field) is None):
+                setattr(task, field, value)
+                updatedFields.add(field)
+                changed = True
+
+        return task if changed else None
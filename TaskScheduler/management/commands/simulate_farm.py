@@ -0,0 +1,92 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from TaskScheduler.management.Simulator import FarmConfig, Simulator
+
+
+class Command(BaseCommand):
+    help = "Simulates a render farm with fake workers against the real scheduler on a throwaway database and reports makespan, utilization, queue wait and fairness"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=FarmConfig.Days, help="simulated days of submissions")
+        parser.add_argument("--drain-days", type=float, default=FarmConfig.DrainDays, help="simulated days to finish the submitted tasks afterwards at most")
+        parser.add_argument("--seed", type=int, default=FarmConfig.Seed)
+        parser.add_argument("--workers", type=int, nargs="+", default=FarmConfig.Scores, metavar="SCORE", help="performance score of each worker")
+        parser.add_argument("--straggler-fraction", type=float, default=FarmConfig.StragglerFraction, help="fraction of workers slower than their score")
+        parser.add_argument("--straggler-slowdown", type=float, default=FarmConfig.StragglerSlowdown)
+        parser.add_argument("--frame-sigma", type=float, default=FarmConfig.FrameSigma, help="log-normal spread of frame times")
+        parser.add_argument("--cold-start-seconds", type=float, default=FarmConfig.ColdStartSeconds, help="download and loading time of a subtask without cached blend data")
+        parser.add_argument("--warm-start-seconds", type=float, default=FarmConfig.WarmStartSeconds, help="start time of a subtask with cached blend data")
+        parser.add_argument("--cache-size", type=int, default=FarmConfig.CacheSize, help="tasks whose blend data a worker keeps")
+        parser.add_argument("--failure-rate", type=float, default=FarmConfig.FailureRate, help="probability a worker rejects a subtask")
+        parser.add_argument("--direct-sending", action="store_true", help="hand requests to the workers directly instead of through the Sender queue and threads")
+        parser.add_argument("--disconnects-per-day", type=float, default=FarmConfig.DisconnectsPerDay, help="per worker")
+        parser.add_argument("--downtime-seconds", type=float, default=FarmConfig.DowntimeSeconds, help="mean time until a disconnected worker returns")
+        parser.add_argument("--users", type=int, default=FarmConfig.Users)
+        parser.add_argument("--heavy-user-share", type=float, default=FarmConfig.HeavyUserShare, help="fraction of submissions from the first user")
+        parser.add_argument("--tasks-per-hour", type=float, default=FarmConfig.TasksPerHour)
+        parser.add_argument("--diurnal", type=float, default=FarmConfig.Diurnal, help="amplitude of the daily variation of submissions, 0 to 1")
+        parser.add_argument("--burst-probability", type=float, default=FarmConfig.BurstProbability)
+        parser.add_argument("--burst-size", type=int, default=FarmConfig.BurstSize)
+        parser.add_argument("--frames-mean", type=float, default=FarmConfig.FramesMean, help="median frame count of a task")
+        parser.add_argument("--estimate-sigma", type=float, default=FarmConfig.EstimateSigma, help="log-normal error of the estimated frame cost")
+        parser.add_argument("--json", action="store_true", help="print the report as JSON")
+        parser.add_argument("--verbose", action="store_true", help="keep the output of the scheduler")
+
+    def handle(self, *args, **options):
+        config = FarmConfig(
+            Days=options["days"], DrainDays=options["drain_days"], Seed=options["seed"], Scores=options["workers"],
+            StragglerFraction=options["straggler_fraction"], StragglerSlowdown=options["straggler_slowdown"],
+            FrameSigma=options["frame_sigma"], ColdStartSeconds=options["cold_start_seconds"],
+            WarmStartSeconds=options["warm_start_seconds"], CacheSize=options["cache_size"], FailureRate=options["failure_rate"],
+            SenderThreads=not options["direct_sending"],
+            DisconnectsPerDay=options["disconnects_per_day"], DowntimeSeconds=options["downtime_seconds"],
+            Users=options["users"], HeavyUserShare=options["heavy_user_share"], TasksPerHour=options["tasks_per_hour"],
+            Diurnal=options["diurnal"], BurstProbability=options["burst_probability"], BurstSize=options["burst_size"],
+            FramesMean=options["frames_mean"], EstimateSigma=options["estimate_sigma"],
+        )
+
+        # Tasks, workers and frame files go to a test database and a temporary folder
+        testDatabase = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        workingDirectory = os.getcwd()
+        started = time.perf_counter()
+        try:
+            os.chdir(tempfile.mkdtemp(prefix="simulate_farm_"))
+            output = contextlib.nullcontext() if options["verbose"] else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                report = Simulator(config).run()
+        finally:
+            os.chdir(workingDirectory)
+            connection.creation.destroy_test_db(testDatabase, verbosity=0)
+        report["WallSeconds"] = time.perf_counter() - started
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.print_report(report)
+
+    def print_report(self, report):
+        def duration(seconds):
+            return "-" if (seconds is None) else f"{seconds / 3600:.2f} h"
+
+        self.stdout.write(f"Simulated {report['SimulatedDays']:.2f} days in {report['WallSeconds']:.1f} s, {report['Passes']} scheduling passes")
+        self.stdout.write(f"Tasks:        {report['Finished']} of {report['Tasks']} finished")
+        self.stdout.write(f"Makespan:     {duration(report['Makespan'])}")
+        self.stdout.write(f"Utilization:  {report['Utilization'] * 100:.1f} %")
+        self.stdout.write(f"Queue wait:   mean {duration(report['MeanWait'])}, p95 {duration(report['P95Wait'])}")
+        self.stdout.write(f"Turnaround:   mean {duration(report['MeanTurnaround'])}, p95 {duration(report['P95Turnaround'])}")
+        fairness = "-" if (report["Fairness"] is None) else f"{report['Fairness']:.3f}"
+        self.stdout.write(f"Fairness:     {fairness} (Jain's index of the mean stretch per user)")
+        self.stdout.write(f"Frames:       {report['FramesPosted']} posted for {report['FramesNeeded']}, {report['WastedFrames']} wasted")
+        self.stdout.write(f"Subtasks:     {report['ColdStarts']} downloaded the blend data, {report['WarmStarts']} had it cached")
+        for user, values in report["Users"].items():
+            stretch = "-" if (values["MeanStretch"] is None) else f"{values['MeanStretch']:.1f}"
+            self.stdout.write(f"  User {user}: {values['Finished']} of {values['Tasks']} tasks, wait {duration(values['MeanWait'])}, "
+                              f"stretch {stretch}, {values['WorkerHours']:.1f} worker-hours")
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0003_alter_subtask_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendertask',
+            name='BlenderDataTask',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='SceneTask_set', to='TaskScheduler.rendertask'),
+        ),
+        migrations.AddField(
+            model_name='rendertask',
+            name='SceneName',
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0004_rendertask_scenename_blenderdatatask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendertask',
+            name='CostFeatures',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rendertask',
+            name='EstimatedFrameCost',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0005_rendertask_estimatedframecost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtask',
+            name='StartedAt',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
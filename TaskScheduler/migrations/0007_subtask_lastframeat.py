@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0006_subtask_startedat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtask',
+            name='LastFrameAt',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0007_subtask_lastframeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtask',
+            name='DuplicateOf',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='Duplicate_set', to='TaskScheduler.subtask'),
+        ),
+    ]
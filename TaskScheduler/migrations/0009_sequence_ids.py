@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0008_subtask_duplicateof'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendertask',
+            name='FramesAssigned',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='rendertask',
+            name='TaskID',
+            field=models.CharField(max_length=21, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='rendertask',
+            name='TaskID_Int',
+            field=models.BigAutoField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='subtask',
+            name='SubtaskIndex',
+            field=models.BigAutoField(primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+def fill_rendered_frames(apps, schema_editor):
+    # Tasks started before the bitmap: finished subtasks delivered all frames, others up to LastestFrame
+    # Encoding as in FrameBitmap at the time of this migration: bit i is bit i % 8 of byte i // 8
+    RenderTask = apps.get_model("TaskScheduler", "RenderTask")
+    for task in RenderTask.objects.exclude(StartFrame=None):
+        frameCount = (task.EndFrame - task.StartFrame) // task.FrameStep + 1
+        rendered = bytearray((frameCount + 7) // 8)
+        for startFrame, endFrame, lastestFrame, stage in task.Subtask_set.values_list("StartFrame", "EndFrame", "LastestFrame", "Stage"):
+            lastFrame = endFrame if (stage == "3-FIN" or task.Stage >= "5-CON") else lastestFrame
+            if (lastFrame is None):
+                continue
+            for frame in range(startFrame, lastFrame + 1, task.FrameStep):
+                index = (frame - task.StartFrame) // task.FrameStep
+                rendered[index >> 3] |= 1 << (index & 7)
+        task.RenderedFrames = bytes(rendered)
+        task.save(update_fields=["RenderedFrames"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('TaskScheduler', '0009_sequence_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendertask',
+            name='RenderedFrames',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(fill_rendered_frames, migrations.RunPython.noop),
+    ]
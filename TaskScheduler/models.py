@@ -1,22 +1,35 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 import os
 import shutil
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 
 # Same Django app
-from .BlendFile import BlendFile
+from .BlendFile import BlendFile, BlockStatistics
+from .BlendFile import Scene as BlendFileScene
+from .CostEstimator import CostEstimator
+from .FrameBitmap import FrameBitmap
+from .FrameSet import FrameSet
 from .Enums import BlenderDataType, RenderOutputType, TaskStage, SubtaskStage
 
 # Different Django app
 from WorkerManager.models import Worker  # must be path from perspective of folder manage.py lies in
 # -> different approach: pass class name to foreign key fields
 
+
+# Duplicate in WorkerManager/WorkerManager.py
+def _int_to_id(value: int, prefix: str) -> str:
+    hex_string = format(value, 'x')
+    hex_string = hex_string.zfill(16)
+    formatted_hex = '_'.join(hex_string[i:i + 4] for i in range(0, len(hex_string), 4))
+    return f"{prefix}{formatted_hex}"
+
+
 class RenderTask(models.Model):
-    TaskID_Int          = models.PositiveSmallIntegerField(primary_key=True)
-    TaskID              = models.CharField(max_length=21, unique=True)  # for development
+    TaskID_Int          = models.BigAutoField(primary_key=True)  # from the database sequence, unique across processes
+    TaskID              = models.CharField(max_length=21, unique=True, null=True)  # for development, set right after the insert
     FileServerAddress   = models.URLField()
     FileServerPort      = models.PositiveIntegerField()  # PositiveSmallIntegerField not possible as range is 0-32k
     DataType            = models.CharField(max_length=5, choices=BlenderDataType)
@@ -24,7 +37,18 @@ class RenderTask(models.Model):
     StartFrame          = models.PositiveIntegerField(null=True)
     EndFrame            = models.PositiveIntegerField(null=True)
     FrameStep           = models.PositiveIntegerField(null=True)
+    SceneName           = models.CharField(max_length=64, null=True)  # Blender limits names to 63 bytes
     Stage               = models.CharField(max_length=5, choices=TaskStage)
+    FramesAssigned      = models.BooleanField(default=False)  # every frame is covered by a subtask, nothing left to hand out
+    RenderedFrames      = models.BinaryField(null=True)  # FrameBitmap of the frames received, set in complete()
+
+    # Render cost, seconds per frame on a worker with performance score 1 (see CostEstimator)
+    EstimatedFrameCost  = models.FloatField(null=True)
+    CostFeatures        = models.JSONField(null=True)  # input of the estimate, kept for calibration
+
+    # Task whose upload contains the blend data, null if uploaded for this task
+    # Set for further scenes rendered from one uploaded file
+    BlenderDataTask     = models.ForeignKey("self", null=True, blank=True, default=None, on_delete=models.CASCADE, related_name="SceneTask_set")
 
     # Metadata
     CreatedBy          = models.ForeignKey(User, null=True, blank=True, default=None, on_delete=models.CASCADE)
@@ -42,60 +66,66 @@ class RenderTask(models.Model):
         return os.path.abspath(f"tasks/{self.TaskID}/")
 
     def get_blender_data_path(self) -> str:
+        if (self.BlenderDataTask is not None):
+            return self.BlenderDataTask.get_blender_data_path()
+
         filename = "blenderdata." + ("blend" if (self.DataType == BlenderDataType.SingleFile) else "zip")
         return f"{self.get_folder()}/{filename}"
 
+    def get_blender_data_task_id(self) -> int:  # task the uploaded blend data belongs to, the key of Worker.CachedTasks
+        return self.TaskID_Int if (self.BlenderDataTask_id is None) else self.BlenderDataTask_id
+
     def get_result_path(self) -> str:
         extension = ".zip" if (BlenderDataType(self.DataType) == BlenderDataType.SingleFile) else RenderOutputType(self.OutputType).get_extension()
         return f"{self.get_folder()}/output{extension}"
 
 
-    def get_all_frames(self) -> List[int]:
-        frames = []
-        for frame in range(self.StartFrame, self.EndFrame, self.FrameStep):
-            frames.append(frame)
+    def estimated_seconds(self, performanceScore: int = 1, frameCount: Optional[int] = None) -> Optional[float]:  # all frames by default
+        if (self.EstimatedFrameCost is None):
+            return None
+        if (frameCount is None):
+            frameCount = self.frame_count()
+        return self.EstimatedFrameCost * frameCount / performanceScore
 
-        return frames
+    def get_frame_set(self) -> FrameSet:
+        return FrameSet.from_range(self.StartFrame, self.EndFrame, self.FrameStep)  # EndFrame is rendered as well
 
-    def get_unassigned_frames(self) -> List[Tuple[int, int]]:  # list of contiguous frame ranges
-        frames = self.get_all_frames()
+    def get_all_frames(self) -> List[int]:
+        return list(self.get_frame_set())
 
-        subtasks = self.Subtask_set.all()
-        for subtask in subtasks:
-            stage = SubtaskStage(subtask.Stage)
-            upperLimit = subtask.EndFrame if (stage != SubtaskStage.Aborted) else subtask.LastestFrame
-            for frame in range(subtask.StartFrame, upperLimit, self.FrameStep):
-                frames[frames.index(frame)] = -1
+    def frame_count(self) -> int:
+        return (self.EndFrame - self.StartFrame) // self.FrameStep + 1
 
-        # for preparation of case: last frame range includes very last frame
-        frames.append(-1)
+    def frame_index(self, frame: int) -> Optional[int]:  # bit of the frame in RenderedFrames, None if not a frame of the task
+        if (frame < self.StartFrame or frame > self.EndFrame or (frame - self.StartFrame) % self.FrameStep != 0):
+            return None
+        return (frame - self.StartFrame) // self.FrameStep
 
-        frame_ranges = []
-        start = -1
-        for i in range(0, len(frames)):
-            if (start == -1 and frames[i] != -1):  # start of contiguous frame range
-                start = frames[i]
-            elif (start != -1 and frames[i] == -1):  # end of contiguous frame range
-                frame_ranges.append((start, frames[i - 1]))
-                start = -1
+    def get_rendered_frames(self) -> FrameBitmap:
+        return FrameBitmap(self.frame_count(), self.RenderedFrames)  # empty if not set yet
 
-        return frame_ranges
+    def get_missing_frames(self) -> FrameSet:  # frames not received yet, whether assigned or not
+        frames = FrameSet(self.StartFrame, self.FrameStep)
+        for start, end in self.get_rendered_frames().missing_runs():
+            frames.add(self.StartFrame + start * self.FrameStep, self.StartFrame + end * self.FrameStep)
+        return frames
 
+    def remove_subtask_frames(self, frames: FrameSet, stages: Tuple[SubtaskStage, ...] = (SubtaskStage.Pending, SubtaskStage.Running)) -> FrameSet:
+        # removes the frames of subtasks of the given stages, the frames finished and aborted subtasks delivered are
+        # in RenderedFrames, the ones they didn't are missing
+        for startFrame, endFrame in self.Subtask_set.filter(Stage__in=stages).values_list("StartFrame", "EndFrame"):
+            frames.remove(startFrame, endFrame)
 
-    def is_finished(self) -> bool:
-        frames = set(self.get_all_frames())
+        return frames
 
-        subtasks = self.Subtask_set.all()
-        for subtask in subtasks:
-            stage = SubtaskStage(subtask.Stage)
-            if stage not in (SubtaskStage.Aborted, SubtaskStage.Finished):
-                continue
+    def get_unassigned_frame_set(self) -> FrameSet:  # frames neither received nor assigned to a running subtask
+        return self.remove_subtask_frames(self.get_missing_frames())
 
-            upperLimit = subtask.EndFrame if ((stage != SubtaskStage.Aborted)) else subtask.LastestFrame
-            for frame in range(subtask.StartFrame, upperLimit, self.FrameStep):
-                frames = frames - {frame}
+    def get_unassigned_frames(self) -> List[Tuple[int, int]]:  # list of contiguous frame ranges
+        return [(start, end) for start, end, _ in self.get_unassigned_frame_set().runs()]
 
-        return not bool(frames)  # true if set is empty
+    def is_finished(self) -> bool:
+        return self.get_rendered_frames().is_full()  # every frame received
 
     def progress_simple(self) -> Tuple[TaskStage, float, float]:  # (TaskStage, current stage progress, total progress)
         current_stage = TaskStage(self.Stage)
@@ -111,10 +141,7 @@ class RenderTask(models.Model):
             currentStageProgress = 0.0  # to be done
 
         if (current_stage == TaskStage.Rendering):
-            subtasks = self.Subtask_set.all()
-            currentStageProgress = 0.0
-            for subtask in subtasks:
-                currentStageProgress += subtask.progress_weighted()
+            currentStageProgress = self.get_rendered_frames().count() / self.frame_count()
 
         if (current_stage == TaskStage.Distributing):
             currentStageProgress = 0.0  # to be done
@@ -125,7 +152,7 @@ class RenderTask(models.Model):
         if (current_stage == TaskStage.Uploading):
             currentStageProgress = 0.0  # to be done
 
-        currentStageProgress = max(1.0, currentStageProgress)
+        currentStageProgress = min(1.0, currentStageProgress)
         totalProgress += currentStageProgress / 3
         finishedAt = self.FinishedAt
 
@@ -134,47 +161,56 @@ class RenderTask(models.Model):
     def progress_detailed(self) -> List[Tuple[float, float]]:  # array of (portion, progress)
         report = []
         if (TaskStage(self.Stage) == TaskStage.Rendering):
-            subtasks = self.Subtask_set.all()
-            for subtask in subtasks:
-                report.append((subtask.Portion, subtask.progress()))
+            rendered = self.get_rendered_frames()
+            for subtask in self.Subtask_set.all():
+                report.append((subtask.Portion, subtask.progress(rendered)))
 
         return report
 
 
     @classmethod
-    def create(cls, taskID_int: int, taskID: str, fileServerAddress: str, fileServerPort: int, dataType: BlenderDataType, user: User):
-        task_folder = f"tasks/{taskID}"
-
-        try:
-            if os.path.exists(task_folder):
-                shutil.rmtree(task_folder)
-        except Exception as ex:
-            print("ERROR: Failed to remove task folder (that shouldn't exist btw)")
-            print(ex)
-            return None
-
-        try:
-            os.makedirs(task_folder, exist_ok=False)
-        except:
-            print("ERROR: Failed to create new folder for new task")
-            return None
+    def create(cls, fileServerAddress: str, fileServerPort: int, dataType: BlenderDataType, user: User,
+               blenderDataTask: Optional["RenderTask"] = None):
+        with transaction.atomic():  # no task without folder
+            instance = cls(FileServerAddress=fileServerAddress, FileServerPort=fileServerPort, DataType=dataType, Stage=TaskStage.Uploading, CreatedBy=user,
+                           BlenderDataTask=blenderDataTask)
+            instance.save()
+            instance.TaskID = _int_to_id(instance.TaskID_Int, "T-")
+            instance.save(update_fields=["TaskID"])
+
+            task_folder = f"tasks/{instance.TaskID}"
+            try:
+                if os.path.exists(task_folder):  # left over from a reset database
+                    shutil.rmtree(task_folder)
+                os.makedirs(task_folder, exist_ok=False)
+            except Exception as ex:
+                print("ERROR: Failed to create new folder for new task")
+                print(ex)
+                transaction.set_rollback(True)
+                return None
 
-        instance = cls(TaskID_Int=taskID_int, TaskID=taskID, FileServerAddress=fileServerAddress, FileServerPort=fileServerPort, DataType=dataType, Stage=TaskStage.Uploading, CreatedBy=user)
-        instance.save()
         return instance
 
-    def complete(self) -> bool:
-        scene = BlendFile.get_current_scene(self.get_blender_data_path())
+    def complete(self, scene: Optional[BlendFileScene] = None, statistics: Optional[BlockStatistics] = None) -> bool:
         if (scene is None):
-            return False
+            blendFile = BlendFile.read(self.get_blender_data_path())
+            if (blendFile is None):
+                return False
+            scene = blendFile.CurrentScene
+            statistics = blendFile.get_block_statistics()
 
         self.StartFrame = scene.StartFrame
         self.EndFrame   = scene.EndFrame
         self.FrameStep  = scene.FrameStep
+        self.SceneName  = scene.Name
         self.Stage      = TaskStage.Pending
 
         self.OutputType = RenderOutputType.from_scene(scene)
 
+        self.CostFeatures = CostEstimator.features(scene, statistics)
+        self.EstimatedFrameCost = CostEstimator.estimate(self.CostFeatures)
+        self.RenderedFrames = FrameBitmap(self.frame_count()).to_bytes()
+
         self.save()
 
         return True
@@ -184,7 +220,7 @@ class RenderTask(models.Model):
 
 
 class Subtask(models.Model):
-    SubtaskIndex    = models.PositiveBigIntegerField(primary_key=True)
+    SubtaskIndex    = models.BigAutoField(primary_key=True)  # from the database sequence, unique across processes
     Task            = models.ForeignKey(RenderTask, on_delete=models.CASCADE, related_name="Subtask_set")  # is CASCADE right ??
     Worker          = models.ForeignKey("WorkerManager.Worker", on_delete=models.CASCADE)           # is CASCADE right ??
     StartFrame      = models.PositiveIntegerField()
@@ -194,6 +230,11 @@ class Subtask(models.Model):
                                             # Alternatively recalculate it each time in super task
                                             # TODO: change if Subtask completes partially only
     Stage           = models.CharField(max_length=5, choices=SubtaskStage, default=SubtaskStage.Pending)
+    StartedAt       = models.DateTimeField(null=True)  # when it was assigned to its current Worker
+    LastFrameAt     = models.DateTimeField(null=True)  # when LastestFrame arrived
+
+    # Subtask whose last frames this one renders as well, the copy finishing first wins (see TaskScheduler.speculate_subtasks)
+    DuplicateOf     = models.ForeignKey("self", null=True, blank=True, default=None, on_delete=models.CASCADE, related_name="Duplicate_set")
 
     class Meta:
         constraints = [
@@ -211,13 +252,52 @@ class Subtask(models.Model):
             "Start-Frame":          self.StartFrame,
             "End-Frame":            self.EndFrame,
             "Frame-Step":           self.Task.FrameStep,
+            "Scene-Name":           self.Task.SceneName or "",  # empty: scene active when the file was saved
         }
 
-    def progress(self) -> float:
-        totalFrames = (self.EndFrame - self.StartFrame) / self.Task.FrameStep + 1
-        framesDone = (self.LastestFrame - self.StartFrame) / self.Task.FrameStep + 1
-        return framesDone / totalFrames
+    def progress(self, rendered: Optional[FrameBitmap] = None) -> float:  # rendered: RenderedFrames of the task, read if not given
+        task = self.Task
+        if (rendered is None):
+            rendered = task.get_rendered_frames()
+        return rendered.count(task.frame_index(self.StartFrame), task.frame_index(self.EndFrame)) / self.frame_count()
 
     def progress_weighted(self) -> float:
         return self.progress() * self.Portion
 
+    def frame_count(self) -> int:
+        return (self.EndFrame - self.StartFrame) // self.Task.FrameStep + 1
+
+    def copies(self) -> List["Subtask"]:  # other subtasks rendering the same frames, running or not
+        original = self if (self.DuplicateOf_id is None) else self.DuplicateOf
+        copies = [original] + list(original.Duplicate_set.all())
+        return [copy for copy in copies if (copy.SubtaskIndex != self.SubtaskIndex)]
+
+    def get_missing_runs(self) -> List[Tuple[int, int]]:  # (first, last frame) of the frames of the subtask not received yet
+        task = self.Task
+        runs = []
+        for start, end in task.get_rendered_frames().missing_runs():
+            start = max(task.StartFrame + start * task.FrameStep, self.StartFrame)
+            end = min(task.StartFrame + end * task.FrameStep, self.EndFrame)
+            if (start <= end):
+                runs.append((start, end))
+        return runs
+
+    def next_frame(self) -> int:  # frame the Worker renders currently
+        return self.StartFrame if (self.LastestFrame is None) else self.LastestFrame + self.Task.FrameStep
+
+    def frames_remaining(self) -> int:  # including the frame rendered currently
+        return max((self.EndFrame - self.next_frame()) // self.Task.FrameStep + 1, 0)
+
+    def frame_rate(self) -> Optional[float]:  # frames per second
+        # observed since StartedAt, estimated from the render cost until the first frame arrived
+        if (self.LastestFrame is not None and self.StartedAt is not None):
+            elapsed = (timezone.now() - self.StartedAt).total_seconds()
+            framesDone = (self.LastestFrame - self.StartFrame) // self.Task.FrameStep + 1
+            if (elapsed > 0 and framesDone > 0):
+                return framesDone / elapsed
+
+        if (self.Task.EstimatedFrameCost is not None):
+            return self.Worker.PerformanceScore / self.Task.EstimatedFrameCost
+
+        return None
+
@@ -1,3 +1,633 @@
-from django.test import TestCase
+import contextlib
+import importlib
+import importlib.util
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .api import RenderTaskViewSet
+from .BlendFile import BlendFile, BlendFileParser, ImageType
+from .ConcatManager import ConcatManager
+from .Chunker import INITIAL_FRAMES, PROBE_SECONDS, TARGET_SECONDS, Chunker
+from .CostEstimator import CostEstimator
+from .Enums import BlenderDataType, RenderOutputType, SubtaskStage, TaskStage
+from .FairShare import AFFINITY_SLACK, HALF_LIFE, FairShare
+from .FrameBitmap import FrameBitmap
+from .FrameSet import FrameSet
+from .management.Simulator import FarmConfig, Simulator
+from .models import RenderTask, Subtask
+from .TaskScheduler import MIN_STEAL_FRAMES, TaskScheduler
+from WorkerManager.Enums import WorkerStatus
+from WorkerManager.models import Worker
+from WorkerManager.Sender import Sender
+from WorkerManager.WorkerManager import WorkerManager
+
+
+def load_blend_generator():  # testing/ is no package, the benchmarks put it on sys.path instead
+    spec = importlib.util.spec_from_file_location("generate_blend", settings.BASE_DIR / "testing" / "generate_blend.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class BlendFileTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.generator = load_blend_generator()
+        cls.directory = tempfile.TemporaryDirectory(prefix="blend_")
+        cls.addClassCleanup(cls.directory.cleanup)
+
+    def generate(self, name: str, **arguments) -> tuple[str, dict]:  # small files, 3 scenes, the last one is current
+        path = os.path.join(self.directory.name, f"{name}.blend")
+        expected = self.generator.generate(path, blocks=50, sdnaStructs=20, scenes=3, **arguments)
+        return path, expected
+
+    def parse_stream(self, path: str, chunkSize: int = 4096):
+        parser = BlendFileParser()
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(chunkSize)
+                if not chunk or not parser.feed(chunk):
+                    break
+        return parser.close()
+
+    def assert_scenes(self, blendFile: BlendFile, expected: dict):
+        self.assertIsNotNone(blendFile)
+        self.assertEqual([scene.Name for scene in blendFile.Scenes], ["Scene", "Scene.001", "Scene.002"])
+        scene = blendFile.CurrentScene
+        self.assertEqual(scene.Name, expected["SceneName"])
+        self.assertEqual((scene.StartFrame, scene.EndFrame, scene.FrameStep), (expected["StartFrame"], expected["EndFrame"], expected["FrameStep"]))
+        self.assertEqual(scene.OutputType, ImageType(expected["ImageType"]))
+        self.assertEqual((scene.ResolutionX, scene.ResolutionY), (expected["ResolutionX"], expected["ResolutionY"]))
+        self.assertEqual(blendFile.get_scene("Scene.001").EndFrame, 251)
+
+    def test_round_trip(self):
+        compressions = ["none", "gzip"] + (["zstd"] if (self.generator.zstandard is not None) else [])
+        for pointerSize in (4, 8):
+            for endian in ("little", "big"):
+                for compression in compressions:
+                    with self.subTest(pointerSize=pointerSize, endian=endian, compression=compression):
+                        path, expected = self.generate(f"{pointerSize}_{endian}_{compression}", pointerSize=pointerSize, endian=endian,
+                                                       compression=compression)
+
+                        self.assert_scenes(BlendFile.read(path), expected)
+                        self.assert_scenes(self.parse_stream(path), expected)
+
+    def test_truncated_file(self):
+        for compression in ("none", "gzip"):
+            path, expected = self.generate(f"complete_{compression}", compression=compression)
+            with open(path, "rb") as file:
+                data = file.read()
+
+            for size in (0, 6, 100, len(data) // 2, len(data) - 200):  # the last one ends within DNA1
+                with self.subTest(compression=compression, size=size):
+                    truncated = os.path.join(self.directory.name, f"truncated_{compression}_{size}.blend")
+                    with open(truncated, "wb") as file:
+                        file.write(data[:size])
+
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        self.assertIsNone(BlendFile.read(truncated))
+                        self.assertIsNone(self.parse_stream(truncated))
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        workingDirectory = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="upload_"))  # tasks are created in tasks/
+        self.addCleanup(os.chdir, workingDirectory)
+        self.user = User.objects.create(username="user")
+
+    def upload(self, data: bytes, query: str = ""):
+        request = APIRequestFactory().post(f"/tasks/run_task/{query}", data=data, content_type="application/octet-stream")
+        force_authenticate(request, user=self.user)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return RenderTaskViewSet.as_view({"post": "run_task"})(request)
+
+    def assert_rejected(self, data: bytes, query: str = ""):
+        response = self.upload(data, query)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RenderTask.objects.exists())
+        self.assertEqual(os.listdir("tasks"), [])
+
+    def test_rejected_uploads_leave_nothing_behind(self):
+        path = os.path.join(tempfile.mkdtemp(prefix="blend_"), "upload.blend")
+        load_blend_generator().generate(path, blocks=10, sdnaStructs=10)
+        with open(path, "rb") as file:
+            data = file.read()
+
+        self.assert_rejected(b"not a blend file")
+        self.assert_rejected(data[:len(data) // 2])
+        self.assert_rejected(data, "?scene=Missing")
+
+        response = self.upload(data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir("tasks"), [response.data["Task-ID"]])
+
+
+class FrameSetTests(SimpleTestCase):
+    def test_empty_set(self):
+        frames = FrameSet(1)
+
+        self.assertFalse(frames)
+        self.assertEqual((len(frames), list(frames), frames.runs()), (0, [], []))
+        self.assertFalse(frames.contains(1))
+        self.assertTrue(frames.covers(5, 4))  # empty range
+        frames.remove(1, 10)
+        frames.add(5, 4)
+        self.assertEqual(frames.runs(), [])
+
+    def test_add_merges_overlapping_and_adjacent_runs(self):
+        frames = FrameSet(1)
+        frames.add(1, 3)
+        frames.add(7, 9)
+        self.assertEqual(frames.runs(), [(1, 3, 1), (7, 9, 1)])
+
+        frames.add(4, 4)  # touches the first run
+        self.assertEqual(frames.runs(), [(1, 4, 1), (7, 9, 1)])
+        frames.add(5, 6)  # closes the gap
+        self.assertEqual(frames.runs(), [(1, 9, 1)])
+        frames.add(3, 12)
+        self.assertEqual(frames.runs(), [(1, 12, 1)])
+        self.assertEqual(len(frames), 12)
+
+    def test_add_spanning_several_runs(self):
+        frames = FrameSet(0)
+        for start in (0, 10, 20, 30):
+            frames.add(start, start + 2)
+
+        frames.add(11, 25)
+        self.assertEqual(frames.runs(), [(0, 2, 1), (10, 25, 1), (30, 32, 1)])
+        self.assertTrue(frames.covers(10, 25))
+        self.assertFalse(frames.covers(2, 10))
+
+    def test_remove_splits_and_trims_runs(self):
+        frames = FrameSet.from_range(1, 20)
+
+        frames.remove(5, 7)
+        self.assertEqual(frames.runs(), [(1, 4, 1), (8, 20, 1)])
+        frames.remove(3, 10)  # trims both runs
+        self.assertEqual(frames.runs(), [(1, 2, 1), (11, 20, 1)])
+        frames.remove(0, 2)  # the whole first run
+        self.assertEqual(frames.runs(), [(11, 20, 1)])
+        frames.remove(30, 40)  # nothing there
+        self.assertEqual(frames.runs(), [(11, 20, 1)])
+        self.assertEqual(frames.first(), 11)
+        self.assertEqual(len(frames), 10)
+
+    def test_copy_is_independent(self):
+        frames = FrameSet.from_range(1, 10)
+        copy = frames.copy()
+        copy.remove(1, 5)
+
+        self.assertEqual(frames.runs(), [(1, 10, 1)])
+        self.assertEqual(copy.runs(), [(6, 10, 1)])
+
+    def test_step_aligns_to_the_grid(self):
+        frames = FrameSet.from_range(1, 20, 3)  # 1, 4, ..., 19
+
+        self.assertEqual(frames.runs(), [(1, 19, 3)])
+        self.assertEqual(list(frames), [1, 4, 7, 10, 13, 16, 19])
+        self.assertTrue(frames.contains(7))
+        self.assertFalse(frames.contains(8))  # off the grid
+
+        frames.remove(5, 12)  # 7 and 10
+        self.assertEqual(frames.runs(), [(1, 4, 3), (13, 19, 3)])
+        frames.remove(14, 15)  # no frame of the grid
+        self.assertEqual(len(frames), 5)
+
+        frames.add(6, 12)  # 7 and 10 again, runs merge across the step
+        self.assertEqual(frames.runs(), [(1, 19, 3)])
+        frames.add(20, 21)  # no frame of the grid
+        self.assertEqual(frames.runs(), [(1, 19, 3)])
+        self.assertTrue(frames.covers(2, 19))
+
+    def test_invalid_step(self):
+        with self.assertRaises(ValueError):
+            FrameSet(1, 0)
+
+
+class FrameBitmapTests(SimpleTestCase):
+    def test_set_get_and_count(self):
+        rendered = FrameBitmap(17)  # padding in the last byte
+        for index in (0, 7, 8, 16):
+            rendered.set(index)
+
+        self.assertEqual([index for index in range(17) if rendered.get(index)], [0, 7, 8, 16])
+        self.assertEqual(rendered.count(), 4)
+        self.assertEqual(rendered.count(1, 7), 1)
+        self.assertEqual(rendered.count(7, 8), 2)  # across a byte boundary
+        self.assertEqual(rendered.count(9, 15), 0)
+        self.assertEqual(rendered.count(16, 100), 1)  # clamped to the last frame
+        self.assertEqual(rendered.count(5, 4), 0)
+
+    def test_first_and_last_frame(self):
+        rendered = FrameBitmap(17)
+        self.assertEqual(rendered.missing_runs(), [(0, 16)])
+
+        rendered.set(0)
+        rendered.set(16)
+        self.assertEqual(rendered.missing_runs(), [(1, 15)])
+        for index in range(1, 16):
+            rendered.set(index)
+        self.assertTrue(rendered.is_full())  # the padding bits don't count
+        self.assertEqual(rendered.missing_runs(), [])
+
+    def test_missing_runs_across_chunks(self):
+        rendered = FrameBitmap(1200)
+        for index in range(1200):
+            if not (500 <= index <= 530 or index == 1000 or index >= 1100):
+                rendered.set(index)
+
+        self.assertEqual(rendered.missing_runs(), [(500, 530), (1000, 1000), (1100, 1199)])
+        self.assertEqual(rendered.count(), 1200 - 31 - 1 - 100)
+
+    def test_bytes_round_trip(self):
+        rendered = FrameBitmap(10)
+        rendered.set(9)
+
+        self.assertEqual(rendered.to_bytes(), b"\x00\x02")
+        self.assertTrue(FrameBitmap(10, memoryview(rendered.to_bytes())).get(9))
+        self.assertEqual(len(FrameBitmap(10, rendered.to_bytes())), 10)
+        with self.assertRaises(ValueError):
+            FrameBitmap(17, rendered.to_bytes())
+
+
+class RenderedFramesTests(TestCase):
+    def setUp(self):
+        self.worker = Worker.objects.create(WorkerID_Int=0, WorkerID="W-0000_0000_0000_0000", Host="localhost", Port=1,
+                                            PerformanceScore=1, Status=WorkerStatus.Working)
+        self.task = RenderTask.objects.create(FileServerAddress="localhost", FileServerPort=8000, DataType=BlenderDataType.SingleFile,
+                                              StartFrame=1, EndFrame=19, FrameStep=2, Stage=TaskStage.Rendering)  # 1, 3, ..., 19
+
+    def receive(self, *frames: int):
+        rendered = self.task.get_rendered_frames()
+        for frame in frames:
+            rendered.set(self.task.frame_index(frame))
+        self.task.RenderedFrames = rendered.to_bytes()
+
+    def test_is_finished(self):
+        self.assertFalse(self.task.is_finished())
+        self.receive(*range(1, 18, 2))
+        self.assertFalse(self.task.is_finished())
+        self.receive(19)
+        self.assertTrue(self.task.is_finished())
+
+    def test_missing_runs_of_subtask(self):
+        subtask = Subtask(Task=self.task, Worker=self.worker, StartFrame=5, EndFrame=15, Portion=0.6)
+        self.assertEqual(subtask.get_missing_runs(), [(5, 15)])
+
+        self.receive(1, 3, 5, 9, 15, 17)
+        self.assertEqual(subtask.get_missing_runs(), [(7, 7), (11, 13)])
+        self.receive(7, 11, 13)
+        self.assertEqual(subtask.get_missing_runs(), [])
+
+    def test_migration_fills_bitmap_from_subtasks(self):
+        migration = importlib.import_module("TaskScheduler.migrations.0010_rendertask_renderedframes")
+        Subtask.objects.create(Task=self.task, Worker=self.worker, StartFrame=1, EndFrame=7, Portion=0.4, Stage=SubtaskStage.Finished)
+        Subtask.objects.create(Task=self.task, Worker=self.worker, StartFrame=9, EndFrame=15, Portion=0.4, Stage=SubtaskStage.Running,
+                               LastestFrame=11)
+        Subtask.objects.create(Task=self.task, Worker=self.worker, StartFrame=17, EndFrame=19, Portion=0.2, Stage=SubtaskStage.Pending)
+        concatenating = RenderTask.objects.create(FileServerAddress="localhost", FileServerPort=8000, DataType=BlenderDataType.SingleFile,
+                                                  StartFrame=1, EndFrame=3, FrameStep=1, Stage=TaskStage.Concatenating)
+        Subtask.objects.create(Task=concatenating, Worker=self.worker, StartFrame=1, EndFrame=3, Portion=1.0, Stage=SubtaskStage.Running)
+        uploading = RenderTask.objects.create(FileServerAddress="localhost", FileServerPort=8000, DataType=BlenderDataType.SingleFile,
+                                              Stage=TaskStage.Uploading)
+
+        migration.fill_rendered_frames(apps, None)
+
+        self.task.refresh_from_db()
+        concatenating.refresh_from_db()
+        uploading.refresh_from_db()
+        self.assertEqual(self.task.get_rendered_frames().missing_runs(), [(6, 9)])  # frames 13 to 19
+        self.assertEqual(self.task.get_rendered_frames().count(), 6)
+        self.assertTrue(concatenating.is_finished())
+        self.assertIsNone(uploading.RenderedFrames)
+
+
+class FairShareTests(SimpleTestCase):
+    HEAVY, LIGHT = 1, 2
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(FairShare, "clock", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FairShare.reset()
+        self.addCleanup(FairShare.reset)
+
+        FairShare.enqueue(self.HEAVY, 10)  # submitted first
+        FairShare.enqueue(self.HEAVY, 11)
+        FairShare.enqueue(self.LIGHT, 20, dataTaskID=19)
+
+    def test_light_user_is_served_first(self):
+        FairShare.charge(self.HEAVY, 3600)
+        FairShare.charge(self.LIGHT, 60)
+
+        self.assertEqual(FairShare.next_task(), (self.LIGHT, 20))
+        FairShare.task_done(20)
+        self.assertEqual(FairShare.next_task(), (self.HEAVY, 10))  # in order of submission
+        FairShare.task_done(10)
+        self.assertEqual(FairShare.next_task(), (self.HEAVY, 11))
+
+    def test_charges_reorder_the_heap(self):
+        for seconds in (100, 100, 100):
+            FairShare.charge(self.LIGHT, seconds)
+            FairShare.charge(self.HEAVY, seconds + 1)
+            self.assertEqual(FairShare.next_task(), (self.LIGHT, 20))
+
+        FairShare.charge(self.LIGHT, 10)  # now ahead by 7 seconds
+        self.assertEqual(FairShare.next_task(), (self.HEAVY, 10))
+        self.assertEqual(FairShare.heap[0], (FairShare.priority(self.HEAVY), self.HEAVY))  # outdated entries on top were dropped
+
+    def test_usage_decays_with_half_life(self):
+        FairShare.charge(self.HEAVY, 1000)
+        self.now += HALF_LIFE
+        self.assertAlmostEqual(FairShare.usage(self.HEAVY), 500)
+
+        FairShare.charge(self.LIGHT, 600)  # recent, counts more than the older 1000
+        self.assertEqual(FairShare.next_task(), (self.HEAVY, 10))
+        self.now += 2 * HALF_LIFE
+        self.assertAlmostEqual(FairShare.usage(self.LIGHT), 150)
+        self.assertEqual(FairShare.next_task(), (self.HEAVY, 10))
+
+    def test_affinity_within_slack(self):
+        FairShare.charge(self.HEAVY, AFFINITY_SLACK)
+        self.assertEqual(FairShare.next_task(cachedTasks=[10]), (self.HEAVY, 10))  # holds the blend data of task 10
+        self.assertEqual(FairShare.next_task(cachedTasks=[19]), (self.LIGHT, 20))  # data of another task
+        self.assertEqual(FairShare.next_task(cachedTasks=[99]), (self.LIGHT, 20))
+
+        FairShare.charge(self.HEAVY, 1)  # beyond the slack
+        self.assertEqual(FairShare.next_task(cachedTasks=[10]), (self.LIGHT, 20))
+        self.now += HALF_LIFE  # the gap halves
+        self.assertEqual(FairShare.next_task(cachedTasks=[10]), (self.HEAVY, 10))
+
+
+class ChunkerTests(SimpleTestCase):
+    WORKER, OTHER_WORKER, TASK = 1, 2, 100
+
+    def setUp(self):
+        patcher = mock.patch.multiple(Chunker, WorkerFrameTimes={}, TaskFrameCosts={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_without_measurements(self):
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 2), INITIAL_FRAMES)  # no cost estimate either
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 2, estimatedFrameCost=4.0), PROBE_SECONDS // 2)
+
+    def test_grows_to_target_with_measurements(self):
+        Chunker.observe(self.WORKER, self.TASK, 1, 2.0)
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 1), 45)  # 90 s, one of 8 measurements
+        for i in range(7):
+            Chunker.observe(self.WORKER, self.TASK, 1, 2.0)
+
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 1), TARGET_SECONDS // 2)
+        Chunker.observe(self.WORKER, self.TASK, 1, 2.0 + 10 / 3)  # slower frame, the average rises to 3 s right away
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 1, estimatedFrameCost=0.1), TARGET_SECONDS // 3)
+
+    def test_other_workers_scaled_by_score(self):
+        for i in range(8):
+            Chunker.observe(self.OTHER_WORKER, self.TASK, 1, 4.0)
+
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 2), TARGET_SECONDS // 2)
+        Chunker.forget(self.TASK)
+        self.assertEqual(Chunker.chunk_frames(self.WORKER, self.TASK, 2), INITIAL_FRAMES)
+
+    def test_next_chunk_clamps_to_remaining_frames(self):
+        frames = FrameSet.from_range(1, 50)
+        self.assertEqual(Chunker.next_chunk(frames, 100), (1, 50, 50))
+        self.assertEqual(Chunker.next_chunk(frames, 20), (1, 20, 20))
+        self.assertEqual(Chunker.next_chunk(frames, 45), (1, 50, 50))  # the 5 frames left are added
+
+        frames.remove(11, 30)
+        self.assertEqual(Chunker.next_chunk(frames, 20), (1, 10, 10))  # first run only
+
+        frames = FrameSet.from_range(1, 99, 2)  # 50 frames
+        self.assertEqual(Chunker.next_chunk(frames, 20), (1, 39, 20))
+        self.assertEqual(Chunker.next_chunk(frames, 60), (1, 99, 50))
+
+
+class ReassignmentTests(TestCase):
+    def setUp(self):
+        FairShare.reset()
+        self.oldWorker = Worker.objects.create(WorkerID_Int=0, WorkerID="W-0000_0000_0000_0000", Host="localhost", Port=1,
+                                               PerformanceScore=1, Status=WorkerStatus.Disconnected)
+        self.newWorker = Worker.objects.create(WorkerID_Int=1, WorkerID="W-0000_0000_0000_0001", Host="localhost", Port=2,
+                                               PerformanceScore=1, Status=WorkerStatus.Available)
+        self.task = RenderTask.objects.create(FileServerAddress="localhost", FileServerPort=8000, DataType=BlenderDataType.SingleFile,
+                                              StartFrame=1, EndFrame=10, FrameStep=1, Stage=TaskStage.Rendering, FramesAssigned=True)
+
+    def receive(self, *frames: int):
+        rendered = FrameBitmap(self.task.frame_count())
+        for frame in frames:
+            rendered.set(self.task.frame_index(frame))
+        self.task.RenderedFrames = rendered.to_bytes()
+        self.task.save(update_fields=["RenderedFrames"])
+
+    def create_failed_subtask(self, lastestFrame: int) -> Subtask:  # as subtask_failed or a re-registration leave it
+        return Subtask.objects.create(Task=self.task, Worker=self.oldWorker, StartFrame=1, EndFrame=10, Portion=1.0, Stage=SubtaskStage.Pending,
+                                      LastestFrame=lastestFrame, LastFrameAt=timezone.now(), StartedAt=timezone.now())
+
+    def test_reassigned_subtask_renders_missing_frames_only(self):
+        self.receive(1, 2, 3, 6)  # the old worker delivered some frames before it dropped out
+        subtask = self.create_failed_subtask(6)
+
+        started, _ = TaskScheduler.schedule()
+
+        subtask.refresh_from_db()
+        self.task.refresh_from_db()
+        self.assertEqual([s.SubtaskIndex for s in started], [subtask.SubtaskIndex])
+        self.assertEqual((subtask.Worker_id, subtask.Stage, subtask.StartFrame, subtask.EndFrame), (1, SubtaskStage.Running, 4, 5))
+        self.assertIsNone(subtask.LastestFrame)
+        self.assertIsNone(subtask.LastFrameAt)
+        self.assertAlmostEqual(subtask.Portion, 0.2)
+        self.assertEqual(subtask.frames_remaining(), 2)
+        self.assertFalse(self.task.FramesAssigned)  # the frames after 6 are handed out again
+        self.assertEqual(self.task.get_unassigned_frames(), [(7, 10)])
+        self.assertIn(self.task.TaskID_Int, FairShare.Queued)
+
+    def test_subtask_with_all_frames_received_is_not_reassigned(self):
+        self.receive(*range(1, 11))
+        subtask = self.create_failed_subtask(10)
+
+        started, _ = TaskScheduler.schedule()
+
+        subtask.refresh_from_db()
+        self.newWorker.refresh_from_db()
+        self.assertEqual(started, [])
+        self.assertEqual(subtask.Stage, SubtaskStage.Aborted)
+        self.assertEqual(self.newWorker.Status, WorkerStatus.Available)
+
+
+class CostEstimatorTests(TestCase):
+    def setUp(self):
+        weights = {engine: list(values) for engine, values in CostEstimator.Weights.items()}
+        patcher = mock.patch.multiple(CostEstimator, Weights=weights, observations={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def observe(self, megapixelSamples: float, meshMB: float, secondsPerFrame: float, frames: int = 12):
+        features = {"Engine": "CYCLES", "Constant": 1.0, "MegapixelSamples": megapixelSamples, "MeshMB": meshMB, "ImageMB": 0.0, "Objects": 0.0}
+        for i in range(frames):
+            CostEstimator.observe(features, secondsPerFrame)
+
+    def test_frames_of_one_task_keep_the_weights(self):
+        self.observe(100, 10, 50)
+
+        self.assertEqual(CostEstimator.calibrate(), [])
+        self.assertEqual(CostEstimator.Weights["CYCLES"][0], 2.0)
+
+    def test_features_without_variance_keep_their_weights(self):  # ImageMB and Objects are 0 in all observations
+        for megapixelSamples, meshMB in ((10, 1), (20, 1), (40, 3), (80, 2), (160, 5)):
+            self.observe(megapixelSamples, meshMB, 3 + 0.5 * megapixelSamples + 2 * meshMB)
+
+        self.assertEqual(CostEstimator.calibrate(), ["CYCLES"])
+        for weight, expected in zip(CostEstimator.Weights["CYCLES"], [3, 0.5, 2, 0.05, 0.002]):
+            self.assertAlmostEqual(weight, expected, places=4)
+
+
+class SpeculationTests(TestCase):
+    def setUp(self):
+        workingDirectory = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="speculation_"))  # frames are written to tasks/
+        self.addCleanup(os.chdir, workingDirectory)
+        FairShare.reset()
+
+        self.slowWorker = Worker.objects.create(WorkerID_Int=0, WorkerID="W-0000_0000_0000_0000", Host="localhost", Port=1,
+                                                PerformanceScore=1, Status=WorkerStatus.Working)
+        self.idleWorkers = [Worker.objects.create(WorkerID_Int=i, WorkerID=f"W-0000_0000_0000_000{i}", Host="localhost", Port=i + 1,
+                                                  PerformanceScore=2, Status=WorkerStatus.Available) for i in (1, 2)]
+        self.task = RenderTask.create("localhost", 8000, BlenderDataType.SingleFile, None)  # with TaskID and folder
+        self.task.StartFrame, self.task.EndFrame, self.task.FrameStep = 1, 40, 1
+        self.task.OutputType, self.task.Stage, self.task.FramesAssigned = RenderOutputType.PNG, TaskStage.Rendering, True
+        rendered = FrameBitmap(40)
+        for index in range(38):  # 95 %, the straggler has 2 frames left
+            rendered.set(index)
+        self.task.RenderedFrames = rendered.to_bytes()
+        self.task.save()
+        self.straggler = Subtask.objects.create(Task=self.task, Worker=self.slowWorker, StartFrame=39, EndFrame=40, Portion=0.05,
+                                                Stage=SubtaskStage.Running, StartedAt=timezone.now())
+
+        for target, attribute in ((ConcatManager, "add_task"), (Sender, "cancel_task"), (WorkerManager, "freeWorkerCallback")):
+            patcher = mock.patch.object(target, attribute)
+            setattr(self, attribute, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def send(self, subtask: Subtask, *frames: int) -> list[int]:
+        statuses = []
+        for frame in frames:
+            request = RequestFactory().post("/", data=b"frame", content_type="image/png",
+                                            headers={"Worker-Id": subtask.Worker.WorkerID, "Task-Id": self.task.TaskID,
+                                                     "Subtask-Index": str(subtask.SubtaskIndex), "Frame": str(frame)})
+            statuses.append(WorkerManager.receive_result(request).status_code)
+        return statuses
+
+    def speculate(self) -> Subtask:
+        started, shrunk = TaskScheduler.schedule()
+        self.assertEqual((len(started), shrunk), (1, []))
+        return Subtask.objects.get(SubtaskIndex=started[0].SubtaskIndex)
+
+    def test_straggler_gets_one_copy(self):
+        copy = self.speculate()
+        TaskScheduler.schedule()  # the other idle worker doesn't get a second copy
+
+        self.assertEqual((copy.DuplicateOf_id, copy.StartFrame, copy.EndFrame, copy.Worker_id), (self.straggler.SubtaskIndex, 39, 40, 1))
+        self.assertEqual(list(self.straggler.Duplicate_set.all()), [copy])
+        self.assertEqual(Worker.objects.get(WorkerID_Int=2).Status, WorkerStatus.Available)
+
+    def test_copy_is_cancelled_when_original_finishes(self):
+        copy = self.speculate()
+
+        self.assertEqual(self.send(self.straggler, 39, 40), [200, 200])
+
+        copy.refresh_from_db()
+        self.straggler.refresh_from_db()
+        self.assertEqual((self.straggler.Stage, copy.Stage), (SubtaskStage.Finished, SubtaskStage.Aborted))
+        self.cancel_task.assert_called_once_with(copy)
+        self.add_task.assert_called_once()
+        self.assertEqual(Worker.objects.get(WorkerID_Int=1).Status, WorkerStatus.Available)
+        self.assertEqual(self.send(copy, 40), [400])  # late result of the aborted copy
+
+    def test_original_is_cancelled_when_copy_finishes(self):
+        copy = self.speculate()
+
+        self.assertEqual(self.send(self.straggler, 39) + self.send(copy, 40), [200, 200])
+
+        copy.refresh_from_db()
+        self.straggler.refresh_from_db()
+        self.assertEqual((self.straggler.Stage, copy.Stage), (SubtaskStage.Aborted, SubtaskStage.Finished))
+        self.cancel_task.assert_called_once_with(self.straggler)
+        self.add_task.assert_called_once()
+        self.assertEqual(Worker.objects.get(WorkerID_Int=0).Status, WorkerStatus.Available)
+
+
+class StealTests(TestCase):
+    def setUp(self):
+        FairShare.reset()
+        self.victimWorker = Worker.objects.create(WorkerID_Int=0, WorkerID="W-0000_0000_0000_0000", Host="localhost", Port=1,
+                                                  PerformanceScore=1, Status=WorkerStatus.Working)
+        self.thief = Worker.objects.create(WorkerID_Int=1, WorkerID="W-0000_0000_0000_0001", Host="localhost", Port=2,
+                                           PerformanceScore=3, Status=WorkerStatus.Available)
+        self.task = RenderTask.objects.create(FileServerAddress="localhost", FileServerPort=8000, DataType=BlenderDataType.SingleFile,
+                                              StartFrame=1, EndFrame=199, FrameStep=2, Stage=TaskStage.Rendering, FramesAssigned=True)
+
+    def create_subtask(self, lastestFrame: int) -> Subtask:  # 100 frames, started 100 s ago
+        return Subtask.objects.create(Task=self.task, Worker=self.victimWorker, StartFrame=1, EndFrame=199, Portion=1.0,
+                                      Stage=SubtaskStage.Running, LastestFrame=lastestFrame, StartedAt=timezone.now() - timedelta(seconds=100))
+
+    def test_tail_is_split_by_performance(self):
+        victim = self.create_subtask(19)  # 10 frames done, 90 left
+
+        started, shrunk = TaskScheduler.schedule()
+
+        victim.refresh_from_db()
+        thief = Subtask.objects.get(Worker=self.thief)
+        self.assertEqual(shrunk, [victim])
+        self.assertEqual(started, [thief])
+        self.assertEqual((victim.StartFrame, victim.EndFrame), (1, 65))  # frames 21 to 65: a quarter of the 90 left, rounded up
+        self.assertEqual((thief.StartFrame, thief.EndFrame, thief.Stage), (67, 199, SubtaskStage.Running))
+        self.assertEqual(victim.frame_count() + thief.frame_count(), 100)
+        self.assertAlmostEqual(victim.Portion + thief.Portion, 1.0)
+        self.thief.refresh_from_db()
+        self.assertEqual(self.thief.Status, WorkerStatus.Working)
+
+    def test_short_tail_is_not_stolen(self):
+        victim = self.create_subtask(199 - 2 * MIN_STEAL_FRAMES)
+
+        self.assertEqual(TaskScheduler.schedule(), ([], []))
+
+        victim.refresh_from_db()
+        self.assertEqual(victim.EndFrame, 199)
+
+
+class SimulatorTests(TransactionTestCase):
+    def simulate(self, **values) -> dict:  # in a temporary folder, tasks write their frames to tasks/
+        workingDirectory = os.getcwd()
+        try:
+            os.chdir(tempfile.mkdtemp(prefix="simulate_farm_"))
+            with contextlib.redirect_stdout(io.StringIO()):
+                return Simulator(FarmConfig(**values)).run()
+        finally:
+            os.chdir(workingDirectory)
+
+    def test_rejected_subtasks_take_the_sender_failure_path(self):
+        subtaskFailed = TaskScheduler.subtask_failed
+        with mock.patch.object(TaskScheduler, "subtask_failed", side_effect=subtaskFailed) as failed:
+            report = self.simulate(Days=0.1, DrainDays=2, Scores=[2, 1, 1], TasksPerHour=6, FramesMean=30, FailureRate=0.2, DowntimeSeconds=300,
+                                   DisconnectsPerDay=0, SenderThreads=True)
+
+        self.assertGreater(report["Tasks"], 0)
+        self.assertEqual(report["Finished"], report["Tasks"])
+        self.assertTrue(failed.called)
+        self.assertNotIn(None, [call.args[0] for call in failed.call_args_list])
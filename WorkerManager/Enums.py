@@ -1,3 +1,5 @@
+from enum import Enum
+
 from django.db import models
 
 class WorkerStatus(models.TextChoices):
@@ -5,3 +7,9 @@ class WorkerStatus(models.TextChoices):
 	Working         = ("WK", "Working")
 	Quitting        = ("QT", "Quitting")  # Working but will quit after finishing current task
 	Disconnected    = ("DC", "Disconnected")
+
+
+class WorkerCommand(Enum):  # request path sent to the Worker
+	StartTask       = "STARTTASK"
+	UpdateTask      = "UPDATETASK"  # frame range of a running subtask changed
+	CancelTask      = "CANCELTASK"
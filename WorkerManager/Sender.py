@@ -5,6 +5,7 @@ from typing import Callable, List, Set, Tuple
 import time
 
 from TaskScheduler.models import Subtask
+from .Enums import WorkerCommand
 
 
 MAX_SENDER_THREADS = 5
@@ -15,11 +16,13 @@ MANAGER_THREAD_SLEEP_TIME = 0.5 # seconds
 class ThreadJob:
 	Thread: Thread
 	Subtask: Subtask
+	Command: WorkerCommand
 	Done: bool
 
-	def __init__(self, thread: Thread, subtask: Subtask):
+	def __init__(self, thread: Thread, subtask: Subtask, command: WorkerCommand = WorkerCommand.StartTask):
 		self.Thread = thread
 		self.Subtask = subtask
+		self.Command = command
 		self.Done = False
 
 
@@ -35,62 +38,76 @@ class Sender:
 	def set_callbacks(sendingFailedCb: Callable[[Subtask], None]):
 		Sender.sendingFailedCallback = sendingFailedCb
 
+	@staticmethod
+	def start():  # server process only, see boom.services
 		Sender.managerThread = Thread(target=Sender.assign_tasks, daemon=True)
 		Sender.managerThread.start()
 
 	@staticmethod
 	def assign_tasks():  # runs on manager thread
 		while True:
-			time.sleep(0.5)
+			time.sleep(MANAGER_THREAD_SLEEP_TIME)
+			Sender.check_threads()
 
-			for i in range(MAX_SENDER_THREADS):
-				if (Sender.threads[i].Thread.is_alive()):
-					continue
+	@staticmethod
+	def check_threads():  # reports failed sends and starts queued ones on free slots
+		for i in range(MAX_SENDER_THREADS):
+			if (Sender.threads[i].Thread.is_alive()):
+				continue
 
-				if Sender.threads[i].Done is False:  # failed
+			if Sender.threads[i].Done is False:  # failed, or the slot was never used (Subtask None)
+				if (Sender.threads[i].Command == WorkerCommand.StartTask and Sender.threads[i].Subtask is not None):  # Worker doesn't know the subtask
 					Sender.sendingFailedCallback(Sender.threads[i].Subtask)
-					Sender.threads[i].Done = True  # so it isn't handled twice if there is no new Subtask that replaces the current one
+				Sender.threads[i].Done = True  # so it isn't handled twice if there is no new Subtask that replaces the current one
 
-				# both True and False in Sender.threads[i][2]
-				if (Sender.taskQueue.empty()):
-					continue
+			# both True and False in Sender.threads[i][2]
+			if (Sender.taskQueue.empty()):
+				continue
 
-				task = Sender.taskQueue.get()
-				if task in Sender.canceledTasks:
-					Sender.canceledTasks.remove(task)
+			task, command = Sender.taskQueue.get()
+			if (command == WorkerCommand.CancelTask):
+				if task not in Sender.canceledTasks:  # STARTTASK was dropped below, Worker doesn't know the subtask
 					continue
+				Sender.canceledTasks.remove(task)
+			elif task in Sender.canceledTasks:
+				if (command == WorkerCommand.StartTask):
+					Sender.canceledTasks.remove(task)
+				continue
 
-				newThread = Thread(target=Sender.send, args=(task, i))
-				newThread.start()
-				Sender.threads[i] = ThreadJob(newThread, task)
+			newThread = Thread(target=Sender.send, args=(task, i, command))
+			newThread.start()
+			Sender.threads[i] = ThreadJob(newThread, task, command)
 
 
 	@staticmethod
-	def add_task(task: Subtask):  # called from "outside" (main thread)
-		Sender.taskQueue.put(task)
+	def add_task(task: Subtask, command: WorkerCommand = WorkerCommand.StartTask):  # called from "outside" (main thread)
+		Sender.taskQueue.put((task, command))
 
 	@staticmethod
 	def cancel_task(task: Subtask):  # called from "outside" (main thread)
 		Sender.canceledTasks.add(task)
+		Sender.taskQueue.put((task, WorkerCommand.CancelTask))  # sent only if the subtask left the queue already
 
 	@staticmethod
-	def send(task: Subtask, threadIndex: int):  # called from manager thread in new thread
+	def send(task: Subtask, threadIndex: int, command: WorkerCommand = WorkerCommand.StartTask):  # called from manager thread in new thread
 		success = False
 		tries = 0
 		while not success and tries < MAX_RETRIES:
 			try:
 				headers = task.to_headers()
 				connection = http.client.HTTPConnection(task.Worker.Host, task.Worker.Port, timeout=TIMEOUT)
-				connection.request("GET", "STARTTASK", headers=headers)
+				connection.request("GET", command.value, headers=headers)
 				response = connection.getresponse()
 				connection.close()
 				if response.status == 200:
 					success = True
 				# TODO: handle other statuses
-				tries += 1
 
 			except Exception as ex:
-				print(f"Exception occurred while trying to send Subtask {task.Task.TaskID}:{task.SubtaskIndex} to Worker {task.Worker.WorkerID}")
+				print(f"Exception occurred while trying to send {command.value} of Subtask {task.Task.TaskID}:{task.SubtaskIndex} to Worker {task.Worker.WorkerID}")
 				print(ex)
 
+			finally:
+				tries += 1  # failed connections count as well, an unreachable worker gives up after MAX_RETRIES
+
 		Sender.threads[threadIndex].Done = success
\ No newline at end of file
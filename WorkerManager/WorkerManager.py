@@ -1,12 +1,16 @@
+import os
 import re
+import tempfile
 from typing import Callable, List
 from http import HTTPStatus
 
+from django.db import transaction
 from django.db.models import Max, QuerySet
+from django.utils import timezone
 from django.http import HttpResponse, HttpRequest, FileResponse
 
 from .models import Worker
-from .Enums import WorkerStatus
+from .Enums import WorkerCommand, WorkerStatus
 from .Sender import Sender
 
 # Different Django app
@@ -29,6 +33,10 @@ def _is_valid_id(id: str, prefix: str) -> bool:
 	pattern = prefix + r"[0-9a-fA-F]{4}_[0-9a-fA-F]{4}_[0-9a-fA-F]{4}_[0-9a-fA-F]{4}"
 	return re.fullmatch(pattern, id) is not None
 
+def _parse_cached_tasks(value: str) -> List[int]:  # header "Cached-Tasks: T-..., T-...", invalid IDs are ignored
+	taskIDs = [taskID.strip() for taskID in value.split(",")]
+	return sorted({_id_to_int(taskID, "T-") for taskID in taskIDs if _is_valid_id(taskID, "T-")})
+
 
 class WorkerManager:
 	idCounter: int = 0
@@ -39,13 +47,15 @@ class WorkerManager:
 	subtaskFinishedCallback: Callable[[RenderTask], None] = None
 
 	subtaskFailedCallback: Callable[[Subtask], None] = None
+	frameRenderedCallback: Callable[[Subtask, float], None] = None  # seconds per frame measured between results
 
 
 	### Called via URL
 	@staticmethod
 	def set_callbacks(freeWorkerCb: Callable[[], None],
 					  subtaskFinishedCb: Callable[[RenderTask], None],
-					  subtaskFailedCb: Callable[[Subtask], None]):
+					  subtaskFailedCb: Callable[[Subtask], None],
+					  frameRenderedCb: Callable[[Subtask, float], None]):
 
 		WorkerManager.freeWorkerCallback = freeWorkerCb
 		if (not WorkerManager.freeWorkerCalled):
@@ -54,6 +64,7 @@ class WorkerManager:
 
 		WorkerManager.subtaskFinishedCallback = subtaskFinishedCb
 		WorkerManager.subtaskFailedCallback = subtaskFailedCb
+		WorkerManager.frameRenderedCallback = frameRenderedCb
 
 	@staticmethod
 	def register(request: HttpRequest) -> HttpResponse:
@@ -92,7 +103,14 @@ class WorkerManager:
 		except:
 			return HttpResponse(f"Invalid performance score header field: {request.headers["Performance-Score"]}", status=HTTPStatus.BAD_REQUEST)
 
-		Worker(WorkerID_Int=workerID_int, WorkerID=workerID, Host=host, Port=port, PerformanceScore=score, Status=WorkerStatus.Available).save()
+		cachedTasks = _parse_cached_tasks(request.headers.get("Cached-Tasks", ""))  # blend data kept from before, e.g. on disk
+
+		Worker(WorkerID_Int=workerID_int, WorkerID=workerID, Host=host, Port=port, PerformanceScore=score, Status=WorkerStatus.Available,
+			   CachedTasks=cachedTasks).save()
+
+		# A (re)registering Worker renders nothing, subtasks it had before e.g. a crash are reassigned by the next pass
+		Subtask.objects.filter(Worker=workerID_int, Stage=SubtaskStage.Running).update(Stage=SubtaskStage.Pending)
+
 		WorkerManager.freeWorkerCallback()
 
 		return HttpResponse("Registered worker successfully", status=HTTPStatus.OK, headers={"Worker-Id": workerID})
@@ -122,6 +140,27 @@ class WorkerManager:
 
 		filtered.first().Status = newStatus
 
+	@staticmethod
+	def heartbeat(request: HttpRequest) -> HttpResponse:
+		difference = {"Worker-Id"}.difference(request.headers)
+		if difference:  # difference is not empty -> header fields missing
+			return HttpResponse(f"Missing header fields for heartbeat: {", ".join(difference)}", status=HTTPStatus.BAD_REQUEST)
+
+		workerID = request.headers["Worker-Id"]
+		if not _is_valid_id(workerID, "W-"):
+			return HttpResponse("Invalid WorkerID", status=HTTPStatus.BAD_REQUEST)
+
+		workerID_int = _id_to_int(workerID, "W-")
+		filtered: QuerySet = Worker.objects.filter(WorkerID_Int=workerID_int)
+		if not filtered.exists():
+			return HttpResponse("Unknown WorkerID", status=HTTPStatus.BAD_REQUEST)
+
+		# The Worker's report replaces what was recorded, it may have evicted blend data meanwhile
+		if ("Cached-Tasks" in request.headers):
+			filtered.update(CachedTasks=_parse_cached_tasks(request.headers["Cached-Tasks"]))
+
+		return HttpResponse("Heartbeat received", status=HTTPStatus.OK)
+
 	@staticmethod
 	def receive_result(request: HttpRequest):
 		difference = {"Worker-Id", "Task-Id", "Subtask-Index", "Frame"}.difference(set(request.headers))
@@ -161,6 +200,8 @@ class WorkerManager:
 			return HttpResponse("Worker not responsible for this task", status=HTTPStatus.BAD_REQUEST)
 
 		subtask = filtered[0]
+		if (SubtaskStage(subtask.Stage) == SubtaskStage.Aborted):  # e.g. another copy finished first
+			return HttpResponse("Subtask was aborted", status=HTTPStatus.BAD_REQUEST)
 
 		# Check Frame
 		try:
@@ -168,24 +209,86 @@ class WorkerManager:
 		except:
 			return HttpResponse("Invalid value in header field 'Frame'", status=HTTPStatus.BAD_REQUEST)
 
-		if (frame < subtask.StartFrame or frame > subtask.EndFrame):
+		frameIndex = task.frame_index(frame)
+		if (frame < subtask.StartFrame or frame > subtask.EndFrame or frameIndex is None):
 			return HttpResponse(f"Got unexpected frame {frame}", status=HTTPStatus.BAD_REQUEST)  # other HTTPStatus: not responsible
 			# TODO: Check if Worker runs with wrong task
 
+		# Written to a temporary file first, moved in place once the frame's bit is set
 		outputType = RenderOutputType(task.OutputType)
 		filepath = f"{task.get_folder()}/{str(frame).zfill(len(str(task.EndFrame)))}{outputType.get_extension()}"
-		with open(filepath, 'wb') as file:
+		fd, tempPath = tempfile.mkstemp(dir=task.get_folder(), suffix=".part")
+		with os.fdopen(fd, 'wb') as file:
 			file.write(request.body)
 
-		subtask.LastestFrame = frame
-
-		if (frame == subtask.EndFrame):
-			subtask.Stage = SubtaskStage.Finished
-			WorkerManager.subtaskFinishedCallback(task)
-
-		subtask.save()
+		# Bit tested and set under the lock of the task, so of concurrent results for the same frame only one counts
+		# The subtask is read again under its lock, a concurrent pass may have shrunk it (see TaskScheduler.steal_subtask)
+		secondsPerFrame = None
+		with transaction.atomic():
+			task = RenderTask.objects.select_for_update().get(TaskID_Int=taskID_int)
+			subtask = Subtask.objects.select_for_update().get(SubtaskIndex=subtask.SubtaskIndex)
+			if (SubtaskStage(subtask.Stage) == SubtaskStage.Aborted):
+				os.remove(tempPath)
+				return HttpResponse("Subtask was aborted", status=HTTPStatus.BAD_REQUEST)
+
+			rendered = task.get_rendered_frames()
+			duplicate = rendered.get(frameIndex)
+			if not duplicate:
+				rendered.set(frameIndex)
+				task.RenderedFrames = rendered.to_bytes()
+				task.save(update_fields=["RenderedFrames"])
+				os.replace(tempPath, filepath)  # before the commit, a task with all bits set has all its files
+
+				# Time since the previous result, the first result of a subtask also contains download and scene loading
+				now = timezone.now()
+				if (subtask.LastFrameAt is not None and subtask.LastestFrame is not None and frame > subtask.LastestFrame):
+					framesRendered = max((frame - subtask.LastestFrame) // task.FrameStep, 1)
+					secondsPerFrame = (now - subtask.LastFrameAt).total_seconds() / framesRendered
+
+				if (frame <= subtask.EndFrame):  # beyond if the tail was given to another worker meanwhile
+					subtask.LastestFrame = frame
+					subtask.LastFrameAt = now
+
+			# Done with its last frame, or once all its frames arrived in whatever order, from whichever copy or retry
+			# Frames it skipped are handed out again by the callback
+			startIndex, endIndex = task.frame_index(subtask.StartFrame), task.frame_index(subtask.EndFrame)
+			subtaskDone = frame == subtask.EndFrame or rendered.count(startIndex, endIndex) == endIndex - startIndex + 1
+			subtaskFinished = subtaskDone and SubtaskStage(subtask.Stage) == SubtaskStage.Running
+			if subtaskFinished:
+				subtask.Stage = SubtaskStage.Finished  # before the callback, it checks the stages of all subtasks of the task
+			if (subtaskFinished or not duplicate):
+				subtask.save(update_fields=["LastestFrame", "LastFrameAt", "Stage"])
+
+			taskFinished = not duplicate and rendered.is_full()  # this result completed the task
+
+		# Frames delivered already, by another copy of a speculated subtask or before a retry, are discarded
+		if duplicate:
+			os.remove(tempPath)
+		message = "Frame was delivered already" if duplicate else "Accepted frame"
+
+		if (secondsPerFrame is not None and WorkerManager.frameRenderedCallback is not None):
+			WorkerManager.frameRenderedCallback(subtask, secondsPerFrame)
+
+		if not (subtaskFinished or taskFinished):
+			return HttpResponse(message, status=HTTPStatus.OK)
+
+		# First copy to finish wins, the others are aborted, frames none of them delivered are handed out again
+		# Once every frame arrived, all subtasks still running on the task are aborted
+		# Conditional updates, the rows may have changed since they were read (progress, Worker.CachedTasks)
+		freedWorkers = [subtask.Worker_id] if subtaskFinished else []
+		others = task.Subtask_set.exclude(SubtaskIndex=subtask.SubtaskIndex) if taskFinished else subtask.copies()
+		for other in others:
+			if not Subtask.objects.filter(SubtaskIndex=other.SubtaskIndex, Stage=SubtaskStage.Running).update(Stage=SubtaskStage.Aborted):
+				continue
+			Sender.cancel_task(other)
+			freedWorkers.append(other.Worker_id)
+
+		WorkerManager.subtaskFinishedCallback(task)
+
+		if Worker.objects.filter(WorkerID_Int__in=freedWorkers, Status=WorkerStatus.Working).update(Status=WorkerStatus.Available):
+			WorkerManager.freeWorkerCallback()
 
-		return HttpResponse("Accepted frame", status=HTTPStatus.OK)
+		return HttpResponse(message, status=HTTPStatus.OK)
 
 	@staticmethod
 	def download_blender_data(request: HttpRequest):
@@ -211,6 +314,15 @@ class WorkerManager:
 		path = task.get_blender_data_path()
 		response = FileResponse(open(path, "rb"))
 
+		# Optional, the Worker holds the blend data from now on, which the scheduler prefers for further subtasks
+		workerID = request.headers.get("Worker-Id", "")
+		if _is_valid_id(workerID, "W-"):
+			worker = Worker.objects.filter(WorkerID_Int=_id_to_int(workerID, "W-")).first()
+			dataTaskID = task.get_blender_data_task_id()
+			if (worker is not None and dataTaskID not in worker.CachedTasks):
+				worker.CachedTasks.append(dataTaskID)
+				worker.save(update_fields=["CachedTasks"])
+
 		return response
 
 	### Called from TaskScheduler
@@ -219,6 +331,11 @@ class WorkerManager:
 		for subtask in subtasks:
 			Sender.add_task(subtask)
 
+	@staticmethod
+	def update_subtasks(subtasks: List[Subtask]):  # frame range changed, e.g. the tail was given to another Worker
+		for subtask in subtasks:
+			Sender.add_task(subtask, WorkerCommand.UpdateTask)
+
 
 	### Callback for Sender
 	@staticmethod
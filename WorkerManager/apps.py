@@ -7,12 +7,16 @@ class WorkermanagerConfig(AppConfig):
 
     def ready(self):
         from .WorkerManager import WorkerManager
+        from .Sender import Sender
+        Sender.set_callbacks(WorkerManager.sending_failed)
+
+    def start_services(self):  # server process only, see boom.services
         from .Sender import Sender
         from .models import Worker
         from .Enums import WorkerStatus
-        Sender.set_callbacks(WorkerManager.sending_failed)
 
-        for worker in Worker.objects.all():
+        for worker in Worker.objects.all():  # registered with a previous server process
             worker.Status = WorkerStatus.Disconnected
             worker.save()
 
+        Sender.start()
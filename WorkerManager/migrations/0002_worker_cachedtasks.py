@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkerManager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='CachedTasks',
+            field=models.JSONField(default=list),
+        ),
+    ]
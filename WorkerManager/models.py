@@ -10,3 +10,4 @@ class Worker(models.Model):
 	Port                = models.PositiveIntegerField()
 	PerformanceScore    = models.PositiveIntegerField()
 	Status              = models.CharField(max_length=2, choices=WorkerStatus)
+	CachedTasks         = models.JSONField(default=list)  # TaskID_Int of the blend data the Worker holds (see RenderTask.get_blender_data_task_id)
@@ -1,3 +1,160 @@
-from django.test import TestCase
+import os
+import queue
+import tempfile
+from threading import Thread
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, TestCase
+
+from TaskScheduler.ConcatManager import ConcatManager
+from TaskScheduler.Enums import BlenderDataType, RenderOutputType, SubtaskStage, TaskStage
+from TaskScheduler.FrameBitmap import FrameBitmap
+from TaskScheduler.models import RenderTask, Subtask
+from TaskScheduler.TaskScheduler import TaskScheduler
+from .Enums import WorkerStatus
+from .models import Worker
+from .Sender import MAX_RETRIES, MAX_SENDER_THREADS, Sender, ThreadJob
+from .WorkerManager import WorkerManager
+
+
+class SenderTests(TestCase):
+	def setUp(self):
+		self.worker = Worker.objects.create(WorkerID_Int=0, WorkerID="W-0000_0000_0000_0000", Host="localhost", Port=1,
+											PerformanceScore=1, Status=WorkerStatus.Working)
+		self.task = RenderTask.objects.create(FileServerAddress="localhost", FileServerPort=8000, DataType=BlenderDataType.SingleFile,
+											  StartFrame=1, EndFrame=10, FrameStep=1, Stage=TaskStage.Rendering)
+
+	def initial_slots(self) -> list:  # as Sender.threads starts
+		return [ThreadJob(Thread(), None) for i in range(MAX_SENDER_THREADS)]
+
+	def check_threads(self, slots):  # one round of Sender.assign_tasks with the failures going to TaskScheduler
+		with mock.patch.object(Sender, "threads", slots), mock.patch.object(Sender, "taskQueue", queue.Queue()), \
+				mock.patch.object(Sender, "sendingFailedCallback", TaskScheduler.subtask_failed), mock.patch.object(TaskScheduler, "wake"):
+			Sender.check_threads()
+
+	def create_subtask(self, stage: SubtaskStage) -> Subtask:
+		return Subtask.objects.create(Task=self.task, Worker=self.worker, StartFrame=1, EndFrame=10, Portion=1.0, Stage=stage)
+
+	def test_initial_slots_are_not_failures(self):
+		slots = self.initial_slots()
+		self.check_threads(slots)
+
+		self.assertTrue(all(slot.Done for slot in slots))
+		self.worker.refresh_from_db()
+		self.assertEqual(self.worker.Status, WorkerStatus.Working)
+
+	def test_failed_start_moves_subtask_back_to_pending(self):
+		subtask = self.create_subtask(SubtaskStage.Running)
+		self.check_threads([ThreadJob(Thread(), subtask)] + self.initial_slots()[1:])  # thread not alive, Done False: sending failed
+
+		subtask.refresh_from_db()
+		self.worker.refresh_from_db()
+		self.assertEqual(subtask.Stage, SubtaskStage.Pending)
+		self.assertEqual(self.worker.Status, WorkerStatus.Disconnected)
+
+	def test_failed_start_of_finished_subtask_is_ignored(self):
+		subtask = self.create_subtask(SubtaskStage.Running)
+		Subtask.objects.filter(SubtaskIndex=subtask.SubtaskIndex).update(Stage=SubtaskStage.Finished)  # finished before the retries ran out
+		self.check_threads([ThreadJob(Thread(), subtask)] + self.initial_slots()[1:])
+
+		subtask.refresh_from_db()
+		self.worker.refresh_from_db()
+		self.assertEqual(subtask.Stage, SubtaskStage.Finished)
+		self.assertEqual(self.worker.Status, WorkerStatus.Working)
+
+	def test_unreachable_worker_gives_up_after_retries(self):
+		subtask = self.create_subtask(SubtaskStage.Running)
+		slots = [ThreadJob(Thread(), subtask)]
+		with mock.patch.object(Sender, "threads", slots), mock.patch("http.client.HTTPConnection", side_effect=ConnectionRefusedError) as connection, \
+				mock.patch("builtins.print"):
+			Sender.send(subtask, 0)
+
+		self.assertEqual(connection.call_count, MAX_RETRIES)
+		self.assertFalse(slots[0].Done)
+
+
+
+class ReceiveResultTests(TestCase):
+	def setUp(self):
+		workingDirectory = os.getcwd()
+		os.chdir(tempfile.mkdtemp(prefix="receive_result_"))  # frames are written to tasks/
+		self.addCleanup(os.chdir, workingDirectory)
+
+		self.workers = [Worker.objects.create(WorkerID_Int=i, WorkerID=f"W-0000_0000_0000_000{i}", Host="localhost", Port=i + 1,
+											  PerformanceScore=1, Status=WorkerStatus.Working) for i in range(2)]
+		self.task = RenderTask.create("localhost", 8000, BlenderDataType.SingleFile, None)  # with TaskID and folder
+		self.task.StartFrame, self.task.EndFrame, self.task.FrameStep = 1, 10, 1
+		self.task.OutputType, self.task.Stage, self.task.FramesAssigned = RenderOutputType.PNG, TaskStage.Rendering, True
+		self.task.RenderedFrames = FrameBitmap(10).to_bytes()
+		self.task.save()
+
+		for target, attribute in ((ConcatManager, "add_task"), (Sender, "cancel_task"), (TaskScheduler, "wake")):
+			patcher = mock.patch.object(target, attribute)
+			setattr(self, attribute, patcher.start())
+			self.addCleanup(patcher.stop)
+		patcher = mock.patch.object(WorkerManager, "freeWorkerCallback")
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def create_subtask(self, worker: int, startFrame: int, endFrame: int) -> Subtask:
+		return Subtask.objects.create(Task=self.task, Worker=self.workers[worker], StartFrame=startFrame, EndFrame=endFrame,
+									  Portion=(endFrame - startFrame + 1) / 10, Stage=SubtaskStage.Running)
+
+	def send(self, subtask: Subtask, *frames: int) -> list[int]:
+		statuses = []
+		for frame in frames:
+			request = RequestFactory().post("/", data=b"frame", content_type="image/png",
+											headers={"Worker-Id": subtask.Worker.WorkerID, "Task-Id": self.task.TaskID,
+													 "Subtask-Index": str(subtask.SubtaskIndex), "Frame": str(frame)})
+			statuses.append(WorkerManager.receive_result(request).status_code)
+		return statuses
+
+	def assert_stages(self, *expected):
+		for subtask, stage in expected:
+			subtask.refresh_from_db()
+			self.assertEqual(subtask.Stage, stage)
+
+	def test_late_frame_of_finished_subtask_completes_the_task(self):
+		first = self.create_subtask(0, 1, 10)
+		self.assertEqual(self.send(first, *range(1, 9), 10), [200] * 9)  # frame 9 is lost, handed out again
+		self.task.refresh_from_db()
+		self.assertEqual(self.task.get_unassigned_frames(), [(9, 9)])
+		requeued = self.create_subtask(1, 9, 9)
+
+		self.assertEqual(self.send(first, 9), [200])  # arrives after all
+
+		self.task.refresh_from_db()
+		self.assert_stages((first, SubtaskStage.Finished), (requeued, SubtaskStage.Aborted))
+		self.assertEqual(self.task.Stage, TaskStage.Concatenating)
+		self.add_task.assert_called_once()
+		self.cancel_task.assert_called_once()
+		self.assertEqual(Worker.objects.get(WorkerID_Int=1).Status, WorkerStatus.Available)
+
+	def test_duplicate_of_finished_task_does_not_concatenate_again(self):
+		first = self.create_subtask(0, 1, 10)
+		self.send(first, *range(1, 9), 10)
+		requeued = self.create_subtask(1, 9, 9)
+
+		self.assertEqual(self.send(requeued, 9) + self.send(first, 9), [200, 200])
+
+		self.task.refresh_from_db()
+		self.assert_stages((first, SubtaskStage.Finished), (requeued, SubtaskStage.Finished))
+		self.assertEqual(self.task.Stage, TaskStage.Concatenating)
+		self.add_task.assert_called_once()
+		self.assertEqual(sorted(os.listdir(self.task.get_folder())), [f"{frame:02}.png" for frame in range(1, 11)])
+
+	def test_duplicate_end_frame_finishes_the_subtask(self):
+		first = self.create_subtask(0, 1, 5)
+		second = self.create_subtask(1, 6, 10)
+		self.send(second, 6)
+		second.refresh_from_db()
+		second.StartFrame, second.EndFrame = 7, 10
+		second.save()
+		first.EndFrame = 6  # as if its tail was shrunk back, frame 6 arrived already
+		first.save()
+
+		self.assertEqual(self.send(first, *range(1, 6)) + self.send(first, 6), [200] * 6)
+
+		self.assert_stages((first, SubtaskStage.Finished), (second, SubtaskStage.Running))
+		self.assertEqual(Worker.objects.get(WorkerID_Int=0).Status, WorkerStatus.Available)
+		self.add_task.assert_not_called()
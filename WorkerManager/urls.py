@@ -5,6 +5,7 @@ from .WorkerManager import WorkerManager as Manager
 urlpatterns = [
     path("register/", Manager.register, name="register"),
     path("unregister/", Manager.unregister, name="unregister"),
+    path("heartbeat/", Manager.heartbeat, name="heartbeat"),
     path("post-render-result/", Manager.receive_result, name="receive_result"),
     path("download-blender-data/", Manager.download_blender_data, name="download_blender_data")
 ]
\ No newline at end of file
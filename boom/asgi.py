@@ -14,3 +14,6 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "boom.settings")
 
 application = get_asgi_application()
+
+from boom import services  # noqa: E402, needs the apps loaded
+services.start()
@@ -0,0 +1,19 @@
+from django.apps import apps
+
+
+started = False
+
+
+def start():
+    """Starts the background threads of the apps: scheduler loop, sending to workers, concatenation
+
+    Called by the WSGI and ASGI entry points, which runserver uses as well. Management commands, shells and tests
+    don't load them, so they neither run passes against the database nor have threads left when they exit.
+    """
+    global started
+    if started:
+        return
+    started = True
+
+    apps.get_app_config("WorkerManager").start_services()  # marks the workers of a previous process disconnected first
+    apps.get_app_config("TaskScheduler").start_services()
@@ -212,3 +212,8 @@ STATIC_ROOT = os.path.join(BASE_DIR,'static')
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Folder for parsed SDNAs of blend files, shared between processes and restarts (off if unset)
+# Keep it outside the repository and only writable by this service
+
+SDNA_CACHE_DIR = env("SDNA_CACHE_DIR", default=None)
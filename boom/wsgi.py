@@ -17,3 +17,6 @@ environ.Env.read_env()
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "boom.settings")
 
 application = get_wsgi_application()
+
+from boom import services  # noqa: E402, needs the apps loaded
+services.start()
@@ -0,0 +1,42 @@
+# Benchmark: RenderedFrames bitmap of RenderTask (setting a frame, is_finished, missing frame runs)
+# Usage: python testing/benchmark_bitmap.py [frame count ...]   (defaults to 10^3 10^4 10^6)
+#
+# Works on FrameBitmap directly, so no database is needed. Every MISSING_EVERY-th frame is left out, like results
+# that never arrived, which is the worst case for the run search.
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+from TaskScheduler.FrameBitmap import FrameBitmap
+
+MISSING_EVERY = 100
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def set_frames(bitmap: FrameBitmap):
+    for index in range(len(bitmap)):
+        if (index % MISSING_EVERY != 0):
+            bitmap.set(index)
+
+
+counts = [int(arg) for arg in sys.argv[1:]] or [10**3, 10**4, 10**6]
+for frameCount in counts:
+    bitmap = FrameBitmap(frameCount)
+    _, setting = timed(set_frames, bitmap)
+    finished, finishing = timed(bitmap.is_full)
+    runs, searching = timed(bitmap.missing_runs)
+    assert (not finished and len(runs) == (frameCount + MISSING_EVERY - 1) // MISSING_EVERY)
+
+    full = FrameBitmap(frameCount, b"\xff" * ((frameCount + 7) // 8))
+    fullRuns, searchingFull = timed(full.missing_runs)
+
+    print(f"{frameCount} frames, {len(bitmap.to_bytes())} bytes:")
+    print(f"  set        {setting / frameCount * 1e9:10.1f} ns per frame")
+    print(f"  is_finished {finishing * 1000:9.3f} ms")
+    print(f"  missing runs {searching * 1000:8.3f} ms ({len(runs)} runs), {searchingFull * 1000:8.3f} ms when complete")
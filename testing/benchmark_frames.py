@@ -0,0 +1,86 @@
+# Benchmark: frame bookkeeping of RenderTask (get_unassigned_frames, is_finished) with lists/sets vs. FrameSet
+# Usage: python testing/benchmark_frames.py [frame count ...]   (defaults to 10^3 10^4 10^6)
+#
+# Mirrors the RenderTask methods on plain (StartFrame, EndFrame) subtasks, so no database is needed.
+# The former approach is quadratic and only run up to MAX_FORMER_FRAMES.
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+from TaskScheduler.FrameSet import FrameSet
+
+SUBTASKS = 1000
+MAX_FORMER_FRAMES = 20000
+
+
+def former_unassigned(start: int, end: int, step: int, subtasks) -> list:
+    frames = list(range(start, end + 1, step))
+    for subtaskStart, subtaskEnd in subtasks:
+        for frame in range(subtaskStart, subtaskEnd + 1, step):
+            frames[frames.index(frame)] = -1
+
+    frames.append(-1)
+    ranges = []
+    rangeStart = -1
+    for i in range(len(frames)):
+        if (rangeStart == -1 and frames[i] != -1):
+            rangeStart = frames[i]
+        elif (rangeStart != -1 and frames[i] == -1):
+            ranges.append((rangeStart, frames[i - 1]))
+            rangeStart = -1
+    return ranges
+
+
+def former_finished(start: int, end: int, step: int, subtasks) -> bool:
+    frames = set(range(start, end + 1, step))
+    for subtaskStart, subtaskEnd in subtasks:
+        for frame in range(subtaskStart, subtaskEnd + 1, step):
+            frames = frames - {frame}
+    return not frames
+
+
+def frameset_unassigned(start: int, end: int, step: int, subtasks) -> list:
+    frames = FrameSet.from_range(start, end, step)
+    for subtaskStart, subtaskEnd in subtasks:
+        frames.remove(subtaskStart, subtaskEnd)
+    return [(runStart, runEnd) for runStart, runEnd, _ in frames.runs()]
+
+
+def frameset_finished(start: int, end: int, step: int, subtasks) -> bool:
+    frames = FrameSet.from_range(start, end, step)
+    for subtaskStart, subtaskEnd in subtasks:
+        frames.remove(subtaskStart, subtaskEnd)
+    return not frames
+
+
+def make_subtasks(frameCount: int, step: int):  # every other of SUBTASKS equal parts, half of the frames assigned
+    size = max(frameCount // SUBTASKS, 1)
+    return [(1 + i * size * step, 1 + ((i + 1) * size - 1) * step) for i in range(0, min(SUBTASKS, frameCount), 2)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+counts = [int(arg) for arg in sys.argv[1:]] or [10**3, 10**4, 10**6]
+step = 1
+for frameCount in counts:
+    end = 1 + (frameCount - 1) * step
+    subtasks = make_subtasks(frameCount, step)
+
+    newRanges, newUnassigned = timed(frameset_unassigned, 1, end, step, subtasks)
+    newDone, newFinished = timed(frameset_finished, 1, end, step, subtasks)
+    print(f"{frameCount} frames, {len(subtasks)} subtasks:")
+    print(f"  FrameSet:  get_unassigned_frames {newUnassigned * 1000:10.3f} ms   is_finished {newFinished * 1000:10.3f} ms")
+
+    if (frameCount > MAX_FORMER_FRAMES):
+        print(f"  former:    skipped, quadratic")
+        continue
+
+    oldRanges, oldUnassigned = timed(former_unassigned, 1, end, step, subtasks)
+    oldDone, oldFinished = timed(former_finished, 1, end, step, subtasks)
+    assert (oldRanges == newRanges and oldDone == newDone)
+    print(f"  former:    get_unassigned_frames {oldUnassigned * 1000:10.3f} ms   is_finished {oldFinished * 1000:10.3f} ms")
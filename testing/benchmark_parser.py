@@ -0,0 +1,159 @@
+# Benchmark suite: parser throughput and peak RSS on generated blend files (see generate_blend.py)
+# Usage: python testing/benchmark_parser.py [--scale F] [--repeat N] [--directory DIR]
+#
+# Every measurement runs in a fresh process, so the SDNA cache starts cold and the peak RSS belongs to that measurement only.
+import argparse
+import multiprocessing
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is not reported there
+    resource = None
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+sys.path.insert(0, str(pathlib.Path(__file__).parent.absolute()))
+from generate_blend import generate, zstandard
+from TaskScheduler.BlendFile import BlendFile, BlendFileParser, BlockTable, Compression, Header, SDNA, SDNACache
+
+
+def reset_peak_rss():  # Linux only, elsewhere the peak covers the whole process
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:  # bytes
+    try:
+        with open("/proc/self/status") as status:  # VmHWM is reset by reset_peak_rss, ru_maxrss is even inherited from the parent
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if (resource is None):
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if (sys.platform == "darwin") else peak * 1024
+
+
+def find_dna1(path: str):  # header and DNA1 content of an uncompressed file
+    with open(path, "rb") as file:
+        data = file.read()
+    buffer = memoryview(data)
+    header = Header.from_buffer(buffer)
+    blocks = BlockTable.scan(buffer, header)
+    index = blocks.find("DNA1")
+    return header, data[blocks.Offsets[index]:blocks.Offsets[index] + blocks.Lengths[index]]
+
+
+def read_header(path: str):
+    with open(path, "rb") as file:
+        return Header.read(file)
+
+
+def feed_parser(path: str):  # upload path, 1 MiB chunks
+    parser = BlendFileParser()
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(1024 * 1024)
+            if not chunk or not parser.feed(chunk):
+                break
+    return parser.close()
+
+
+def measure(name: str, path: str, repeat: int, queue):  # runs in a child process
+    SDNACache.Directory = None  # nothing from earlier runs on disk
+    if (name == "Header.read"):
+        function, size = (lambda: read_header(path)), 12
+    elif (name == "SDNA.read"):
+        header, dna1 = find_dna1(path)
+        function, size = (lambda: SDNA.read(dna1, header.Endianness, header.PointerSize)), len(dna1)
+    elif (name == "BlendFile.read"):
+        function, size = (lambda: (SDNACache.clear(), BlendFile.read(path))[1]), os.path.getsize(path)
+    elif (name == "get_current_scene"):  # SDNA cached by the first call, as for repeated uploads of the same Blender version
+        BlendFile.get_current_scene(path)
+        function, size = (lambda: BlendFile.get_current_scene(path)), os.path.getsize(path)
+    else:
+        function, size = (lambda: feed_parser(path)), os.path.getsize(path)
+
+    reset_peak_rss()
+    baseline = peak_rss()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+        if (result is None):
+            queue.put((name, size, None, 0, 0))
+            return
+
+    peak = peak_rss()
+    queue.put((name, size, min(seconds), peak, peak - baseline))
+
+
+def run(name: str, path: str, repeat: int):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(name, path, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+CASES = [  # name, generate() arguments, sizes are multiplied with --scale
+    ("default", {}),
+    ("many blocks", {"blocks": 200000}),
+    ("packed data", {"packedMB": 256}),
+    ("large SDNA", {"sdnaStructs": 5000}),
+    ("32 bit big endian", {"blocks": 20000, "pointerSize": 4, "endian": "big"}),
+    ("many scenes", {"scenes": 200}),
+    ("gzip", {"blocks": 20000, "packedMB": 32, "compression": "gzip"}),
+    ("zstd", {"blocks": 20000, "packedMB": 32, "compression": "zstd"}),
+]
+
+FUNCTIONS = ["Header.read", "SDNA.read", "BlendFile.read", "get_current_scene", "BlendFileParser"]
+
+if __name__ == "__main__":
+    argumentParser = argparse.ArgumentParser(description="Benchmark the blend file parser on generated files")
+    argumentParser.add_argument("--scale", type=float, default=1.0, help="multiplier for block count and packed data")
+    argumentParser.add_argument("--repeat", type=int, default=3)
+    argumentParser.add_argument("--directory", help="where the generated files are written, a temporary directory otherwise")
+    args = argumentParser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.directory or temporary
+        for caseName, arguments in CASES:
+            if (arguments.get("compression") == "zstd" and zstandard is None):
+                print(f"{caseName}: skipped, zstandard is not installed")
+                continue
+
+            arguments = dict(arguments)
+            for key in ("blocks", "packedMB"):
+                if (key in arguments):
+                    arguments[key] = int(arguments[key] * args.scale)
+
+            path = os.path.join(directory, f"{caseName.replace(' ', '_')}.blend")
+            generate(path, **arguments)
+            with open(path, "rb") as file:
+                compressed = Compression.detect(file.read(4)) != Compression.NONE
+
+            print(f"{caseName}: {os.path.getsize(path) / 2**20:.1f} MiB {arguments}")
+            for name in FUNCTIONS:
+                if (compressed and name in ("Header.read", "SDNA.read")):  # need the uncompressed layout
+                    continue
+
+                name, size, seconds, peak, growth = run(name, path, args.repeat)
+                if (seconds is None):
+                    print(f"  {name:18} failed")
+                    continue
+                print(f"  {name:18} {seconds * 1000:10.3f} ms  {size / 2**20 / seconds:10.1f} MiB/s  "
+                      f"peak RSS {peak / 2**20:7.1f} MiB (+{growth / 2**20:.1f})")
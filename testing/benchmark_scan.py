@@ -0,0 +1,57 @@
+# Benchmark: walking the BHead chain into BHead objects vs. into the array-backed BlockTable
+# Usage: python testing/benchmark_scan.py [file.blend ...]   (defaults to testing/example.blend)
+import mmap
+import pathlib
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+from TaskScheduler.BlendFile import BHead, BlockTable, Header
+
+
+def scan_objects(buffer: memoryview, header: Header):  # former approach: one BHead per block, filtered afterwards
+    bheadStruct = BHead.get_struct(header.PointerSize, header.Endianness)
+    offset = 12
+    bheads = []
+    while True:
+        bhead = BHead.from_buffer(buffer, offset, bheadStruct)
+        bheads.append(bhead)
+        if (bhead.Code == "ENDB"):
+            break
+        offset = bhead.ContentPos + bhead.Length
+
+    return bheads, list(filter(lambda bhead: bhead.Code.startswith("SC"), bheads))
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()  # again without tracing overhead
+    function(*args)
+    return result, min(seconds, time.perf_counter() - start), peak
+
+
+paths = sys.argv[1:] or [f"{pathlib.Path(__file__).parent.absolute()}/example.blend"]
+for path in paths:
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        buffer = memoryview(mapped)
+        header = Header.from_buffer(buffer)
+
+        (bheads, _), objectSeconds, objectPeak = measure(scan_objects, buffer, header)
+        fullTable, fullSeconds, fullPeak = measure(BlockTable.scan, buffer, header, False)
+        earlyTable, earlySeconds, earlyPeak = measure(BlockTable.scan, buffer, header, True)
+
+        size = len(buffer)
+        print(f"{path}: {size / 2**20:.1f} MiB, {len(bheads)} blocks")
+        print(f"  BHead objects:          {objectSeconds:7.3f} s  {size / 2**20 / objectSeconds:8.1f} MiB/s  peak {objectPeak / 2**20:8.2f} MiB")
+        print(f"  BlockTable, full:       {fullSeconds:7.3f} s  {size / 2**20 / fullSeconds:8.1f} MiB/s  peak {fullPeak / 2**20:8.2f} MiB")
+        print(f"  BlockTable, stop early: {earlySeconds:7.3f} s  {size / 2**20 / earlySeconds:8.1f} MiB/s  peak {earlyPeak / 2**20:8.2f} MiB  ({len(earlyTable)} blocks scanned)")
+
+        del bheads, fullTable, earlyTable
+        buffer.release()
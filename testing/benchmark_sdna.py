@@ -0,0 +1,58 @@
+# Micro-benchmark: decoding of the SDNA (DNA1 block) of real blend files
+# Usage: python testing/benchmark_sdna.py [file.blend ...]   (defaults to testing/example.blend)
+import io
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+from TaskScheduler.BlendFile import BHead, BufferReader, Header, SDNA, StrSDNAList, UShortSDNAList
+
+REPEAT = 5
+
+
+def find_dna1(data: bytes):
+    buffer = memoryview(data)
+    header = Header.from_buffer(buffer)
+    bheadStruct = BHead.get_struct(header.PointerSize, header.Endianness)
+    offset = 12
+    while True:
+        bhead = BHead.from_buffer(buffer, offset, bheadStruct)
+        if (bhead.Code == "DNA1"):
+            return header, data[bhead.ContentPos:bhead.ContentPos + bhead.Length]
+        if (bhead.Code == "ENDB"):
+            raise Exception("No DNA1 block found")
+        offset = bhead.ContentPos + bhead.Length
+
+
+def read_tables(bytestream, endian):
+    bytestream.seek(4)  # "SDNA"
+    names = StrSDNAList.read(bytestream, endian)
+    SDNA.__align_to_4__(bytestream)
+    types = StrSDNAList.read(bytestream, endian)
+    SDNA.__align_to_4__(bytestream)
+    UShortSDNAList.read(bytestream, endian, types.Count)
+    return names.Count, types.Count
+
+
+def best_of(statement) -> float:
+    return min(timeit.repeat(statement, number=1, repeat=REPEAT))
+
+
+paths = sys.argv[1:] or [f"{pathlib.Path(__file__).parent.absolute()}/example.blend"]
+for path in paths:
+    with open(path, "rb") as file:
+        header, dna1 = find_dna1(file.read())
+
+    endian = header.Endianness
+    nameCount, typeCount = read_tables(BufferReader(dna1), endian)
+
+    perByte = best_of(lambda: read_tables(io.BytesIO(dna1), endian))  # stream path, one read() per byte
+    bulk = best_of(lambda: read_tables(BufferReader(dna1), endian))
+    total = best_of(lambda: SDNA.read(dna1, endian, header.PointerSize))
+
+    print(f"{path}")
+    print(f"  Blender {header.Version}, DNA1 {len(dna1) / 1024:.1f} KiB, {nameCount} names, {typeCount} types")
+    print(f"  NAME/TYPE/TLEN per byte: {perByte * 1000:8.3f} ms")
+    print(f"  NAME/TYPE/TLEN bulk:     {bulk * 1000:8.3f} ms  ({perByte / bulk:.0f}x)")
+    print(f"  SDNA.read total:         {total * 1000:8.3f} ms")
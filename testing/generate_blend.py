@@ -0,0 +1,245 @@
+# Writes synthetic but structurally valid .blend files for parser tests and benchmarks
+# Usage: python testing/generate_blend.py out.blend [--blocks N] [--block-size B] [--sdna-structs N] [--pointer-size 4|8]
+#            [--endian little|big] [--packed-mb MB] [--scenes N] [--compression none|gzip|zstd]
+#
+# The SDNA contains the structures the backend reads (Scene, RenderData, ImageFormatData, ...) plus filler structures,
+# the file layout follows Blender: header, REND, GLOB, scenes and their camera objects, filler data, packed files, DNA1, ENDB.
+import argparse
+import gzip
+import random
+import struct
+
+try:
+    import zstandard
+except ImportError:  # only needed for --compression zstd
+    zstandard = None
+
+PRIMITIVE_SIZES = {"char": 1, "uchar": 1, "short": 2, "ushort": 2, "int": 4, "float": 4, "double": 8, "int64_t": 8, "void": 0}
+
+# fields as (type, name), names follow the SDNA notation ("*" for pointers, "[n]" for arrays)
+STRUCTURES = {
+    "ID": [("void", "*next"), ("void", "*prev"), ("char", "name[66]"), ("short", "flag"), ("int", "tag")],
+    "ImageFormatData": [("char", "depth"), ("char", "planes"), ("char", "imtype"), ("char", "quality"),
+                        ("char", "compress"), ("char", "jp2_flag"), ("char", "jp2_codec"), ("char", "_pad[1]")],
+    "FFMpegCodecData": [("int", "type"), ("int", "codec"), ("int", "video_bitrate"), ("int", "gop_size")],
+    "RenderData": [("ImageFormatData", "im_format"), ("FFMpegCodecData", "ffcodecdata"), ("int", "sfra"),
+                   ("int", "efra"), ("int", "frame_step"), ("int", "xsch"), ("int", "ysch"), ("short", "size"),
+                   ("short", "frs_sec"), ("float", "frs_sec_base"), ("char", "engine[32]")],
+    "SceneEEVEE": [("int", "flag"), ("int", "taa_render_samples")],
+    "Object": [("ID", "id"), ("float", "loc[3]"), ("float", "rot[3]"), ("void", "*data")],
+    "PackedFile": [("int", "size"), ("int", "seek"), ("void", "*data")],
+    "Scene": [("ID", "id"), ("Object", "*camera"), ("void", "*world"), ("RenderData", "r"), ("SceneEEVEE", "eevee")],
+}
+
+FILLER_TYPES = ["char", "short", "int", "float", "double", "int64_t"]
+
+
+def align_to_4(data: bytearray):
+    data += b"\x00" * (-len(data) % 4)
+
+
+class SDNABuilder:
+    """Builds the DNA1 content and keeps the type sizes needed to write matching structures"""
+
+    def field_size(self, fieldType: str, fieldName: str) -> int:
+        count = 1
+        for dim in fieldName[fieldName.find("["):].strip("[]").split("][") if ("[" in fieldName) else []:
+            count *= int(dim)
+        return (self.PointerSize if fieldName.startswith("*") else self.Sizes[fieldType]) * count
+
+    def add_structure(self, name: str, fields):
+        self.Sizes[name] = sum(self.field_size(fieldType, fieldName) for fieldType, fieldName in fields)
+        self.Structures[name] = fields
+        self.Indices[name] = len(self.Indices)
+
+    def build(self) -> bytes:
+        types = list(self.Sizes)
+        names = sorted({fieldName for fields in self.Structures.values() for _, fieldName in fields})
+        typeIndex = {name: index for index, name in enumerate(types)}
+        nameIndex = {name: index for index, name in enumerate(names)}
+
+        data = bytearray(b"SDNA")
+        for identifier, strings in ((b"NAME", names), (b"TYPE", types)):
+            data += identifier + struct.pack(self.Prefix + "i", len(strings))
+            data += b"".join(string.encode("utf-8") + b"\x00" for string in strings)
+            align_to_4(data)
+
+        data += b"TLEN" + struct.pack(f"{self.Prefix}{len(types)}H", *(self.Sizes[name] for name in types))
+        align_to_4(data)
+
+        data += b"STRC" + struct.pack(self.Prefix + "i", len(self.Structures))
+        for name, fields in self.Structures.items():
+            data += struct.pack(self.Prefix + "hh", typeIndex[name], len(fields))
+            for fieldType, fieldName in fields:
+                data += struct.pack(self.Prefix + "hh", typeIndex[fieldType], nameIndex[fieldName])
+
+        return bytes(data)
+
+    def __init__(self, pointerSize: int, endian: str, fillerStructs: int, fillerFields: int):
+        self.PointerSize = pointerSize
+        self.Prefix = "<" if (endian == "little") else ">"
+        self.Sizes = dict(PRIMITIVE_SIZES)  # type name -> size, in order of the TYPE table
+        self.Structures = {}
+        self.Indices = {}  # structure name -> SDNA index
+        for name, fields in STRUCTURES.items():
+            self.add_structure(name, fields)
+
+        for i in range(fillerStructs):
+            fields = [(FILLER_TYPES[(i + j) % len(FILLER_TYPES)], f"field{j}") for j in range(fillerFields)]
+            self.add_structure(f"Filler{i:04}", fields)
+
+
+class BlendWriter:
+    """Writes the file header and blocks, assigning every block a unique old pointer"""
+
+    def write_block(self, code: bytes, content: bytes, sdnaNr: int = 0, nr: int = 1, oldPtr: int = None) -> int:
+        if (oldPtr is None):
+            oldPtr = self.nextPointer
+            self.nextPointer += (len(content) + 15) & ~15 or 16
+
+        self.file.write(struct.pack(self.bheadFormat, code.ljust(4, b"\x00"), len(content), oldPtr, sdnaNr, nr))
+        self.file.write(content)
+        self.BlockCount += 1
+        return oldPtr
+
+    def pointer(self) -> int:  # address the next block will get
+        return self.nextPointer
+
+    def __init__(self, file, pointerSize: int, endian: str):
+        self.file = file
+        prefix = "<" if (endian == "little") else ">"
+        self.bheadFormat = f"{prefix}4si{'I' if (pointerSize == 4) else 'Q'}ii"
+        self.nextPointer = 0x10000
+        self.BlockCount = 0
+        file.write(b"BLENDER" + (b"_" if (pointerSize == 4) else b"-") + (b"v" if (endian == "little") else b"V") + b"401")
+
+
+class ZstdFrameWriter:
+    """Compresses into independent frames like Blender does, instead of one frame for the whole file"""
+    FrameSize = 1024 * 1024
+
+    def write(self, data: bytes):
+        self.pending += data
+        while (len(self.pending) >= ZstdFrameWriter.FrameSize):
+            self.file.write(self.compressor.compress(bytes(self.pending[:ZstdFrameWriter.FrameSize])))
+            del self.pending[:ZstdFrameWriter.FrameSize]
+
+    def close(self):
+        if self.pending:
+            self.file.write(self.compressor.compress(bytes(self.pending)))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __init__(self, path: str):
+        if (zstandard is None):
+            raise Exception("The zstandard package is required for --compression zstd")
+        self.file = open(path, "wb")
+        self.compressor = zstandard.ZstdCompressor(level=3)
+        self.pending = bytearray()
+
+
+def open_output(path: str, compression: str):
+    if (compression == "gzip"):
+        return gzip.open(path, "wb", compresslevel=6)
+    if (compression == "zstd"):
+        return ZstdFrameWriter(path)
+    return open(path, "wb")
+
+
+def pack_fields(sdna: SDNABuilder, structName: str, values: dict) -> bytes:  # values by field name, nested structures as dicts
+    data = bytearray()
+    for fieldType, fieldName in sdna.Structures[structName]:
+        size = sdna.field_size(fieldType, fieldName)
+        name = fieldName.strip("*").split("[")[0]
+        value = values.get(name)
+        if (value is None):
+            data += b"\x00" * size
+        elif fieldName.startswith("*"):
+            data += struct.pack(sdna.Prefix + ("I" if (sdna.PointerSize == 4) else "Q"), value)
+        elif isinstance(value, dict):
+            data += pack_fields(sdna, fieldType, value)
+        elif isinstance(value, bytes):
+            data += value[:size].ljust(size, b"\x00")
+        else:
+            data += struct.pack(sdna.Prefix + {"char": "b", "short": "h", "int": "i", "float": "f"}[fieldType], value)
+    return bytes(data)
+
+
+def generate(path: str, blocks: int = 2000, blockSize: int = 256, sdnaStructs: int = 900, sdnaFields: int = 12,
+             pointerSize: int = 8, endian: str = "little", packedMB: float = 0, scenes: int = 1,
+             compression: str = "none", seed: int = 0) -> dict:
+    """Writes a .blend file and returns what a correct parser has to find in it"""
+    rng = random.Random(seed)
+    noise = rng.randbytes(1024 * 1024)  # block content, not trivially compressible
+    sdna = SDNABuilder(pointerSize, endian, sdnaStructs, sdnaFields)
+    sceneNames = ["Scene"] + [f"Scene.{i:03}" for i in range(1, scenes)]
+    currentScene = sceneNames[-1]  # the last one, so a parser can't stop at the first scene
+    expected = {"SceneName": currentScene, "StartFrame": 1, "EndFrame": 250 + scenes - 1, "FrameStep": 1,
+                "ImageType": 17, "ResolutionX": 1920, "ResolutionY": 1080}
+
+    with open_output(path, compression) as file:
+        writer = BlendWriter(file, pointerSize, endian)
+        writer.write_block(b"REND", struct.pack(f"{sdna.Prefix}ii", 1, expected["EndFrame"]) + currentScene.encode("utf-8").ljust(64, b"\x00"), oldPtr=0)
+        writer.write_block(b"GLOB", b"\x00" * 128, oldPtr=0)
+
+        for index, name in enumerate(sceneNames):
+            sceneSize = sdna.Sizes["Scene"]
+            cameraPointer = writer.pointer() + ((sceneSize + 15) & ~15)  # the camera object is written right after its scene
+            scene = pack_fields(sdna, "Scene", {
+                "id": {"name": b"SC" + name.encode("utf-8")},
+                "camera": cameraPointer,
+                "r": {
+                    "im_format": {"imtype": 17},  # PNG
+                    "ffcodecdata": {"type": 2},
+                    "sfra": 1, "efra": 250 + index, "frame_step": 1, "xsch": 1920, "ysch": 1080, "size": 100,
+                    "frs_sec": 24, "frs_sec_base": 1.0, "engine": b"BLENDER_EEVEE",
+                },
+                "eevee": {"taa_render_samples": 64},
+            })
+            writer.write_block(b"SC", scene, sdna.Indices["Scene"])
+            camera = pack_fields(sdna, "Object", {"id": {"name": f"OBCamera.{index:03}".encode("utf-8")}})
+            writer.write_block(b"OB", camera, sdna.Indices["Object"])
+
+        for i in range(blocks):
+            offset = rng.randrange(len(noise) - blockSize) if (blockSize < len(noise)) else 0
+            writer.write_block(b"DATA", (noise[offset:offset + blockSize] * (blockSize // len(noise) + 1))[:blockSize])
+
+        packedBytes = int(packedMB * 1024 * 1024)
+        while (packedBytes > 0):
+            size = min(packedBytes, 16 * 1024 * 1024)
+            content = (noise * (size // len(noise) + 1))[:size]
+            dataPointer = writer.pointer() + ((sdna.Sizes["PackedFile"] + 15) & ~15)
+            writer.write_block(b"PF", pack_fields(sdna, "PackedFile", {"size": size, "data": dataPointer}), sdna.Indices["PackedFile"])
+            writer.write_block(b"DATA", content)
+            packedBytes -= size
+
+        writer.write_block(b"DNA1", sdna.build(), oldPtr=0)
+        writer.write_block(b"ENDB", b"", oldPtr=0)
+
+    expected["Blocks"] = writer.BlockCount
+    return expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic .blend file")
+    parser.add_argument("path")
+    parser.add_argument("--blocks", type=int, default=2000, help="filler DATA blocks")
+    parser.add_argument("--block-size", type=int, default=256, help="bytes per filler block")
+    parser.add_argument("--sdna-structs", type=int, default=900, help="filler structures in the SDNA")
+    parser.add_argument("--sdna-fields", type=int, default=12, help="fields per filler structure")
+    parser.add_argument("--pointer-size", type=int, choices=(4, 8), default=8)
+    parser.add_argument("--endian", choices=("little", "big"), default="little")
+    parser.add_argument("--packed-mb", type=float, default=0, help="volume of packed file data")
+    parser.add_argument("--scenes", type=int, default=1)
+    parser.add_argument("--compression", choices=("none", "gzip", "zstd"), default="none")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = generate(args.path, args.blocks, args.block_size, args.sdna_structs, args.sdna_fields, args.pointer_size,
+                      args.endian, args.packed_mb, args.scenes, args.compression, args.seed)
+    print(result)